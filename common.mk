@@ -3,6 +3,7 @@ export LINTER = flake8
 export PYLINTFLAGS = --exclude=__main__.py
 
 export CLOUD_MONGO = 0
+export MONGO_ENSURE_INDEXES = 0
 
 PYTHONFILES = $(shell ls *.py)
 PYTESTFLAGS = -vv --verbose --cov-branch --cov-report term-missing --tb=short -W ignore::FutureWarning
@@ -21,6 +22,10 @@ lint: $(patsubst %.py,%.pylint,$(PYTHONFILES))
 pytests: FORCE
 	pytest $(PYTESTFLAGS) --cov=$(PKG)
 
+# the same tests against the in-memory storage engine; no Mongo needed:
+memtests: FORCE
+	MONGO_BACKEND=memory pytest $(PYTESTFLAGS) --cov=$(PKG)
+
 # test a python file:
 %.py: FORCE
 	$(LINTER) $(PYLINTFLAGS) $@
@@ -0,0 +1,249 @@
+"""
+asyncio versions of the data/db_connect.py calls, on pymongo's
+AsyncMongoClient. They share the sync module's settings, so both
+reach the same DB with the same pool options. With MONGO_BACKEND=memory,
+the async client wraps the sync layer's in-memory engine, so the two
+layers see the same data there too.
+"""
+import os
+
+import pymongo as pm
+
+import data.db_connect as dbc
+import data.identity_map as idm
+import data.memory_db as mdb
+import data.metrics as mt
+import data.query_cache as qc
+
+GAME_DB = dbc.GAME_DB
+MONGO_ID = dbc.MONGO_ID
+convert_mongo_id = dbc.convert_mongo_id
+DuplicateKeyError = dbc.DuplicateKeyError
+
+client = None
+_client_pid = None
+
+
+def get_client():
+    """
+    Return the shared async client, creating it on first use.
+    Building it does no I/O, so this need not be awaited.
+    """
+    global client, _client_pid
+    if _client_pid is not None and _client_pid != os.getpid():
+        after_fork()
+    if client is None:
+        uri = dbc.mongo_uri()
+        if os.environ.get(dbc.BACKEND_ENV) == dbc.MEMORY:
+            client = mdb.AsyncMemoryClient(dbc.get_client())
+        elif uri:
+            client = pm.AsyncMongoClient(uri, **dbc.pool_options())
+        else:
+            client = pm.AsyncMongoClient(**dbc.pool_options())
+        _client_pid = os.getpid()
+    return client
+
+
+@dbc.register_post_fork_hook
+def after_fork():
+    """
+    Drop the client inherited from a parent process.
+    """
+    global client, _client_pid
+    client = None
+    _client_pid = None
+
+
+def get_collection(collection, db=GAME_DB):
+    return get_client()[db][collection]
+
+
+async def connect_db():
+    """
+    Connect (if we have not already) and check that the server answers.
+    Returns the client, or None if the server could not be reached.
+    """
+    try:
+        await get_client().admin.command('ping')
+        return client
+    except pm.errors.PyMongoError as e:
+        print(e)
+    return None
+
+
+@mt.timed('insert_one')
+async def create(collection, doc, db=GAME_DB):
+    """
+    Insert a single doc into collection.
+    """
+    result = await get_collection(collection, db).insert_one(doc)
+    idm.forget(db, collection)
+    qc.bump(db, collection)
+    return str(result.inserted_id)
+
+
+@mt.timed('update_one', filt_arg='filt')
+async def create_if_absent(collection, filt, doc, db=GAME_DB) -> bool:
+    """
+    Insert doc unless a doc matching filt already exists, in one round
+    trip; see db_connect.create_if_absent().
+    """
+    try:
+        result = await get_collection(collection, db).update_one(
+            filt, {'$setOnInsert': doc}, upsert=True)
+    except DuplicateKeyError:
+        return False
+    if result.upserted_id is None:
+        return False
+    idm.forget(db, collection)
+    qc.bump(db, collection)
+    return True
+
+
+@mt.timed('insert_many')
+async def create_many(collection, docs: list, db=GAME_DB,
+                      chunk_size=dbc.BULK_CHUNK_SIZE) -> list:
+    """
+    Insert many docs, one unordered round trip per chunk.
+    Returns one result per doc, as dbc.create_many() does.
+    """
+    results = []
+    for _, chunk in dbc._chunks(docs, chunk_size):
+        failed = {}
+        try:
+            await get_collection(collection, db).insert_many(chunk,
+                                                             ordered=False)
+        except pm.errors.BulkWriteError as err:
+            failed = dbc._write_errors(err)
+        for i, doc in enumerate(chunk):
+            if i in failed:
+                results.append(dbc._bulk_result(False, error=failed[i]))
+            else:
+                results.append(dbc._bulk_result(True,
+                                                id=doc.get(MONGO_ID)))
+    idm.forget(db, collection)
+    qc.bump(db, collection)
+    return results
+
+
+async def read_one(collection, filt, db=GAME_DB):
+    """
+    Find with a filter and return the first doc found.
+    Return None if not found.
+    Repeat reads within a request are served by the identity map.
+    """
+    doc = idm.get(db, collection, filt)
+    if doc is not idm.MISS:
+        return doc
+    doc = await _find_one(collection, filt, db)
+    idm.put(db, collection, filt, doc)
+    return doc
+
+
+@mt.timed('find_one', filt_arg='filt')
+async def _find_one(collection, filt, db=GAME_DB):
+    doc = await get_collection(collection, db).find_one(filt)
+    if doc is not None:
+        convert_mongo_id(doc)
+    return doc
+
+
+@mt.timed('delete_one', filt_arg='filt')
+async def delete(collection, filt, db=GAME_DB):
+    """
+    Delete the first doc matching the filter.
+    Returns the number of docs deleted.
+    """
+    del_result = await get_collection(collection, db).delete_one(filt)
+    idm.delete(db, collection, filt)
+    qc.bump(db, collection)
+    return del_result.deleted_count
+
+
+@mt.timed('update_one', filt_arg='filters')
+async def update(collection, filters, update_dict, db=GAME_DB):
+    """
+    `$set` the fields in update_dict on the first doc matching filters.
+    Returns the UpdateResult from MongoDB.
+    """
+    result = await get_collection(collection, db).update_one(
+        filters, {'$set': update_dict})
+    idm.apply_update(db, collection, filters, update_dict)
+    qc.bump(db, collection)
+    return result
+
+
+@mt.timed('update_one', filt_arg='filt')
+async def update_ops(collection, filt, update, db=GAME_DB):
+    """
+    Apply a Mongo update document to the first doc matching filt; see
+    db_connect.update_ops().
+    Returns the UpdateResult from MongoDB.
+    """
+    result = await get_collection(collection, db).update_one(filt, update)
+    idm.forget(db, collection)
+    qc.bump(db, collection)
+    return result
+
+
+@mt.timed('find_one_and_update', filt_arg='filt')
+async def find_and_update(collection, filt, update, projection=None,
+                          db=GAME_DB, no_id=True):
+    """
+    Update the first doc matching filt and return it as it is after the
+    update, or None if nothing matched; see db_connect.find_and_update().
+    """
+    if no_id:
+        projection = dict(projection or {})
+        projection[MONGO_ID] = 0
+    doc = await get_collection(collection, db).find_one_and_update(
+        filt, update, projection=projection,
+        return_document=pm.ReturnDocument.AFTER)
+    if doc is not None:
+        idm.forget(db, collection)
+        qc.bump(db, collection)
+        convert_mongo_id(doc)
+    return doc
+
+
+@mt.timed('find', filt_arg='filt')
+async def query(collection, filt=None, projection=None, sort=None, skip=0,
+                limit=0, batch_size=None, db=GAME_DB, no_id=True) -> list:
+    """
+    Run a filtered find on the server side.
+    Takes the same arguments as dbc.query().
+    """
+    if no_id:
+        projection = dict(projection or {})
+        projection[MONGO_ID] = 0
+    cursor = get_collection(collection, db).find(filt or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    if skip:
+        cursor = cursor.skip(skip)
+    if limit:
+        cursor = cursor.limit(limit)
+    if batch_size:
+        cursor = cursor.batch_size(batch_size)
+    ret = []
+    async for doc in cursor:
+        if not no_id:
+            convert_mongo_id(doc)
+        ret.append(doc)
+    return ret
+
+
+async def read(collection, db=GAME_DB, no_id=True) -> list:
+    """
+    Return all documents in the collection as a list.
+    """
+    return await query(collection, db=db, no_id=no_id)
+
+
+async def read_dict(collection, key, db=GAME_DB, no_id=True) -> dict:
+    """
+    Return all documents in the collection as a dictionary,
+    keyed by a specific field.
+    """
+    recs = await read(collection, db=db, no_id=no_id)
+    return {rec[key]: rec for rec in recs}
@@ -0,0 +1,109 @@
+"""
+asyncio versions of the data/manuscripts.py calls.
+"""
+import data.aio.db_connect as adbc
+import data.manuscripts as manu
+import data.manus.fields as flds
+import data.manus.ids as ids
+import data.manus.query as query
+
+MANU_COLLECT = manu.MANU_COLLECT
+MANU_ID = manu.MANU_ID
+CURR_STATE = manu.CURR_STATE
+AUTHOR = manu.AUTHOR
+TITLE = manu.TITLE
+
+
+async def generate_id() -> str:
+    """
+    Generates a manuscript ID; see manuscripts.generate_id().
+    """
+    return ids.new_id()
+
+
+async def create_manuscript(title: str, author: str) -> str:
+    """
+    Creates a new manuscript; returns its ID.
+    A colliding ID fails on the unique index and is redrawn.
+    """
+    manuscript = manu.new_manuscript(title, author)
+    for _ in range(ids.MAX_TRIES):
+        manuscript[MANU_ID] = await generate_id()
+        try:
+            if await adbc.create(MANU_COLLECT, manuscript) is None:
+                raise ValueError("Failed to create manuscript")
+            return manuscript[MANU_ID]
+        except adbc.DuplicateKeyError:
+            ids.note_collision()
+    raise ids.IdSpaceExhausted(f'{ids.MAX_TRIES} ID collisions in a row')
+
+
+async def read_one(manu_id: str) -> dict:
+    return await adbc.read_one(MANU_COLLECT, {MANU_ID: manu_id})
+
+
+async def read() -> list:
+    return await adbc.query(MANU_COLLECT, no_id=False)
+
+
+async def get_manuscript(author: str) -> list:
+    """
+    Returns the manuscripts by this author.
+    """
+    return await adbc.query(MANU_COLLECT, {AUTHOR: author}, no_id=False)
+
+
+async def filter_manuscripts_by_state(state: str) -> list:
+    """
+    Returns the manuscripts in this state.
+    """
+    if state not in query.VALID_STATES:
+        raise ValueError(f"Valid states: {query.VALID_STATES}")
+    return await adbc.query(MANU_COLLECT, {CURR_STATE: state}, no_id=False)
+
+
+async def update_manuscript(manu_id: str, updates: dict):
+    return await adbc.update(MANU_COLLECT, {MANU_ID: manu_id}, updates)
+
+
+async def delete_manuscript(manu_id: str):
+    return await adbc.delete(MANU_COLLECT, {MANU_ID: manu_id})
+
+
+async def handle_action(manu_id, curr_state, action, version=None,
+                        **kwargs) -> str:
+    """
+    Handle an action on a manuscript in one round trip; see
+    manuscripts.handle_action().
+    """
+    for extra, update in manu.action_updates(curr_state, action, **kwargs):
+        filt = manu.transition_filter(manu_id, curr_state, version, extra)
+        manus = await adbc.find_and_update(MANU_COLLECT, filt,
+                                           manu.bump_version(update))
+        if manus is not None:
+            break
+    else:
+        manu.check_transition_miss(await read_one(manu_id), manu_id,
+                                   curr_state, version, **kwargs)
+    return manus[CURR_STATE]
+
+
+async def set_referee_report(manu_id: str, ref: str, report: str = None,
+                             verdict: str = None) -> bool:
+    """
+    Record a referee's report and/or verdict on a manuscript; see
+    manuscripts.set_referee_report().
+    """
+    fields = manu._report_fields(report, verdict)
+    if not fields:
+        return True
+    set_write, push_write = manu.referee_report_writes(manu_id, ref, fields)
+    for _ in range(2):
+        if (await adbc.update_ops(MANU_COLLECT, *set_write)).matched_count:
+            return True
+        if (await adbc.update_ops(MANU_COLLECT, *push_write)).matched_count:
+            return True
+        if not await adbc.read_one(MANU_COLLECT, {MANU_ID: manu_id,
+                                                  flds.REFEREES: ref}):
+            break
+    raise ValueError(f'{ref} is not a referee of {manu_id}')
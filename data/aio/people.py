@@ -0,0 +1,132 @@
+"""
+asyncio versions of the data/people.py calls.
+Validation is shared with the sync module; only the DB I/O differs.
+"""
+import asyncio
+
+import data.aio.db_connect as adbc
+import data.cascade as cascade
+import data.people as ppl
+import data.roles as rls
+import security.passwords as pw
+
+PEOPLE_COLLECT = ppl.PEOPLE_COLLECT
+EMAIL = ppl.EMAIL
+
+
+async def read() -> dict:
+    """
+    Returns a dictionary of people keyed by email.
+    """
+    return await adbc.read_dict(PEOPLE_COLLECT, EMAIL)
+
+
+async def read_one(email: str) -> dict:
+    """
+    Return a person record if email present in DB,
+    else None.
+    """
+    return await adbc.read_one(PEOPLE_COLLECT, {EMAIL: email})
+
+
+async def exists(email: str) -> bool:
+    return await read_one(email) is not None
+
+
+async def read_name(email: str) -> str:
+    person = await adbc.query(PEOPLE_COLLECT, {EMAIL: email},
+                              projection={ppl.NAME: 1}, limit=1)
+    if not person:
+        return None
+    return person[0].get(ppl.NAME)
+
+
+async def create(name: str, affiliation: str, email: str, roles: list,
+                 password: str = None, is_manu_author: bool = False) -> str:
+    """
+    Creates a new person; see people.create().
+    Returns the email used as the key.
+    """
+    if password or not is_manu_author:
+        if await read_one(email) is not None:
+            return email
+    if not is_manu_author and not password:
+        raise ValueError("Password is required for non-manuscript users")
+    if ppl.is_valid_person(email, roles=roles):
+        person = {
+            ppl.NAME: name,
+            ppl.AFFILIATION: affiliation,
+            EMAIL: email,
+            ppl.ROLES: roles
+        }
+        if password:
+            # hashing is CPU bound: keep it off the event loop
+            person[ppl.PASSWORD] = await asyncio.wrap_future(
+                pw.submit_hash(password))
+        await adbc.create_if_absent(PEOPLE_COLLECT, {EMAIL: email}, person)
+        return email
+    return None
+
+
+async def update(curr_email: str, name: str, affil: str, email: str,
+                 roles: list):
+    """
+    Updates a person's name, affiliation, roles, or email.
+    """
+    if ppl.is_valid_person(curr_email, roles=roles):
+        update_data = {
+            ppl.NAME: name,
+            ppl.AFFILIATION: affil,
+            EMAIL: email,
+            ppl.ROLES: roles
+        }
+        try:
+            result = await adbc.update(PEOPLE_COLLECT, {EMAIL: curr_email},
+                                       update_data)
+        except adbc.DuplicateKeyError:
+            raise ValueError(f'Email already in use: {email=}')
+        if result.matched_count == 0:
+            raise ValueError(
+                f'Trying to update person that does not exist: '
+                f'{curr_email=}'
+            )
+        # the cascade's bulk writes go through the sync client
+        await asyncio.to_thread(cascade.rename, curr_email, email)
+        return email
+
+
+async def delete(email: str):
+    """
+    Deletes the person with this email.
+    Returns the number of people deleted.
+    """
+    deleted = await adbc.delete(PEOPLE_COLLECT, {EMAIL: email})
+    if not deleted:
+        raise ValueError(f"Person does not exist: {email=}")
+    await asyncio.to_thread(cascade.remove, email)
+    return deleted
+
+
+async def authenticate(email: str, password: str) -> dict:
+    """
+    Authenticate a person with email and password
+    Returns None if authentication fails
+    """
+    person = await read_one(email)
+    if not person or not person.get(ppl.PASSWORD):
+        return None
+    stored = person[ppl.PASSWORD]
+    if not await asyncio.wrap_future(pw.submit_verify(stored, password)):
+        return None
+    if pw.needs_rehash(stored):
+        await asyncio.to_thread(ppl.rehash, email, stored, password)
+    return person
+
+
+async def get_referees() -> list:
+    """
+    Returns a list of referee emails.
+    """
+    referees = await adbc.query(PEOPLE_COLLECT, {ppl.ROLES: rls.RE_CODE},
+                                projection={EMAIL: 1})
+    return [person.get(EMAIL) for person in referees]
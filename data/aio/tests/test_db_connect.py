@@ -0,0 +1,165 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import data.aio.db_connect as adbc
+import data.db_connect as dbc
+import data.memory_db as mdb
+import data.metrics as mt
+
+TEST_COLLECTION = "test_collection"
+TEST_DB = "gamesDB"
+TEST_DOC = {"_id": "123", "name": "test"}
+TEST_FILTER = {"_id": "123"}
+TEST_UPDATE = {"name": "updated_name"}
+
+
+class FakeCursor:
+    """
+    Stands in for an AsyncCursor: chainable, and iterable with async for.
+    """
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = {}
+
+    def __getattr__(self, name):
+        def chain(arg):
+            self.calls[name] = arg
+            return self
+        return chain
+
+    def __aiter__(self):
+        self._it = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def mock_collection(mock_client):
+    coll = MagicMock()
+    mock_client.__getitem__.return_value.__getitem__.return_value = coll
+    return coll
+
+
+@patch("data.aio.db_connect.client", new_callable=MagicMock)
+def test_create(mock_client):
+    coll = mock_collection(mock_client)
+    coll.insert_one = AsyncMock(return_value=MagicMock(inserted_id="abc"))
+    ret = asyncio.run(adbc.create(TEST_COLLECTION, TEST_DOC, db=TEST_DB))
+    coll.insert_one.assert_awaited_once_with(TEST_DOC)
+    assert ret == "abc"
+
+
+@patch("data.aio.db_connect.client", new_callable=MagicMock)
+def test_read_one(mock_client):
+    coll = mock_collection(mock_client)
+    coll.find_one = AsyncMock(return_value=dict(TEST_DOC))
+    doc = asyncio.run(adbc.read_one(TEST_COLLECTION, TEST_FILTER))
+    coll.find_one.assert_awaited_once_with(TEST_FILTER)
+    assert doc["name"] == "test"
+
+
+@patch("data.aio.db_connect.client", new_callable=MagicMock)
+def test_read_one_not_there(mock_client):
+    coll = mock_collection(mock_client)
+    coll.find_one = AsyncMock(return_value=None)
+    assert asyncio.run(adbc.read_one(TEST_COLLECTION, TEST_FILTER)) is None
+
+
+@patch("data.aio.db_connect.client", new_callable=MagicMock)
+def test_update(mock_client):
+    coll = mock_collection(mock_client)
+    coll.update_one = AsyncMock()
+    asyncio.run(adbc.update(TEST_COLLECTION, TEST_FILTER, TEST_UPDATE))
+    coll.update_one.assert_awaited_once_with(TEST_FILTER,
+                                             {"$set": TEST_UPDATE})
+
+
+@patch("data.aio.db_connect.client", new_callable=MagicMock)
+def test_delete(mock_client):
+    coll = mock_collection(mock_client)
+    coll.delete_one = AsyncMock(return_value=MagicMock(deleted_count=1))
+    assert asyncio.run(adbc.delete(TEST_COLLECTION, TEST_FILTER)) == 1
+
+
+@patch("data.aio.db_connect.client", new_callable=MagicMock)
+def test_query(mock_client):
+    coll = mock_collection(mock_client)
+    cursor = FakeCursor([{"name": "test"}])
+    coll.find = MagicMock(return_value=cursor)
+    result = asyncio.run(adbc.query(TEST_COLLECTION, {"name": "test"},
+                                    sort=[("name", 1)], limit=5))
+    coll.find.assert_called_once_with({"name": "test"}, {"_id": 0})
+    assert cursor.calls == {"sort": [("name", 1)], "limit": 5}
+    assert result == [{"name": "test"}]
+
+
+@patch("data.aio.db_connect.client", new_callable=MagicMock)
+def test_read_dict(mock_client):
+    coll = mock_collection(mock_client)
+    coll.find = MagicMock(return_value=FakeCursor([dict(TEST_DOC)]))
+    result = asyncio.run(adbc.read_dict(TEST_COLLECTION, "name",
+                                        no_id=False))
+    assert result["test"]["_id"] == "123"
+
+
+@patch("data.aio.db_connect.client", new_callable=MagicMock)
+def test_writes_invalidate_query_cache(mock_client):
+    """
+    A cached sync read sees each async write at once, not after the TTL.
+    """
+    with patch("data.db_connect.client", mdb.MemoryClient()):
+        mem_coll = dbc.get_collection(TEST_COLLECTION)
+        coll = mock_collection(mock_client)
+        for method in ("insert_one", "update_one", "delete_one",
+                       "find_one_and_update"):
+            setattr(coll, method,
+                    AsyncMock(side_effect=getattr(mem_coll, method)))
+
+        def cached():
+            return dbc.query(TEST_COLLECTION, cached=True)
+
+        assert cached() == []
+        asyncio.run(adbc.create(TEST_COLLECTION, {"name": "a"}))
+        assert cached() == [{"name": "a"}]
+        asyncio.run(adbc.update(TEST_COLLECTION, {"name": "a"},
+                                {"name": "b"}))
+        assert cached() == [{"name": "b"}]
+        asyncio.run(adbc.find_and_update(TEST_COLLECTION, {"name": "b"},
+                                         {"$set": {"n": 1}}))
+        assert cached() == [{"name": "b", "n": 1}]
+        asyncio.run(adbc.create_if_absent(TEST_COLLECTION, {"name": "c"},
+                                          {"name": "c"}))
+        assert len(cached()) == 2
+        asyncio.run(adbc.delete(TEST_COLLECTION, {"name": "b"}))
+        assert cached() == [{"name": "c"}]
+
+
+def test_memory_backend_shares_sync_data():
+    mem = mdb.MemoryClient()
+    with patch.dict("os.environ", {dbc.BACKEND_ENV: dbc.MEMORY}), \
+            patch("data.db_connect.client", mem), \
+            patch("data.aio.db_connect.client", None):
+        assert isinstance(adbc.get_client(), mdb.AsyncMemoryClient)
+        asyncio.run(adbc.create(TEST_COLLECTION, {"name": "async"}))
+        assert dbc.query(TEST_COLLECTION) == [{"name": "async"}]
+        assert asyncio.run(adbc.read_one(TEST_COLLECTION,
+                                         {"name": "async"}))["name"] \
+            == "async"
+        assert asyncio.run(adbc.connect_db()) is adbc.client
+
+
+@patch("data.aio.db_connect.client", new_callable=MagicMock)
+def test_calls_are_timed(mock_client):
+    mt.reset()
+    coll = mock_collection(mock_client)
+    coll.find_one = AsyncMock(return_value=dict(TEST_DOC))
+    coll.find = MagicMock(return_value=FakeCursor([{"name": "test"}]))
+    asyncio.run(adbc.read_one(TEST_COLLECTION, TEST_FILTER))
+    asyncio.run(adbc.query(TEST_COLLECTION, {"name": "test"}))
+    ops = mt.get_stats()["ops"]
+    assert ops[f"{TEST_COLLECTION}.find_one"][mt.CALLS] == 1
+    assert ops[f"{TEST_COLLECTION}.find"][mt.DOCS] == 1
@@ -0,0 +1,126 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+import data.aio.manuscripts as amanu
+import data.manus.fields as flds
+import data.manus.query as query
+import data.memory_db as mdb
+
+
+@patch("data.aio.manuscripts.adbc.query", new_callable=AsyncMock,
+       return_value=[])
+def test_filter_manuscripts_by_state(mock_query):
+    asyncio.run(amanu.filter_manuscripts_by_state(query.SUBMITTED))
+    mock_query.assert_awaited_once_with(amanu.MANU_COLLECT,
+                                        {amanu.CURR_STATE: query.SUBMITTED},
+                                        no_id=False)
+
+
+def test_filter_manuscripts_by_invalid_state():
+    with pytest.raises(ValueError):
+        asyncio.run(amanu.filter_manuscripts_by_state('INVALID_STATE'))
+
+
+@patch("data.aio.manuscripts.adbc.create", new_callable=AsyncMock,
+       return_value="123")
+def test_create_manuscript(mock_create):
+    manu_id = asyncio.run(amanu.create_manuscript("Title", "a@nyu.edu"))
+    doc = mock_create.await_args.args[1]
+    assert doc[amanu.MANU_ID] == manu_id
+    assert doc[amanu.CURR_STATE] == query.SUBMITTED
+
+
+@patch("data.aio.manuscripts.adbc.create", new_callable=AsyncMock)
+def test_create_manuscript_collision(mock_create):
+    mock_create.side_effect = [amanu.adbc.DuplicateKeyError("E11000"), "123"]
+    manu_id = asyncio.run(amanu.create_manuscript("Title", "a@nyu.edu"))
+    assert mock_create.await_count == 2
+    assert mock_create.await_args.args[1][amanu.MANU_ID] == manu_id
+
+
+@patch("data.aio.manuscripts.adbc.find_and_update", new_callable=AsyncMock,
+       return_value={amanu.MANU_ID: "m1", amanu.CURR_STATE: query.REJECTED})
+def test_handle_action(mock_update):
+    new_state = asyncio.run(amanu.handle_action("m1", query.SUBMITTED,
+                                                query.REJECT, version=2))
+    assert new_state == query.REJECTED
+    filt = mock_update.await_args.args[1]
+    assert filt == {amanu.MANU_ID: "m1", amanu.CURR_STATE: query.SUBMITTED,
+                    amanu.manu.VERSION: 2}
+
+
+@patch("data.aio.manuscripts.adbc.read_one", new_callable=AsyncMock,
+       return_value={amanu.MANU_ID: "m1", amanu.CURR_STATE: query.REJECTED})
+@patch("data.aio.manuscripts.adbc.find_and_update", new_callable=AsyncMock,
+       return_value=None)
+def test_handle_action_stale(mock_update, mock_read_one):
+    with pytest.raises(amanu.manu.StaleStateError):
+        asyncio.run(amanu.handle_action("m1", query.SUBMITTED, query.REJECT))
+
+
+def sync_actions(manu_id, actions):
+    with patch("data.db_connect.client", mdb.MemoryClient()):
+        amanu.manu.dbc.create(amanu.MANU_COLLECT,
+                              dict(amanu.manu.new_manuscript("T", "a@x"),
+                                   **{amanu.MANU_ID: manu_id}))
+        for curr_state, action, kwargs in actions:
+            amanu.manu.handle_action(manu_id, curr_state, action, **kwargs)
+        return amanu.manu.read_one(manu_id)
+
+
+def async_actions(manu_id, actions):
+    async def run():
+        await amanu.adbc.create(amanu.MANU_COLLECT,
+                                dict(amanu.manu.new_manuscript("T", "a@x"),
+                                     **{amanu.MANU_ID: manu_id}))
+        for curr_state, action, kwargs in actions:
+            await amanu.handle_action(manu_id, curr_state, action, **kwargs)
+        return await amanu.read_one(manu_id)
+
+    with patch("data.aio.db_connect.client", mdb.AsyncMemoryClient()):
+        return asyncio.run(run())
+
+
+def test_handle_action_parity():
+    """
+    The two layers store the same manuscript for the same actions,
+    referee reports included.
+    """
+    actions = [
+        (query.SUBMITTED, query.ASSIGN_REF,
+         {"ref": "r1@nyu.edu", "extra": {flds.REPORT: "Fine.",
+                                         flds.VERDICT: amanu.manu.ACCEPT}}),
+        (query.IN_REF_REV, query.ASSIGN_REF,
+         {"ref": "r2@nyu.edu", "extra": {flds.REPORT: "Hmm."}}),
+        (query.IN_REF_REV, query.ASSIGN_REF,
+         {"ref": "r2@nyu.edu", "extra": {flds.VERDICT: amanu.manu.REJECT}}),
+    ]
+    synced = sync_actions("m1", actions)
+    awaited = async_actions("m1", actions)
+    synced.pop(amanu.adbc.MONGO_ID)
+    awaited.pop(amanu.adbc.MONGO_ID)
+    assert awaited == synced
+    assert awaited[flds.REFEREE_REPORTS] == [
+        {flds.REFEREE: "r1@nyu.edu", flds.REPORT: "Fine.",
+         flds.VERDICT: amanu.manu.ACCEPT},
+        {flds.REFEREE: "r2@nyu.edu", flds.REPORT: "Hmm.",
+         flds.VERDICT: amanu.manu.REJECT},
+    ]
+
+
+def test_set_referee_report_not_a_referee():
+    async def run():
+        await amanu.adbc.create(amanu.MANU_COLLECT,
+                                dict(amanu.manu.new_manuscript("T", "a@x"),
+                                     **{amanu.MANU_ID: "m1",
+                                        flds.REFEREES: ["r1@nyu.edu"]}))
+        assert await amanu.set_referee_report("m1", "r1@nyu.edu",
+                                              report="x")
+        with pytest.raises(ValueError):
+            await amanu.set_referee_report("m1", "nobody@nyu.edu",
+                                           report="x")
+
+    with patch("data.aio.db_connect.client", mdb.AsyncMemoryClient()):
+        asyncio.run(run())
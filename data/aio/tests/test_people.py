@@ -0,0 +1,70 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+import data.aio.people as appl
+
+TEST_EMAIL = "async@nyu.edu"
+
+
+@patch("data.aio.people.adbc.read_one", new_callable=AsyncMock,
+       return_value=None)
+@patch("data.aio.people.adbc.create_if_absent", new_callable=AsyncMock,
+       return_value=True)
+def test_create(mock_create, mock_read_one):
+    ret = asyncio.run(appl.create("Async", "NYU", TEST_EMAIL, ["AU"],
+                                  password="pw"))
+    assert ret == TEST_EMAIL
+    person = mock_create.await_args.args[2]
+    assert person[appl.ppl.PASSWORD] != "pw"
+
+
+@patch("data.aio.people.adbc.read_one", new_callable=AsyncMock,
+       return_value={appl.EMAIL: TEST_EMAIL})
+@patch("data.aio.people.adbc.create_if_absent", new_callable=AsyncMock)
+def test_create_taken(mock_create, mock_read_one):
+    with patch("data.aio.people.pw.submit_hash") as submit_hash:
+        assert asyncio.run(appl.create("Async", "NYU", TEST_EMAIL, ["AU"],
+                                       password="pw")) == TEST_EMAIL
+        assert asyncio.run(appl.create("Async", "NYU", TEST_EMAIL,
+                                       ["AU"])) == TEST_EMAIL
+    submit_hash.assert_not_called()
+    mock_create.assert_not_awaited()
+
+
+@patch("data.aio.people.adbc.delete", new_callable=AsyncMock, return_value=0)
+def test_delete_missing(mock_delete):
+    with pytest.raises(ValueError):
+        asyncio.run(appl.delete(TEST_EMAIL))
+
+
+@patch("data.aio.people.adbc.query", new_callable=AsyncMock,
+       return_value=[{appl.EMAIL: TEST_EMAIL}])
+def test_get_referees(mock_query):
+    assert asyncio.run(appl.get_referees()) == [TEST_EMAIL]
+
+
+def test_lookups_overlap():
+    """
+    Independent lookups can run at the same time under gather().
+    """
+    in_flight = 0
+    peak = 0
+
+    async def slow_read_one(collection, filt):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return {appl.EMAIL: filt[appl.EMAIL]}
+
+    async def lookups():
+        return await asyncio.gather(*(appl.read_one(f"p{i}@nyu.edu")
+                                      for i in range(5)))
+
+    with patch("data.aio.people.adbc.read_one", side_effect=slow_read_one):
+        people = asyncio.run(lookups())
+    assert len(people) == 5
+    assert peak == 5
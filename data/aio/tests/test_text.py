@@ -0,0 +1,16 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import data.aio.text as atxt
+
+
+@patch("data.aio.text.adbc.create_if_absent", new_callable=AsyncMock,
+       return_value=False)
+def test_create_existing(mock_create):
+    assert asyncio.run(atxt.create("Home", "Title", "Text")) == "Home"
+    mock_create.assert_awaited_once()
+
+
+@patch("data.aio.text.adbc.delete", new_callable=AsyncMock, return_value=0)
+def test_delete_missing(mock_delete):
+    assert asyncio.run(atxt.delete("Nope")) is False
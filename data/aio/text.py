@@ -0,0 +1,57 @@
+"""
+asyncio versions of the data/text.py calls.
+"""
+import data.aio.db_connect as adbc
+import data.text as txt
+
+KEY = txt.KEY
+TITLE = txt.TITLE
+TEXT = txt.TEXT
+TEXT_COLLECT = txt.TEXT_COLLECT
+
+
+async def read() -> dict:
+    """
+    Returns a dictionary of text pages keyed on their key.
+    """
+    return await adbc.read_dict(TEXT_COLLECT, KEY)
+
+
+async def read_one(key: str) -> dict:
+    """
+    Returns the page for the given key, or None.
+    """
+    return await adbc.read_one(TEXT_COLLECT, {KEY: key})
+
+
+async def create(key: str, title: str, text: str) -> str:
+    """
+    Creates text; returns the key, whether it was new or not.
+    """
+    txt_rec = {KEY: key, TITLE: title, TEXT: text}
+    await adbc.create_if_absent(TEXT_COLLECT, {KEY: key}, txt_rec)
+    return key
+
+
+async def update(key: str, title: str = None, text: str = None) -> str:
+    """
+    Updates the title and text for key.
+    """
+    result = await adbc.update(TEXT_COLLECT, {KEY: key},
+                               {KEY: key, TITLE: title, TEXT: text})
+    if result.matched_count == 0:
+        raise ValueError(
+            f'Trying to update text that does not exist: '
+            f'{key=}'
+        )
+    return key
+
+
+async def delete(key: str):
+    """
+    Deletes text; returns False if there was no such key.
+    """
+    deleted = await adbc.delete(TEXT_COLLECT, {KEY: key})
+    if not deleted:
+        return False
+    return deleted
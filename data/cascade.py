@@ -0,0 +1,135 @@
+"""
+Keeps references to a person's email in step when the email changes
+or the person is deleted.
+A manuscript refers to people by email in its author, its referees
+and the referee of each of its referee reports. Each kind of reference
+is fixed by one server-side update_many, so a rename or a delete costs
+a few bulk writes, however many manuscripts it touches.
+Every step's update makes a doc stop matching the step's filter, so a
+step can also run in chunks: take the manu_ids of the next chunk_size
+matching docs and update just those, until none are left. That keeps
+each write small on a huge collection and lets the caller watch
+progress.
+"""
+import os
+
+import data.db_connect as dbc
+import data.manuscripts as manu
+import data.manus.fields as flds
+import data.manus.query as query
+
+# docs per update_many when chunking; 0 runs each step as one write
+CHUNK_SIZE = int(os.environ.get('CASCADE_CHUNK_SIZE', '0'))
+
+# step names
+AUTHOR = 'author'
+REFEREES = 'referees'
+REFEREE_REPORTS = 'referee_reports'
+LAST_REFEREE = 'last_referee'
+
+REPORT_REFEREE = f'{flds.REFEREE_REPORTS}.{flds.REFEREE}'
+
+
+def rename_steps(old_email: str, new_email: str) -> list:
+    """
+    Return (name, collection, filter, update) for each write that moves
+    references from old_email to new_email.
+    Referees are a set, so each manuscript holds old_email at most once
+    per array, and the positional $ finds it.
+    """
+    return [
+        (AUTHOR, manu.MANU_COLLECT, {manu.AUTHOR: old_email},
+         {'$set': {manu.AUTHOR: new_email}}),
+        (REFEREES, manu.MANU_COLLECT, {flds.REFEREES: old_email},
+         {'$set': {f'{flds.REFEREES}.$': new_email}}),
+        (REFEREE_REPORTS, manu.MANU_COLLECT, {REPORT_REFEREE: old_email},
+         {'$set': {f'{flds.REFEREE_REPORTS}.$.{flds.REFEREE}': new_email}}),
+    ]
+
+
+def delete_steps(email: str) -> list:
+    """
+    Return (name, collection, filter, update) for each write that drops
+    references to email.
+    A manuscript in referee review goes back to submitted when it loses
+    its last referee, just as the DELETE_REF action would do it.
+    Authored manuscripts are kept, with no author.
+    """
+    steps = []
+    for extra, update in query.transition_updates(
+            query.IN_REF_REV, query.DELETE_REF, ref=email):
+        sets_state = update['$set'][flds.CURR_STATE]
+        name = LAST_REFEREE if sets_state == query.SUBMITTED else REFEREES
+        filt = dict(extra, **{manu.CURR_STATE: query.IN_REF_REV})
+        steps.append((name, manu.MANU_COLLECT, filt, update))
+    steps += [
+        (REFEREE_REPORTS, manu.MANU_COLLECT,
+         {'$or': [{flds.REFEREES: email}, {REPORT_REFEREE: email}]},
+         {'$pull': {flds.REFEREES: email,
+                    flds.REFEREE_REPORTS: {flds.REFEREE: email}}}),
+        (AUTHOR, manu.MANU_COLLECT, {manu.AUTHOR: email},
+         {'$unset': {manu.AUTHOR: ''}}),
+    ]
+    return steps
+
+
+def _run_step(collection, filt, update, chunk_size, progress, name) -> int:
+    if not chunk_size:
+        done = dbc.update_many(collection, filt, update)
+        if progress:
+            progress(name, done)
+        return done
+    done = 0
+    while True:
+        ids = [doc[manu.MANU_ID] for doc in dbc.query(
+            collection, filt, projection={manu.MANU_ID: 1},
+            limit=chunk_size)]
+        if not ids:
+            return done
+        done += dbc.update_many(
+            collection, {'$and': [filt, {manu.MANU_ID: {'$in': ids}}]},
+            update)
+        if progress:
+            progress(name, done)
+        if len(ids) < chunk_size:
+            return done
+
+
+def run(steps: list, chunk_size: int = None, progress=None) -> dict:
+    """
+    Run cascade steps in order. Each write also bumps the version of
+    the manuscripts it touches, so an action based on an older read of
+    one of them fails as stale.
+    Args:
+        steps: as returned by rename_steps() or delete_steps()
+        chunk_size: docs per write (default CHUNK_SIZE; 0 for one write
+                    per step)
+        progress: called as progress(step name, docs done so far)
+    Returns:
+        dict: docs modified, by step name
+    """
+    if chunk_size is None:
+        chunk_size = CHUNK_SIZE
+    report = {}
+    for name, collection, filt, update in steps:
+        update = manu.bump_version(update)
+        report[name] = report.get(name, 0) + _run_step(
+            collection, filt, update, chunk_size, progress, name)
+    return report
+
+
+def rename(old_email: str, new_email: str, chunk_size: int = None,
+           progress=None) -> dict:
+    """
+    Point every reference to old_email at new_email.
+    """
+    if old_email == new_email:
+        return {}
+    return run(rename_steps(old_email, new_email), chunk_size, progress)
+
+
+def remove(email: str, chunk_size: int = None, progress=None) -> dict:
+    """
+    Drop every reference to email.
+    """
+    return run(delete_steps(email), chunk_size, progress)
@@ -1,52 +1,203 @@
 import os
+import threading
 
 import pymongo as pm
 
+import data.identity_map as idm
+import data.memory_db as mdb
+import data.metrics as mt
+import data.query_cache as qc
+
 LOCAL = "0"
 CLOUD = "1"
 
 GAME_DB = 'gamesDB'
 
+# raised when a write would break a unique index
+DuplicateKeyError = pm.errors.DuplicateKeyError
+
 client = None
+_client_lock = threading.Lock()
+# the PID that built `client`: a different PID means we are in a fork
+_client_pid = None
+_post_fork_hooks = []
+
+# env var: (pymongo option, default)
+POOL_SETTINGS = {
+    'MONGO_MAX_POOL_SIZE': ('maxPoolSize', '10'),
+    'MONGO_MIN_POOL_SIZE': ('minPoolSize', '1'),
+    'MONGO_MAX_IDLE_MS': ('maxIdleTimeMS', '300000'),
+    'MONGO_SERVER_SELECTION_MS': ('serverSelectionTimeoutMS', '5000'),
+}
+# e.g. 'zstd,snappy,zlib'; zstd and snappy need their own packages
+COMPRESSORS_ENV = 'MONGO_COMPRESSORS'
+WARM_POOL_ENV = 'MONGO_WARM_POOL'
+# 'mongo' (the default) or 'memory' for the in-process engine
+BACKEND_ENV = 'MONGO_BACKEND'
+MEMORY = 'memory'
 
 MONGO_ID = '_id'
 
+BULK_CHUNK_SIZE = 1000
 
-def connect_db():
+# bulk operation fields
+OP = 'op'
+FILTER = 'filter'
+DOC = 'doc'
+
+# bulk operation types
+INSERT = 'insert'
+UPDATE = 'update'
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+# query cache key tags
+QUERY = 'query'
+READ_DICT = 'read_dict'
+
+# bulk result fields
+OK = 'ok'
+ID = 'id'
+ERROR = 'error'
+
+
+def pool_options() -> dict:
     """
-    This provides a uniform way to connect to the DB across all uses.
-    Returns a mongo client object... maybe we shouldn't?
-    Also set global client variable.
-    We should probably either return a client OR set a
-    client global.
-    """
-    global client
-    if client is None:  # not connected yet!
-        print("Setting client because it is None.")
-        if os.environ.get("CLOUD_MONGO", LOCAL) == CLOUD:
-            username = os.environ.get("GAME_MONGO_USER")
-            # username = 'zcd'
-            password = os.environ.get("GAME_MONGO_PW")
-            # password = 'swefall24'
-            cluster_url = os.environ.get("GAME_MONGO_URL")
-            # cluster_url = 'swe24.8te4n.mongodb.net'
-            if not username or not password or not cluster_url:
-                raise ValueError('You must set your credentials '
-                                 + 'to use Mongo in the cloud.')
-            print("Connecting to Mongo in the cloud.")
-            client = pm.MongoClient(f'mongodb+srv://{username}:{password}'
-                                    + f'@{cluster_url}'
-                                    + '/gamesDB?retryWrites=true&w=majority')
-        else:
-            print("Connecting to Mongo locally.")
-            client = pm.MongoClient()
-        try:
-            client.admin.command('ping')
-            print("Pinged your deployment. You successfully connected!")
-            return client
-        except Exception as e:
-            print(e)
+    Read the connection pool settings from the environment.
+    Settings that are not set are left to pymongo's defaults,
+    except for the defaults given in POOL_SETTINGS.
+    """
+    opts = {}
+    for env_var, (opt, default) in POOL_SETTINGS.items():
+        val = os.environ.get(env_var, default)
+        if val is not None and val != '':
+            opts[opt] = int(val)
+    compressors = os.environ.get(COMPRESSORS_ENV)
+    if compressors:
+        opts['compressors'] = compressors
+    return opts
+
+
+def mongo_uri():
+    """
+    Return the URI of our cloud cluster, or None to connect locally.
+    """
+    if os.environ.get("CLOUD_MONGO", LOCAL) != CLOUD:
         return None
+    username = os.environ.get("GAME_MONGO_USER")
+    password = os.environ.get("GAME_MONGO_PW")
+    cluster_url = os.environ.get("GAME_MONGO_URL")
+    if not username or not password or not cluster_url:
+        raise ValueError('You must set your credentials '
+                         + 'to use Mongo in the cloud.')
+    return (f'mongodb+srv://{username}:{password}'
+            + f'@{cluster_url}'
+            + '/gamesDB?retryWrites=true&w=majority')
+
+
+def _new_client():
+    """
+    Build a client. No network I/O happens here: pymongo connects in
+    the background and on first use.
+    """
+    if os.environ.get(BACKEND_ENV) == MEMORY:
+        print("Using the in-memory storage engine.")
+        return mdb.MemoryClient()
+    uri = mongo_uri()
+    if uri:
+        print("Connecting to Mongo in the cloud.")
+        return pm.MongoClient(uri, **pool_options())
+    print("Connecting to Mongo locally.")
+    return pm.MongoClient(**pool_options())
+
+
+def _warm(new_client):
+    try:
+        new_client.admin.command('ping')
+    except Exception as e:
+        print(f'Could not warm the Mongo pool: {e}')
+
+
+def warm_pool():
+    """
+    Ping the server from a background thread, so that server discovery
+    and the first pooled connections are ready before the first request.
+    """
+    thread = threading.Thread(target=_warm, args=(client,), daemon=True)
+    thread.start()
+    return thread
+
+
+def get_client():
+    """
+    Return the shared client, creating it on first use.
+    This is what every data call goes through, so importing the data
+    modules never touches the network.
+    """
+    global client, _client_pid
+    if _client_pid is not None and _client_pid != os.getpid():
+        after_fork()
+    if client is None:
+        with _client_lock:
+            if client is None:
+                client = _new_client()
+                _client_pid = os.getpid()
+                if os.environ.get(WARM_POOL_ENV, '1') == '1':
+                    warm_pool()
+    return client
+
+
+def get_collection(collection, db=GAME_DB):
+    return get_client()[db][collection]
+
+
+def register_post_fork_hook(hook):
+    """
+    Register a function to run in each child process after a fork,
+    once the inherited client has been dropped.
+    Can be used as a decorator.
+    """
+    _post_fork_hooks.append(hook)
+    return hook
+
+
+def after_fork():
+    """
+    Drop the client inherited from the parent process and run the post
+    fork hooks. PyMongo clients are not fork safe, so each worker must
+    open its own; the next data call will do so.
+    This runs automatically in children made by os.fork(), but a
+    pre-fork server can also call it from its own post-fork hook.
+    """
+    global client, _client_pid, _client_lock
+    client = None
+    _client_pid = None
+    # the parent may have held the lock at the moment it forked
+    _client_lock = threading.Lock()
+    for hook in _post_fork_hooks:
+        hook()
+
+
+register_post_fork_hook(qc.after_fork)
+register_post_fork_hook(mt.after_fork)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=after_fork)
+
+
+def connect_db():
+    """
+    Connect (if we have not already) and check that the server answers.
+    Returns the client, or None if the server could not be reached.
+    """
+    try:
+        get_client().admin.command('ping')
+        print("Pinged your deployment. You successfully connected!")
+        return client
+    except pm.errors.PyMongoError as e:
+        print(e)
+    return None
 
 
 def convert_mongo_id(doc: dict):
@@ -55,34 +206,189 @@ def convert_mongo_id(doc: dict):
         doc[MONGO_ID] = str(doc[MONGO_ID])
 
 
+@mt.timed('insert_one')
 def create(collection, doc, db=GAME_DB):
     """
     Insert a single doc into collection.
     """
-    print(f'{db=}')
-    result = client[db][collection].insert_one(doc)
+    result = get_collection(collection, db).insert_one(doc)
+    idm.forget(db, collection)
+    qc.bump(db, collection)
     return str(result.inserted_id)
 
 
+@mt.timed('update_one', filt_arg='filt')
+def create_if_absent(collection, filt, doc, db=GAME_DB) -> bool:
+    """
+    Insert doc unless a doc matching filt already exists, in one round
+    trip: an upsert that only sets fields when it inserts.
+    filt should be on a uniquely indexed field. Then two racing creates
+    cannot both insert: the loser gets a duplicate key error, which
+    here just means the doc is already there.
+    Returns:
+        bool: True if doc was inserted, False if one already existed
+    """
+    try:
+        result = get_collection(collection, db).update_one(
+            filt, {'$setOnInsert': doc}, upsert=True)
+    except DuplicateKeyError:
+        return False
+    if result.upserted_id is None:
+        return False
+    idm.forget(db, collection)
+    qc.bump(db, collection)
+    return True
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+
+def _write_errors(err) -> dict:
+    """
+    Map each failed op's index (within its batch) to its error message.
+    """
+    return {we['index']: we.get('errmsg', str(we))
+            for we in err.details.get('writeErrors', [])}
+
+
+def _bulk_result(ok: bool, id=None, error=None) -> dict:
+    result = {OK: ok}
+    if id is not None:
+        result[ID] = str(id)
+    if error is not None:
+        result[ERROR] = error
+    return result
+
+
+@mt.timed('insert_many')
+def create_many(collection, docs: list, db=GAME_DB,
+                chunk_size=BULK_CHUNK_SIZE) -> list:
+    """
+    Insert many docs, one unordered round trip per chunk.
+    A failed doc (for instance, a duplicate key) does not stop the rest.
+    Returns:
+        list: one result per doc, in order, with OK and either ID or ERROR
+    """
+    results = []
+    for _, chunk in _chunks(docs, chunk_size):
+        failed = {}
+        try:
+            get_collection(collection, db).insert_many(chunk, ordered=False)
+        except pm.errors.BulkWriteError as err:
+            failed = _write_errors(err)
+        for i, doc in enumerate(chunk):
+            if i in failed:
+                results.append(_bulk_result(False, error=failed[i]))
+            else:
+                results.append(_bulk_result(True, id=doc.get(MONGO_ID)))
+    # after the writes: a cached read in between would otherwise store
+    # the old data under the new version
+    idm.forget(db, collection)
+    qc.bump(db, collection)
+    return results
+
+
+def _to_write_op(op: dict):
+    op_type = op[OP]
+    if op_type == INSERT:
+        return pm.InsertOne(op[DOC])
+    elif op_type == UPDATE:
+        return pm.UpdateOne(op[FILTER], {'$set': op[DOC]})
+    elif op_type == UPSERT:
+        return pm.UpdateOne(op[FILTER], {'$set': op[DOC]}, upsert=True)
+    elif op_type == DELETE:
+        return pm.DeleteOne(op[FILTER])
+    raise ValueError(f'Bad bulk op: {op_type}')
+
+
+@mt.timed('bulk_write')
+def bulk_write(collection, ops: list, db=GAME_DB, ordered=False,
+               chunk_size=BULK_CHUNK_SIZE) -> list:
+    """
+    Run a mix of insert, update, upsert and delete ops in bulk.
+    Each op is a dict with an OP type, plus a FILTER and/or a DOC.
+    Updates and upserts `$set` the fields in DOC, as update() does.
+    Returns:
+        list: one result per op, in order, with OK, and ID for upserts
+    """
+    write_ops = [_to_write_op(op) for op in ops]
+    results = []
+    for start, chunk in _chunks(write_ops, chunk_size):
+        failed = {}
+        upserted = {}
+        try:
+            res = get_collection(collection, db).bulk_write(
+                chunk, ordered=ordered)
+            upserted = res.upserted_ids or {}
+        except pm.errors.BulkWriteError as err:
+            failed = _write_errors(err)
+            upserted = {u['index']: u['_id']
+                        for u in err.details.get('upserted', [])}
+        for i, op in enumerate(ops[start:start + len(chunk)]):
+            if i in failed:
+                results.append(_bulk_result(False, error=failed[i]))
+            elif ordered and failed and i > min(failed):
+                # an ordered bulk write stops at its first error
+                results.append(_bulk_result(False, error='not attempted'))
+            elif op[OP] == INSERT:
+                results.append(_bulk_result(True, id=op[DOC].get(MONGO_ID)))
+            else:
+                results.append(_bulk_result(True, id=upserted.get(i)))
+        if ordered and failed:
+            for op in ops[start + len(chunk):]:
+                results.append(_bulk_result(False, error='not attempted'))
+            break
+    idm.forget(db, collection)
+    qc.bump(db, collection)
+    return results
+
+
+def upsert_many(collection, key: str, docs: list, db=GAME_DB,
+                chunk_size=BULK_CHUNK_SIZE) -> list:
+    """
+    Insert or update each doc, matching existing docs on `key`.
+    """
+    ops = [{OP: UPSERT, FILTER: {key: doc[key]}, DOC: doc} for doc in docs]
+    return bulk_write(collection, ops, db=db, chunk_size=chunk_size)
+
+
 def read_one(collection, filt, db=GAME_DB):
     """
     Find with a filter and return on the first doc found.
     Return None if not found.
+    Repeat reads within a request are served by the identity map.
     """
-    for doc in client[db][collection].find(filt):
+    doc = idm.get(db, collection, filt)
+    if doc is not idm.MISS:
+        return doc
+    doc = _find_one(collection, filt, db)
+    idm.put(db, collection, filt, doc)
+    return doc
+
+
+@mt.timed('find_one', filt_arg='filt')
+def _find_one(collection, filt, db=GAME_DB):
+    for doc in get_collection(collection, db).find(filt):
         convert_mongo_id(doc)
         return doc
+    return None
 
 
+@mt.timed('delete_one', filt_arg='filt')
 def delete(collection, filt, db=GAME_DB):
     """
-    Find with a filter and return on the first doc found.
+    Delete the first doc matching filt.
+    Returns the number of docs deleted.
     """
-    print(f'{filt=}')
-    del_result = client[db][collection].delete_one(filt)
+    del_result = get_collection(collection, db).delete_one(filt)
+    idm.delete(db, collection, filt)
+    qc.bump(db, collection)
     return del_result.deleted_count
 
 
+@mt.timed('update_one', filt_arg='filters')
 def update(collection, filters, update_dict, db=GAME_DB):
     """
     Update an entry
@@ -94,51 +400,223 @@ def update(collection, filters, update_dict, db=GAME_DB):
     Returns:
         UpdateResult from MongoDB
     """
-    result = client[db][collection].update_one(filters, {'$set': update_dict})
+    result = get_collection(collection, db).update_one(
+        filters, {'$set': update_dict})
+    idm.apply_update(db, collection, filters, update_dict)
+    qc.bump(db, collection)
     return result
 
 
+@mt.timed('update_one', filt_arg='filt')
+def update_ops(collection, filt, update, db=GAME_DB):
+    """
+    Apply a Mongo update document, with whatever operators it needs
+    ($push, $pull, $inc, positional paths...), to the first doc
+    matching filt. Unlike update(), nothing is read or rewritten
+    beyond the fields the operators name.
+    Returns the UpdateResult from MongoDB.
+    """
+    result = get_collection(collection, db).update_one(filt, update)
+    idm.forget(db, collection)
+    qc.bump(db, collection)
+    return result
+
+
+@mt.timed('update_many', filt_arg='filt')
+def update_many(collection, filt, update, db=GAME_DB) -> int:
+    """
+    Apply a Mongo update document to every doc matching filt, all on
+    the server side.
+    Returns the number of docs modified.
+    """
+    result = get_collection(collection, db).update_many(filt, update)
+    idm.forget(db, collection)
+    qc.bump(db, collection)
+    return result.modified_count
+
+
+def append_with_count(collection, filt, array_field, value, count_field,
+                      db=GAME_DB) -> bool:
+    """
+    Add value to the array in array_field of the first doc matching
+    filt, and add one to its count_field, in one atomic update.
+    The update only matches while value is not yet in the array, so
+    repeating it (or racing it) never double counts.
+    Returns:
+        bool: True if value was added now; False if no doc matched,
+              either because there is none or value was already there
+    """
+    filt = dict(filt)
+    filt[array_field] = {'$ne': value}
+    result = update_ops(collection, filt, {
+        '$addToSet': {array_field: value},
+        '$inc': {count_field: 1},
+    }, db=db)
+    return result.matched_count > 0
+
+
+@mt.timed('find_one_and_update', filt_arg='filt')
+def find_and_update(collection, filt, update, projection=None, db=GAME_DB,
+                    no_id=True, upsert=False):
+    """
+    Apply a Mongo update (operators, or an update pipeline) to the first
+    doc matching filt, and return that doc as it is after the update,
+    all in one round trip.
+    With upsert=True, a doc is made from filt if none matches.
+    Returns None if no doc matched, in which case nothing was changed.
+    """
+    if no_id:
+        projection = dict(projection or {})
+        projection[MONGO_ID] = 0
+    doc = get_collection(collection, db).find_one_and_update(
+        filt, update, projection=projection, upsert=upsert,
+        return_document=pm.ReturnDocument.AFTER)
+    if doc is not None:
+        idm.forget(db, collection)
+        qc.bump(db, collection)
+        convert_mongo_id(doc)
+    return doc
+
+
+@mt.timed('count_documents', filt_arg='filt')
+def count(collection, filt=None, db=GAME_DB) -> int:
+    """
+    Return how many docs match filt (all docs, by default).
+    """
+    return get_collection(collection, db).count_documents(filt or {})
+
+
+@mt.timed('find', filt_arg='filt')
+def iter_query(collection, filt=None, projection=None, sort=None, skip=0,
+               limit=0, batch_size=None, db=GAME_DB, no_id=True):
+    """
+    Run a filtered find entirely on the server side, yielding the
+    matching documents one at a time as the cursor fetches them.
+    Args:
+        collection: collection to search
+        filt: Mongo filter (default: all documents)
+        projection: fields to return, in Mongo projection form
+        sort: list of (field, direction) pairs
+        skip: number of matching documents to skip
+        limit: maximum number of documents to return (0 means no limit)
+        batch_size: documents per network batch
+        db: database name (default: GAME_DB)
+        no_id: if True, `_id` is projected out by the server
+    """
+    if no_id:
+        projection = dict(projection or {})
+        projection[MONGO_ID] = 0
+    cursor = get_collection(collection, db).find(filt or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    if skip:
+        cursor = cursor.skip(skip)
+    if limit:
+        cursor = cursor.limit(limit)
+    if batch_size:
+        cursor = cursor.batch_size(batch_size)
+    for doc in cursor:
+        if not no_id:
+            convert_mongo_id(doc)
+        yield doc
+
+
+def query(collection, filt=None, projection=None, sort=None, skip=0,
+          limit=0, batch_size=None, db=GAME_DB, no_id=True,
+          cached=False) -> list:
+    """
+    Like iter_query(), but returns the matching documents as a list.
+    With cached=True, the result may come from (and goes into) the
+    process-level query cache.
+    """
+    def run():
+        return list(iter_query(collection, filt, projection=projection,
+                               sort=sort, skip=skip, limit=limit,
+                               batch_size=batch_size, db=db, no_id=no_id))
+    if not cached:
+        return run()
+    key = qc.make_key(db, collection, QUERY, filt, projection, sort, skip,
+                      limit, no_id)
+    return qc.cached(key, run)
+
+
+def read_page(collection, key, after=None, limit=25, filt=None,
+              projection=None, db=GAME_DB, no_id=True):
+    """
+    Return one page of documents ordered by `key`, starting after the
+    key value `after` (or from the start if it is None).
+    `key` should be indexed and unique, so the page is an index range.
+    Returns:
+        (list of docs, True if there are more docs after this page)
+    """
+    filt = dict(filt or {})
+    if after is not None:
+        filt[key] = {'$gt': after}
+    if projection:
+        projection = dict(projection)
+        projection[key] = 1
+    docs = query(collection, filt, projection=projection,
+                 sort=[(key, pm.ASCENDING)], limit=limit + 1, db=db,
+                 no_id=no_id)
+    return docs[:limit], len(docs) > limit
+
+
+@mt.timed('find')
 def fetch_all(collection, db=GAME_DB):
     ret = []
-    for doc in client[db][collection].find():
+    for doc in get_collection(collection, db).find():
         ret.append(doc)
     return ret
 
 
+@mt.timed('find')
 def fetch_all_as_dict(key, collection, db=GAME_DB):
     ret = {}
-    for doc in client[db][collection].find():
+    for doc in get_collection(collection, db).find():
         del doc[MONGO_ID]
         ret[doc[key]] = doc
     return ret
 
 
+def iter_read(collection, db=GAME_DB, no_id=True, batch_size=None):
+    """
+    Yield every document in the collection without holding them all.
+    """
+    return iter_query(collection, db=db, no_id=no_id, batch_size=batch_size)
+
+
 def read(collection, db=GAME_DB, no_id=True) -> list:
     """
     Return all documents in the collection as a list.
     Optionally remove the `_id` field from each document.
     """
-    ret = []
-    for doc in client[db][collection].find():
-        if no_id:
-            del doc[MONGO_ID]
-        ret.append(doc)
-    return ret
+    return query(collection, db=db, no_id=no_id)
+
+
+def iter_dict(collection, key, db=GAME_DB, no_id=True, batch_size=None):
+    """
+    Yield (key value, document) pairs for every document in the
+    collection, in the shape read_dict() returns them.
+    """
+    for rec in iter_read(collection, db=db, no_id=no_id,
+                         batch_size=batch_size):
+        yield rec[key], rec
 
 
-def read_dict(collection, key, db=GAME_DB, no_id=True) -> dict:
+def read_dict(collection, key, db=GAME_DB, no_id=True,
+              cached=False) -> dict:
     """
     Return all documents in the collection as a dictionary,
     keyed by a specific field.
     Optionally remove the `_id` field from each document.
+    With cached=True, use the process-level query cache.
     """
-    recs = read(collection, db=db, no_id=no_id)
-    recs_as_dict = {}
-    for rec in recs:
-        if no_id and MONGO_ID in rec:
-            del rec[MONGO_ID]
-        recs_as_dict[rec[key]] = rec
-    return recs_as_dict
+    def run():
+        return dict(iter_dict(collection, key, db=db, no_id=no_id))
+    if not cached:
+        return run()
+    return qc.cached(qc.make_key(db, collection, READ_DICT, key, no_id),
+                     run)
 
 
 if __name__ == "__main__":
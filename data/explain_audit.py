@@ -0,0 +1,292 @@
+"""
+An audit that our queries are served by indexes.
+While capturing, every filter that reaches Mongo is recorded (one
+example per collection, op, filter shape and sort). audit() then runs
+explain() on each and flags:
+    - a COLLSCAN stage: the query read the whole collection
+    - a SORT stage: the results were sorted in memory, not by an index
+    - more than MAX_RATIO docs examined per doc returned
+Full reads (an empty filter and no sort) are expected to scan.
+Run it as a script to seed the in-memory engine, run our read paths
+through people, manuscripts, text and masthead, and the writes of
+manuscript actions, referee reports, the cascade and the security
+records, and report:
+    MONGO_BACKEND=memory python -m data.explain_audit
+"""
+from contextlib import contextmanager
+import json
+import os
+import sys
+import threading
+
+import data.db_connect as dbc
+import data.identity_map as idm
+import data.metrics as mt
+
+MAX_RATIO = float(os.environ.get('EXPLAIN_MAX_RATIO', '10'))
+
+# ops whose filter selects documents through the query planner;
+# each is explained as a find on its filter
+EXPLAINABLE = {'find', 'find_one', 'update_one', 'update_many',
+               'delete_one', 'find_one_and_update', 'count_documents'}
+
+# plan stages
+COLLSCAN = 'COLLSCAN'
+SORT = 'SORT'
+IXSCAN = 'IXSCAN'
+
+# report fields
+COLLECTION = 'collection'
+OP = 'op'
+SHAPE = 'shape'
+SORT_SPEC = 'sort'
+STAGES = 'stages'
+INDEXES = 'indexes'
+EXAMINED = 'examined'
+RETURNED = 'returned'
+RATIO = 'ratio'
+PROBLEMS = 'problems'
+ACCEPTED = 'accepted'
+
+# (collection, filter shape) -> why a flagged plan is acceptable
+ACCEPTED_PLANS = {
+    # manuscripts.read_sorted_page's last bucket: any invalid states.
+    # It is normally empty, and $nin cannot use index bounds well.
+    ('manuscripts', '{"curr_state": {"$nin": ["?"]}}'):
+        'invalid state bucket; expected to be empty',
+    # security.fetch_recs reads every record but the version doc, and
+    # only when the version has moved.
+    ('security', '{"feature": {"$ne": "?"}}'):
+        'reads all security records; once per version change',
+}
+
+_lock = threading.Lock()
+_capturing = False
+# (db, collection, op, shape, sort) -> (filter, sort)
+_captured = {}
+
+
+def _shape(filt) -> str:
+    return json.dumps(mt.filter_shape(filt or {}), sort_keys=True)
+
+
+def note(collection, op, filt, args=None):
+    if not _capturing or op not in EXPLAINABLE:
+        return
+    args = args or {}
+    db = args.get('db', dbc.GAME_DB)
+    sort = args.get('sort')
+    key = (db, collection, op, _shape(filt), idm.freeze(sort))
+    with _lock:
+        _captured.setdefault(key, (filt or {}, sort))
+
+
+mt.add_listener(note)
+
+
+def start():
+    """
+    Start capturing queries, forgetting any captured before.
+    """
+    global _capturing
+    with _lock:
+        _captured.clear()
+    _capturing = True
+
+
+def stop():
+    global _capturing
+    _capturing = False
+
+
+@contextmanager
+def capture():
+    start()
+    try:
+        yield
+    finally:
+        stop()
+
+
+def captured() -> list:
+    """
+    Return (db, collection, op, filter, sort) for each captured query.
+    """
+    with _lock:
+        return [(db, coll, op, filt, sort)
+                for (db, coll, op, _, _), (filt, sort) in _captured.items()]
+
+
+def plan_stages(plan: dict) -> list:
+    """
+    Return every stage in a plan tree, as (stage name, index name) pairs.
+    """
+    stages = []
+    if not isinstance(plan, dict):
+        return stages
+    if 'stage' in plan:
+        stages.append((plan['stage'], plan.get('indexName')))
+    for child in ('inputStage', 'queryPlan', 'outerStage', 'innerStage'):
+        stages.extend(plan_stages(plan.get(child)))
+    for sub in plan.get('inputStages', []):
+        stages.extend(plan_stages(sub))
+    return stages
+
+
+def analyze(explain: dict, filt=None, sort=None) -> dict:
+    """
+    Summarize an explain() result and list what is wrong with it.
+    """
+    winning = explain.get('queryPlanner', {}).get('winningPlan', {})
+    stages = plan_stages(winning)
+    names = [stage for stage, _ in stages]
+    stats = explain.get('executionStats', {})
+    examined = stats.get('totalDocsExamined', 0)
+    returned = stats.get('nReturned', 0)
+    ratio = examined / max(returned, 1)
+    problems = []
+    full_read = not filt and not sort
+    if COLLSCAN in names and not full_read:
+        problems.append('collection scan')
+    if SORT in names:
+        problems.append('in-memory sort')
+    if ratio > MAX_RATIO and not full_read:
+        problems.append(f'examined {examined} docs to return {returned}')
+    return {
+        STAGES: names,
+        INDEXES: [index for _, index in stages if index],
+        EXAMINED: examined,
+        RETURNED: returned,
+        RATIO: round(ratio, 2),
+        PROBLEMS: problems,
+    }
+
+
+def explain(collection, filt, sort=None, db=dbc.GAME_DB) -> dict:
+    cursor = dbc.get_collection(collection, db).find(filt)
+    if sort:
+        cursor = cursor.sort(sort)
+    return cursor.explain()
+
+
+def audit(queries=None) -> list:
+    """
+    Explain each captured query (or each of `queries`, as returned by
+    captured()) and return a report per query.
+    """
+    reports = []
+    for db, coll, op, filt, sort in (queries or captured()):
+        report = analyze(explain(coll, filt, sort, db=db), filt, sort)
+        shape = _shape(filt)
+        report.update({COLLECTION: coll, OP: op, SHAPE: shape,
+                       SORT_SPEC: sort})
+        reason = ACCEPTED_PLANS.get((coll, shape))
+        if report[PROBLEMS] and reason:
+            report[ACCEPTED] = reason
+        reports.append(report)
+    return reports
+
+
+def failures(reports: list) -> list:
+    return [report for report in reports
+            if report[PROBLEMS] and not report.get(ACCEPTED)]
+
+
+def seed():
+    """
+    Put enough data in place for the workload to exercise every path.
+    Only for an empty (e.g. in-memory) database.
+    """
+    import data.indexes as idx
+    import data.manuscripts as manu
+    import data.manus.query as query
+    import data.people as ppl
+    import data.roles as rls
+    import data.text as txt
+
+    idx.ensure_indexes()
+    roles = [rls.AUTHOR_CODE, rls.RE_CODE, rls.ED_CODE, rls.ME_CODE]
+    ppl.create_many([{ppl.NAME: f'Person {i}', ppl.AFFILIATION: 'NYU',
+                      ppl.EMAIL: f'person{i}@nyu.edu',
+                      ppl.ROLES: [roles[i % len(roles)]]}
+                     for i in range(40)])
+    results = manu.create_manuscripts([{manu.TITLE: f'Title {i}',
+                                        manu.AUTHOR: f'person{i}@nyu.edu'}
+                                       for i in range(40)])
+    for i, result in enumerate(results):
+        state = query.VALID_STATES[i % len(query.VALID_STATES)]
+        manu.update_manuscript(result[manu.MANU_ID], {manu.CURR_STATE: state})
+    txt.create_many([{txt.KEY: f'key{i}', txt.TITLE: f'Title {i}',
+                      txt.TEXT: 'text'} for i in range(10)])
+
+
+def workload():
+    """
+    Run the read paths of people, manuscripts, text and masthead, then
+    the writes whose filters the planner serves: manuscript actions,
+    referee reports, the cascade's renames and removals, and saving and
+    loading the security records.
+    """
+    import data.cascade as cascade
+    import data.manuscripts as manu
+    import data.manus.fields as flds
+    import data.manus.query as query
+    import data.masthead as mh
+    import data.people as ppl
+    import data.query_cache as qc
+    import data.text as txt
+    import security.security as sec
+
+    qc.clear()
+    ppl.read()
+    ppl.read_one('person1@nyu.edu')
+    ppl.read_name('person1@nyu.edu')
+    ppl.get_referees()
+    ppl.get_manuscripts('person1@nyu.edu')
+    _, cursor = ppl.read_page(limit=5)
+    ppl.read_page(cursor, limit=5)
+    manu.read()
+    manu.get_manuscript('person1@nyu.edu')
+    for state in query.VALID_STATES:
+        manu.filter_manuscripts_by_state(state)
+    _, cursor = manu.read_page(limit=5)
+    manu.read_page(cursor, limit=5)
+    _, cursor = manu.read_sorted_page(limit=5)
+    manu.read_sorted_page(cursor, limit=5)
+    manu.id_space_stats()
+    txt.read()
+    txt.read_one('key1')
+    mh.get_masthead()
+
+    ref = 'person1@nyu.edu'
+    (result,) = manu.create_manuscripts([{manu.TITLE: 'Audit',
+                                          manu.AUTHOR: 'person2@nyu.edu'}])
+    manu_id = result[manu.MANU_ID]
+    manu.handle_action(manu_id, query.SUBMITTED, query.ASSIGN_REF, ref=ref,
+                       extra={flds.VERDICT: manu.ACCEPT})
+    manu.set_referee_report(manu_id, ref, report='Fine.')
+    manu.handle_action(manu_id, query.IN_REF_REV, query.DELETE_REF, ref=ref)
+    cascade.rename('person2@nyu.edu', 'person2b@nyu.edu')
+    cascade.remove('person3@nyu.edu')
+    sec.save_feature('audit', {})
+    sec.delete_feature('audit')
+
+
+def main() -> int:
+    if os.environ.get(dbc.BACKEND_ENV) == dbc.MEMORY:
+        seed()
+    with capture():
+        workload()
+    reports = audit()
+    for report in reports:
+        status = 'ACCEPTED' if report.get(ACCEPTED) else \
+            'FAIL' if report[PROBLEMS] else 'ok'
+        print(f"{status:8} {report[COLLECTION]}.{report[OP]} "
+              f"{report[SHAPE]} sort={report[SORT_SPEC]} "
+              f"stages={report[STAGES]} ratio={report[RATIO]} "
+              f"{'; '.join(report[PROBLEMS])}")
+    return 1 if failures(reports) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+A request-scoped identity map for single-document reads.
+While a scope is open, read_one() for the same (collection, filter)
+is served from memory after the first trip to the DB, and our own
+writes keep the map up to date. Outside a scope nothing is cached.
+"""
+from contextlib import contextmanager
+import contextvars
+import copy
+
+MISS = object()
+
+_docs = contextvars.ContextVar('identity_map', default=None)
+
+
+def begin():
+    """
+    Open a fresh map for the current request.
+    """
+    _docs.set({})
+
+
+def end():
+    _docs.set(None)
+
+
+@contextmanager
+def scope():
+    """
+    Open a map for the duration of a with block.
+    """
+    token = _docs.set({})
+    try:
+        yield
+    finally:
+        _docs.reset(token)
+
+
+def is_active() -> bool:
+    return _docs.get() is not None
+
+
+def freeze(val):
+    """
+    Turn a filter (or any nest of dicts and lists) into a hashable key.
+    """
+    if isinstance(val, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in val.items()))
+    if isinstance(val, (list, tuple)):
+        return tuple(freeze(v) for v in val)
+    try:
+        hash(val)
+        return val
+    except TypeError:
+        return repr(val)
+
+
+def _key(db, collection, filt) -> tuple:
+    return (db, collection, freeze(filt))
+
+
+def get(db, collection, filt):
+    """
+    Return a copy of the doc mapped to this filter (None if we know
+    there is no such doc), or MISS if we have not read it yet.
+    """
+    docs = _docs.get()
+    if docs is None:
+        return MISS
+    doc = docs.get(_key(db, collection, filt), MISS)
+    if doc is MISS:
+        return MISS
+    return copy.deepcopy(doc)
+
+
+def put(db, collection, filt, doc):
+    docs = _docs.get()
+    if docs is not None:
+        docs[_key(db, collection, filt)] = copy.deepcopy(doc)
+
+
+def forget(db, collection):
+    """
+    Drop everything mapped for a collection.
+    """
+    docs = _docs.get()
+    if docs is not None:
+        for key in [key for key in docs if key[:2] == (db, collection)]:
+            del docs[key]
+
+
+def apply_update(db, collection, filt, set_fields: dict):
+    """
+    Apply a `$set` we just wrote to the doc mapped to the same filter.
+    Any other entry for the collection might be the same doc under
+    another filter, so those are dropped.
+    """
+    docs = _docs.get()
+    if docs is None:
+        return
+    key = _key(db, collection, filt)
+    doc = docs.get(key, MISS)
+    forget(db, collection)
+    if doc is MISS or doc is None:
+        return
+    if any(field in set_fields and set_fields[field] != val
+           for field, val in filt.items()):
+        return  # the doc no longer matches its filter
+    doc.update(copy.deepcopy(set_fields))
+    docs[key] = doc
+
+
+def delete(db, collection, filt):
+    """
+    Record that the doc matching filt is gone.
+    """
+    forget(db, collection)
+    put(db, collection, filt, None)
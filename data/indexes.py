@@ -0,0 +1,130 @@
+"""
+This module declares the indexes each collection needs and makes sure
+they exist. Run it as a deploy step:
+    python -m data.indexes
+"""
+import threading
+
+import pymongo as pm
+
+import data.db_connect as dbc
+import data.manuscripts as manu
+import data.manus.fields as flds
+import data.people as ppl
+import data.text as txt
+import security.security as sec
+
+ASC = pm.ASCENDING
+
+# spec fields
+KEYS = 'keys'
+UNIQUE = 'unique'
+
+# report fields
+CREATED = 'created'
+OK = 'ok'
+DRIFT = 'drift'
+
+ID_INDEX = '_id_'
+
+INDEXES = {
+    ppl.PEOPLE_COLLECT: [
+        {KEYS: [(ppl.EMAIL, ASC)], UNIQUE: True},
+        {KEYS: [(ppl.ROLES, ASC)]},
+    ],
+    manu.MANU_COLLECT: [
+        {KEYS: [(manu.MANU_ID, ASC)], UNIQUE: True},
+        {KEYS: [(manu.CURR_STATE, ASC), (manu.MANU_ID, ASC)]},
+        {KEYS: [(manu.AUTHOR, ASC), (manu.MANU_ID, ASC)]},
+        {KEYS: [(flds.REFEREES, ASC)]},
+        {KEYS: [(manu.REPORTS_REF, ASC)]},
+    ],
+    txt.TEXT_COLLECT: [
+        {KEYS: [(txt.KEY, ASC)], UNIQUE: True},
+    ],
+    sec.COLLECT_NAME: [
+        {KEYS: [(sec.FEATURE, ASC)], UNIQUE: True},
+    ],
+}
+
+
+def index_name(keys: list) -> str:
+    """
+    Return the name Mongo gives an index on these keys by default.
+    """
+    return '_'.join(f'{field}_{direction}' for field, direction in keys)
+
+
+def get_indexes(collection: str) -> list:
+    return INDEXES.get(collection, [])
+
+
+def _matches(spec: dict, info: dict) -> bool:
+    return (list(info.get('key', [])) == list(spec[KEYS])
+            and bool(info.get(UNIQUE, False)) == spec.get(UNIQUE, False))
+
+
+def ensure_collection(collection: str, db=dbc.GAME_DB) -> dict:
+    """
+    Create any declared index missing from `collection`.
+    Indexes that exist with different options, or that we never declared,
+    are reported as drift but left alone.
+    Returns:
+        dict: names of indexes created, already ok, and drifted
+    """
+    report = {CREATED: [], OK: [], DRIFT: []}
+    coll = dbc.get_collection(collection, db)
+    existing = coll.index_information()
+    declared = set()
+    for spec in get_indexes(collection):
+        name = index_name(spec[KEYS])
+        declared.add(name)
+        if name not in existing:
+            try:
+                coll.create_index(spec[KEYS], name=name,
+                                  unique=spec.get(UNIQUE, False))
+                report[CREATED].append(name)
+            except pm.errors.OperationFailure as err:
+                report[DRIFT].append(f'{name}: {err}')
+        elif _matches(spec, existing[name]):
+            report[OK].append(name)
+        else:
+            report[DRIFT].append(f'{name}: exists with different options')
+    for name in existing:
+        if name != ID_INDEX and name not in declared:
+            report[DRIFT].append(f'{name}: not declared')
+    return report
+
+
+def ensure_indexes(db=dbc.GAME_DB) -> dict:
+    """
+    Build or verify the declared indexes on every collection.
+    Safe to run on every start up: existing indexes are not rebuilt.
+    Returns:
+        dict: a report per collection, as from ensure_collection()
+    """
+    reports = {}
+    for collection in INDEXES:
+        try:
+            reports[collection] = ensure_collection(collection, db=db)
+        except pm.errors.ConnectionFailure as err:
+            print(f'Could not check indexes: {err}')
+            break
+        for drift in reports[collection][DRIFT]:
+            print(f'Index drift on {collection}: {drift}')
+    return reports
+
+
+def ensure_indexes_in_background(db=dbc.GAME_DB) -> threading.Thread:
+    """
+    Run ensure_indexes() on a daemon thread, so that starting up never
+    waits on Mongo.
+    """
+    thread = threading.Thread(target=ensure_indexes, args=(db,),
+                              name='ensure-indexes', daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    print(ensure_indexes())
@@ -5,13 +5,19 @@ TITLE = 'title'
 AUTHOR = 'author'
 AUTHOR_EMAIL = 'author_email'
 STATE = 'state'
+CURR_STATE = 'curr_state'
 REFEREES = 'referees'
+REFEREE = 'referee'
+# per-referee report and verdict: [{REFEREE, REPORT, VERDICT}, ...]
+REFEREE_REPORTS = 'referee_reports'
 REPORT = 'report'
 VERDICT = 'verdict'
 TEXT = 'text'
 ABSTRACT = 'abstract'
 HISTORY = 'history'
 EDITOR = 'editor'
+# bumped by every state transition, for optimistic concurrency
+VERSION = 'version'
 
 # Attribute Keys
 DISPLAY_NAME = 'display_name'
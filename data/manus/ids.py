@@ -0,0 +1,123 @@
+"""
+Manuscript IDs: three words from the BIP-39 English wordlist, run
+together (e.g. 'abandonzoozebra').
+An ID is a random number below SPACE_SIZE, written in base 2048 with
+one word per digit. The number comes from the OS CSPRNG and the
+wordlist is loaded once. We do not check the DB for an ID before using
+it: the unique index on manu_id rejects a collision, and the caller
+draws again. Collisions are counted, since the share of draws that
+collide estimates how full the ID space is.
+"""
+from functools import lru_cache
+import secrets
+import threading
+
+from mnemonic import Mnemonic
+
+LANGUAGE = 'english'
+WORDS_PER_ID = 3
+# how many collisions in a row before we give up on an insert
+MAX_TRIES = 10
+
+# stats fields
+SPACE_SIZE = 'space_size'
+DRAWN = 'drawn'
+COLLISIONS = 'collisions'
+COLLISION_RATE = 'collision_rate'
+USED = 'used'
+FILL = 'fill'
+
+_lock = threading.Lock()
+_drawn = 0
+_collisions = 0
+
+
+class IdSpaceExhausted(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def wordlist() -> tuple:
+    return tuple(Mnemonic(LANGUAGE).wordlist)
+
+
+def space_size() -> int:
+    return len(wordlist()) ** WORDS_PER_ID
+
+
+def encode(n: int) -> str:
+    """
+    Write n (0 <= n < space_size()) as WORDS_PER_ID words.
+    """
+    words = wordlist()
+    base = len(words)
+    digits = []
+    for _ in range(WORDS_PER_ID):
+        n, digit = divmod(n, base)
+        digits.append(words[digit])
+    return ''.join(reversed(digits))
+
+
+def new_id() -> str:
+    global _drawn
+    with _lock:
+        _drawn += 1
+    return encode(secrets.randbelow(space_size()))
+
+
+def allocate_block(n: int) -> list:
+    """
+    Draw n distinct IDs at once, for bulk ingest. They are not reserved:
+    an insert can still collide with an ID already in the DB.
+    """
+    block = set()
+    while len(block) < n:
+        block.add(new_id())
+    return list(block)
+
+
+def note_collision():
+    global _collisions
+    with _lock:
+        _collisions += 1
+
+
+def insert_with_id(insert, dup_error, max_tries=MAX_TRIES) -> str:
+    """
+    Call insert(candidate ID) with fresh IDs until it does not raise
+    dup_error (a duplicate key on the ID), and return the ID it took.
+    """
+    for _ in range(max_tries):
+        candidate = new_id()
+        try:
+            insert(candidate)
+            return candidate
+        except dup_error:
+            note_collision()
+    raise IdSpaceExhausted(f'{max_tries} ID collisions in a row')
+
+
+def get_stats(used: int = None) -> dict:
+    """
+    How full is the ID space? The collision rate of our draws estimates
+    the fill; pass `used`, the number of IDs taken, for the exact figure.
+    """
+    with _lock:
+        drawn, collisions = _drawn, _collisions
+    stats = {
+        SPACE_SIZE: space_size(),
+        DRAWN: drawn,
+        COLLISIONS: collisions,
+        COLLISION_RATE: collisions / drawn if drawn else 0.0,
+    }
+    if used is not None:
+        stats[USED] = used
+        stats[FILL] = used / space_size()
+    return stats
+
+
+def reset():
+    global _drawn, _collisions
+    with _lock:
+        _drawn = 0
+        _collisions = 0
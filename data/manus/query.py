@@ -74,7 +74,8 @@ def assign_ref(manuscript: dict, ref: str, extra=None) -> str:
     Returns:
         str: The new state after assigning the referee
     """
-    manuscript[flds.REFEREES].append(ref)
+    if ref not in manuscript[flds.REFEREES]:
+        manuscript[flds.REFEREES].append(ref)
     return IN_REF_REV
 
 
@@ -230,6 +231,66 @@ def get_valid_actions_by_state(state: str) -> set:
     return set(valid_actions)
 
 
+def transition_updates(curr_state: str, action: str, ref: str = None,
+                       **kwargs) -> list:
+    """
+    Express a state transition as targeted Mongo updates, so the server
+    can apply it in the same step that checks the manuscript's state.
+    They have the same effect as the action's FUNC has in Python, but
+    touch only the fields that change: referees are added and removed
+    with $addToSet and $pull, not by rewriting the array.
+
+    Args:
+        curr_state: Current state
+        action: Action to perform
+        ref: The referee, for the referee actions
+        **kwargs: Additional keyword arguments
+
+    Returns:
+        list: (extra filter, Mongo update) pairs. Their filters are
+            mutually exclusive; the first one the manuscript matches
+            is the transition to apply.
+
+    Raises:
+        ValueError: If the state or action is invalid
+    """
+    if curr_state not in STATE_TABLE:
+        raise ValueError(f'Bad state: {curr_state}')
+    # EDITOR_MOVE is subject to STATE_TABLE like any other action, so it
+    # cannot take a manuscript out of a state that does not offer it
+    if action not in STATE_TABLE[curr_state]:
+        raise ValueError(f'{action} not available in {curr_state}')
+    if action == EDITOR_MOVE:
+        target_state = kwargs.get('target_state', SUBMITTED)
+        return [({}, {'$set': {
+            flds.CURR_STATE: editor_move({}, target_state)}})]
+    if action in (ASSIGN_REF, DELETE_REF) and not ref:
+        raise ValueError(f'{action} needs a referee')
+    if action == ASSIGN_REF:
+        return [({}, {
+            '$addToSet': {flds.REFEREES: ref},
+            '$set': {flds.CURR_STATE: IN_REF_REV},
+        })]
+    if action == DELETE_REF:
+        # the new state depends on whether other referees remain,
+        # so each case gets its own filter
+        pull = {flds.REFEREES: ref,
+                flds.REFEREE_REPORTS: {flds.REFEREE: ref}}
+        others_remain = {flds.REFEREES: ref,
+                         f'{flds.REFEREES}.1': {'$exists': True}}
+        last_one = {flds.REFEREES: {'$all': [ref], '$size': 1}}
+        return [
+            (others_remain, {'$pull': pull,
+                             '$set': {flds.CURR_STATE: IN_REF_REV}}),
+            (last_one, {'$pull': pull,
+                        '$set': {flds.CURR_STATE: SUBMITTED}}),
+        ]
+    # the other transitions do not depend on the manuscript
+    new_state = STATE_TABLE[curr_state][action][FUNC]({flds.REFEREES: []},
+                                                      **kwargs)
+    return [({}, {'$set': {flds.CURR_STATE: new_state}})]
+
+
 def handle_action(curr_state: str, action: str, manu: dict, **kwargs) -> str:
     """
     Handle a state transition action.
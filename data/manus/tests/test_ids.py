@@ -0,0 +1,60 @@
+from unittest.mock import patch
+
+import pytest
+
+import data.manus.ids as ids
+
+
+def test_wordlist_cached():
+    assert ids.wordlist() is ids.wordlist()
+    assert len(ids.wordlist()) == 2048
+
+
+def test_encode():
+    words = ids.wordlist()
+    assert ids.encode(0) == words[0] * 3
+    assert ids.encode(ids.space_size() - 1) == words[-1] * 3
+    assert ids.encode(2048 + 5) == words[0] + words[1] + words[5]
+
+
+def test_new_id():
+    manu_id = ids.new_id()
+    assert isinstance(manu_id, str)
+    assert manu_id.isalpha()
+
+
+def test_allocate_block():
+    block = ids.allocate_block(100)
+    assert len(set(block)) == 100
+
+
+def test_insert_with_id_retries():
+    ids.reset()
+    taken = []
+
+    def insert(manu_id):
+        if not taken:
+            taken.append(manu_id)
+            raise KeyError(manu_id)
+
+    manu_id = ids.insert_with_id(insert, KeyError)
+    assert manu_id != taken[0]
+    stats = ids.get_stats(used=2)
+    assert stats[ids.COLLISIONS] == 1
+    assert stats[ids.DRAWN] == 2
+    assert stats[ids.COLLISION_RATE] == 0.5
+    assert stats[ids.FILL] == 2 / ids.space_size()
+
+
+def test_insert_with_id_gives_up():
+    def insert(manu_id):
+        raise KeyError(manu_id)
+
+    with pytest.raises(ids.IdSpaceExhausted):
+        ids.insert_with_id(insert, KeyError, max_tries=3)
+
+
+def test_draws_from_csprng():
+    with patch("data.manus.ids.secrets.randbelow", return_value=0) as draw:
+        assert ids.new_id() == ids.wordlist()[0] * 3
+    draw.assert_called_once_with(ids.space_size())
@@ -145,3 +145,22 @@ def test_transitions_with_different_manuscripts(sample_manuscript):
         mqry.SUBMITTED, mqry.ASSIGN_REF,
         sample_manuscript, ref='test@nyu.edu')
     assert new_state == mqry.IN_REF_REV
+
+
+def test_transition_updates_are_targeted():
+    """Referee actions touch single array elements, not the whole list."""
+    [(filt, update)] = mqry.transition_updates(
+        mqry.SUBMITTED, mqry.ASSIGN_REF, ref='test@nyu.edu')
+    assert update['$addToSet'] == {flds.REFEREES: 'test@nyu.edu'}
+    assert update['$set'] == {flds.CURR_STATE: mqry.IN_REF_REV}
+    updates = mqry.transition_updates(
+        mqry.IN_REF_REV, mqry.DELETE_REF, ref='test@nyu.edu')
+    assert [u['$set'][flds.CURR_STATE] for _, u in updates] == \
+        [mqry.IN_REF_REV, mqry.SUBMITTED]
+    for _, update in updates:
+        assert update['$pull'][flds.REFEREES] == 'test@nyu.edu'
+
+
+def test_transition_updates_bad_action():
+    with pytest.raises(ValueError):
+        mqry.transition_updates(mqry.SUBMITTED, mqry.DONE)
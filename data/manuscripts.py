@@ -1,15 +1,16 @@
 import data.db_connect as dbc
+import data.paging as pg
 import data.manus.query as query
 import data.manus.fields as flds
-import random
-from mnemonic import Mnemonic
+import data.manus.ids as ids
 
 ACTION = 'action'
 AUTHOR = flds.AUTHOR
-CURR_STATE = 'curr_state'
+CURR_STATE = flds.CURR_STATE
 DISP_NAME = 'disp_name'
 MANU_ID = 'manu_id'
 TITLE = flds.TITLE
+VERSION = flds.VERSION
 MANU_COLLECT = "manuscripts"
 
 TEST_ID = 'fake_id'
@@ -25,20 +26,26 @@ FIELDS = {
 
 def generate_id() -> str:
     """
-    Generates a unique ID for a manuscript.
+    Generates an ID for a manuscript.
+    It is not checked against the DB: inserts rely on the unique index
+    on MANU_ID to reject a collision, and retry with a new ID.
     Returns:
         str: The generated ID.
-    NOTE: This function will loop endlessly if a collision occurs.
     """
-    mnemo = Mnemonic('english')
-    while True:
-        # Generate 32 hex characters (128 bits of entropy)
-        entropy = ''.join(random.choices('0123456789abcdef', k=32))
-        words = mnemo.to_mnemonic(bytes.fromhex(entropy))
-        key = "".join(words.split()[:3])
-        # If the key doesn't exist in the database, return it
-        if not dbc.read_one(MANU_COLLECT, {MANU_ID: key}):
-            return key
+    return ids.new_id()
+
+
+def new_manuscript(title: str, author: str) -> dict:
+    """
+    Returns the record for a new manuscript, without its MANU_ID.
+    """
+    return {
+        TITLE: title,
+        AUTHOR: author,
+        flds.REFEREES: [],  # Initialize as empty list for referee assignments
+        CURR_STATE: query.SUBMITTED,  # all start as submitted
+        VERSION: 0,
+    }
 
 
 def create_manuscript(title: str, author: str) -> str:
@@ -50,19 +57,59 @@ def create_manuscript(title: str, author: str) -> str:
     Returns:
         str: ID of the created manuscript
     """
-    id = generate_id()
-    manuscript = {
-        MANU_ID: id,
-        TITLE: title,
-        AUTHOR: author,
-        flds.REFEREES: [],  # Initialize as empty list for referee assignments
-        CURR_STATE: query.SUBMITTED  # all start as submitted
-    }
-    manu_id = dbc.create(MANU_COLLECT, manuscript)
-    if manu_id is None:
-        raise ValueError("Failed to create manuscript")
-    else:
-        return id
+    manuscript = new_manuscript(title, author)
+
+    def insert(manu_id):
+        manuscript[MANU_ID] = manu_id
+        if dbc.create(MANU_COLLECT, manuscript) is None:
+            raise ValueError("Failed to create manuscript")
+
+    return ids.insert_with_id(insert, dbc.DuplicateKeyError)
+
+
+def _id_collision(result: dict) -> bool:
+    return (not result[dbc.OK]
+            and f'{MANU_ID}_' in str(result.get(dbc.ERROR, '')))
+
+
+def create_manuscripts(manuscripts: list) -> list:
+    """
+    Creates many manuscripts in a handful of round trips.
+    IDs are drawn as a block; any that collide with IDs already in use
+    are redrawn and retried, in one more bulk insert per try.
+    Args:
+        manuscripts: list of dicts with TITLE and AUTHOR
+    Returns:
+        list: one bulk result per manuscript, in order, each with the
+              new manuscript's MANU_ID when it was created
+    """
+    docs = [new_manuscript(manu[TITLE], manu[AUTHOR])
+            for manu in manuscripts]
+    results = [None] * len(docs)
+    todo = list(range(len(docs)))
+    for _ in range(ids.MAX_TRIES):
+        for i, manu_id in zip(todo, ids.allocate_block(len(todo))):
+            docs[i][MANU_ID] = manu_id
+        batch = dbc.create_many(MANU_COLLECT, [docs[i] for i in todo])
+        retry = []
+        for i, result in zip(todo, batch):
+            results[i] = result
+            if result[dbc.OK]:
+                result[MANU_ID] = docs[i][MANU_ID]
+            elif _id_collision(result):
+                ids.note_collision()
+                retry.append(i)
+        todo = retry
+        if not todo:
+            break
+    return results
+
+
+def id_space_stats() -> dict:
+    """
+    How full the manuscript ID space is getting.
+    """
+    return ids.get_stats(used=dbc.count(MANU_COLLECT))
 
 
 def read_one(manu_id: str) -> dict:
@@ -77,13 +124,7 @@ def get_manuscript(author: str) -> dict:
     Returns:
         dict: The manuscript document, or None if not found
     """
-    author_manu = []
-    manu_list = read()
-    for manu in manu_list:
-        if manu.get(AUTHOR) == author:
-            author_manu.append(manu)
-    return author_manu
-    # return dbc.read_one(MANU_COLLECT, {MANU_ID: manu_id})
+    return dbc.query(MANU_COLLECT, {AUTHOR: author}, no_id=False)
 
 
 def read() -> dict:
@@ -94,11 +135,15 @@ def read() -> dict:
     Returns:
         dict: dictionary of users keyed by email
     """
-    manu_list = []
-    for manu in dbc.fetch_all(MANU_COLLECT):
-        dbc.convert_mongo_id(manu)
-        manu_list.append(manu)
-    return manu_list
+    return dbc.query(MANU_COLLECT, no_id=False)
+
+
+def iter_manuscripts(batch_size: int = None):
+    """
+    Yields the manuscripts one at a time, in the shape read() returns
+    them, without loading the whole collection.
+    """
+    return dbc.iter_query(MANU_COLLECT, batch_size=batch_size, no_id=False)
 
 
 def update_manuscript(manu_id: str, updates: dict) -> bool:
@@ -154,31 +199,194 @@ def delete_ref(manu: dict, referee: str) -> str:
 
 FUNC = 'f'
 
+# referee verdicts, per manu.md
+ACCEPT = 'ACCEPT'
+ACCEPT_W_REV = 'ACCEPT_W_REV'
+REJECT = 'REJECT'
+VERDICTS = [ACCEPT, ACCEPT_W_REV, REJECT]
+
+REPORTS_REF = f'{flds.REFEREE_REPORTS}.{flds.REFEREE}'
+
 
-def handle_action(manu_id, curr_state, action, **kwargs) -> str:
+class StaleStateError(ValueError):
     """
-    Handle an action on a manuscript.
+    The manuscript is no longer in the state (or at the version) the
+    caller saw: someone else acted on it first.
+    """
+
+
+def bump_version(update):
+    """
+    Add a version increment to a Mongo update or update pipeline.
+    """
+    if isinstance(update, list):
+        return update + [{'$set': {VERSION: {
+            '$add': [{'$ifNull': [f'${VERSION}', 0]}, 1]}}}]
+    update = dict(update)
+    update['$inc'] = dict(update.get('$inc', {}), **{VERSION: 1})
+    return update
+
+
+def transition_filter(manu_id, curr_state, version=None,
+                      extra=None) -> dict:
+    """
+    Match the manuscript only while it is still in curr_state (and, if
+    given, at this version).
+    """
+    filt = dict(extra or {})
+    filt.update({MANU_ID: manu_id, CURR_STATE: curr_state})
+    if version is not None:
+        filt[VERSION] = version
+    return filt
+
+
+def check_transition_miss(manus, manu_id, curr_state, version=None,
+                          **kwargs):
+    """
+    A transition matched nothing: raise the error that says why, given
+    the manuscript as it is now (or None).
     """
-    # Get the manuscript from the database instead of using SAMPLE_MANU
-    manus = read_one(manu_id)
     if not manus:
         raise ValueError(f'Manuscript not found: {manu_id}')
+    if manus.get(CURR_STATE) != curr_state:
+        raise StaleStateError(f'Manuscript {manu_id} is now in '
+                              f'{manus.get(CURR_STATE)}, not {curr_state}')
+    if version is not None and manus.get(VERSION, 0) != version:
+        raise StaleStateError(f'Manuscript {manu_id} is now at version '
+                              f'{manus.get(VERSION, 0)}, not {version}')
+    ref = kwargs.get('ref')
+    if ref in manus.get(flds.REFEREES, []):
+        raise StaleStateError(f'Referees of {manu_id} changed; try again')
+    raise ValueError(f'{ref} is not a referee of {manu_id}')
+
+
+def handle_action(manu_id, curr_state, action, version=None,
+                  **kwargs) -> str:
+    """
+    Handle an action on a manuscript.
+    The transition is checked and applied by the server in one round
+    trip: the update only matches while the manuscript is still in
+    curr_state (and at `version`, if given), so two concurrent actions
+    cannot both apply. Every transition bumps the manuscript's VERSION.
+    ASSIGN_REF's referee data (`extra`) is checked first and written by
+    the same update.
+    Raises:
+        ValueError: for an unknown manuscript, state or action, a
+            missing referee, or bad referee data
+        StaleStateError: if the manuscript has moved on since the
+            caller read it
+    """
+    for extra, update in action_updates(curr_state, action, **kwargs):
+        filt = transition_filter(manu_id, curr_state, version, extra)
+        manus = dbc.find_and_update(MANU_COLLECT, filt, bump_version(update))
+        if manus is not None:
+            break
+    else:
+        check_transition_miss(read_one(manu_id), manu_id, curr_state,
+                              version, **kwargs)
+    return manus[CURR_STATE]
 
-    if curr_state not in query.STATE_TABLE:
-        raise ValueError(f'Action not available: {curr_state}')
-    if action not in query.STATE_TABLE[curr_state]:
-        raise ValueError(f'{action} not available in {curr_state}')
-    # Execute the action and get the new state
-
-    new_state = query.STATE_TABLE[curr_state][action][FUNC](
-                                            manuscript=manus, **kwargs)
-    # Update the manuscript in database with both state and any modified fields
-    updates = {
-        CURR_STATE: new_state,
-        flds.REFEREES: manus[flds.REFEREES]  # Include the updated ref list
-    }
-    update_manuscript(manu_id, updates)
-    return new_state
+
+def merge_updates(update: dict, more: dict) -> dict:
+    """
+    Combine two Mongo updates (of operators) that touch different fields.
+    """
+    merged = {op: dict(fields) for op, fields in update.items()}
+    for op, fields in more.items():
+        merged.setdefault(op, {}).update(fields)
+    return merged
+
+
+def action_updates(curr_state: str, action: str, **kwargs) -> list:
+    """
+    query.transition_updates(), plus, for ASSIGN_REF with referee data
+    in `extra`, the write of that referee's report, so the transition
+    and the report are one update. The report is checked before
+    anything is written.
+    """
+    referee_data = kwargs.get('extra')
+    fields = {}
+    if action == query.ASSIGN_REF and referee_data:
+        fields = _report_fields(referee_data.get(flds.REPORT),
+                                referee_data.get(flds.VERDICT))
+    updates = query.transition_updates(curr_state, action, **kwargs)
+    if not fields:
+        return updates
+    # A referee being assigned seldom has a report yet: try the push first.
+    reports = report_updates(kwargs['ref'], fields)[::-1]
+    return [(dict(extra, **report_extra), merge_updates(update, report))
+            for extra, update in updates
+            for report_extra, report in reports]
+
+
+def _report_fields(report=None, verdict=None) -> dict:
+    if verdict is not None and verdict not in VERDICTS:
+        raise ValueError(f'Bad verdict: {verdict}; valid: {VERDICTS}')
+    fields = {}
+    if report is not None:
+        fields[flds.REPORT] = report
+    if verdict is not None:
+        fields[flds.VERDICT] = verdict
+    return fields
+
+
+def report_updates(ref: str, fields: dict) -> list:
+    """
+    Return the (extra filter, update) pairs that record fields in ref's
+    report: set in ref's entry, through the positional operator, if it
+    has one; else push a new entry. Their filters are mutually
+    exclusive.
+    """
+    return [
+        ({REPORTS_REF: ref},
+         {'$set': {f'{flds.REFEREE_REPORTS}.$.{fld}': val
+                   for fld, val in fields.items()}}),
+        ({REPORTS_REF: {'$ne': ref}},
+         {'$push': {flds.REFEREE_REPORTS: dict(fields,
+                                               **{flds.REFEREE: ref})}}),
+    ]
+
+
+def referee_report_writes(manu_id: str, ref: str, fields: dict) -> tuple:
+    """
+    Return the (filter, update) that sets fields in ref's existing
+    report entry, and the (filter, update) that pushes a new entry for
+    ref, if ref is a referee of the manuscript.
+    """
+    (set_extra, set_update), (push_extra, push_update) = report_updates(
+        ref, fields)
+    return (dict(set_extra, **{MANU_ID: manu_id}), set_update), \
+        (dict(push_extra, **{MANU_ID: manu_id, flds.REFEREES: ref}),
+         push_update)
+
+
+def set_referee_report(manu_id: str, ref: str, report: str = None,
+                       verdict: str = None) -> bool:
+    """
+    Record a referee's report and/or verdict on a manuscript.
+    Only that referee's entry is written, through the positional
+    operator, so referees filing at the same time do not conflict.
+    Returns:
+        bool: True once recorded
+    Raises:
+        ValueError: if ref is not a referee of the manuscript, or the
+            verdict is not one of VERDICTS
+    """
+    fields = _report_fields(report, verdict)
+    if not fields:
+        return True
+    set_write, push_write = referee_report_writes(manu_id, ref, fields)
+    for _ in range(2):
+        if dbc.update_ops(MANU_COLLECT, *set_write).matched_count:
+            return True
+        # first report from this referee: add their entry, unless a
+        # concurrent call just did, in which case go round again
+        if dbc.update_ops(MANU_COLLECT, *push_write).matched_count:
+            return True
+        if not dbc.read_one(MANU_COLLECT, {MANU_ID: manu_id,
+                                           flds.REFEREES: ref}):
+            break
+    raise ValueError(f'{ref} is not a referee of {manu_id}')
 
 
 def sort_manuscripts_by_state() -> list:
@@ -211,6 +419,61 @@ def sort_manuscripts_by_state() -> list:
     return sorted_manuscripts
 
 
+def read_page(cursor: str = None, limit: int = None) -> tuple:
+    """
+    Reads one page of manuscripts, in manu_id order.
+    Returns:
+        tuple: (list of manuscripts, token for the next page or None)
+    """
+    after = pg.decode_cursor(cursor, (str,))[0] if cursor else None
+    manus, more = dbc.read_page(MANU_COLLECT, MANU_ID, after=after,
+                                limit=pg.page_size(limit), no_id=False)
+    next_cursor = pg.encode_cursor([manus[-1][MANU_ID]]) if more else None
+    return manus, next_cursor
+
+
+def _state_filter(rank: int) -> dict:
+    """
+    The filter for manuscripts in the state at this rank of the workflow
+    order; the rank past the last state holds any invalid states.
+    """
+    if rank < len(query.VALID_STATES):
+        return {CURR_STATE: query.VALID_STATES[rank]}
+    return {CURR_STATE: {'$nin': query.VALID_STATES}}
+
+
+def read_sorted_page(cursor: str = None, limit: int = None) -> tuple:
+    """
+    Reads one page of manuscripts in the order sort_manuscripts_by_state()
+    gives, keyed on (state rank, manu_id).
+    Each state is read as a range of the (curr_state, manu_id) index,
+    so a page costs the same wherever it starts.
+    Returns:
+        tuple: (list of manuscripts, token for the next page or None)
+    """
+    limit = pg.page_size(limit)
+    rank, after = 0, None
+    if cursor:
+        rank, after = pg.decode_cursor(cursor, (int, str))
+        if not 0 <= rank <= len(query.VALID_STATES):
+            raise ValueError(f'Bad page cursor: {cursor}')
+    manus = []
+    ranks = []
+    # read one extra manuscript to learn whether there is a next page
+    while rank <= len(query.VALID_STATES) and len(manus) <= limit:
+        docs, _ = dbc.read_page(MANU_COLLECT, MANU_ID, after=after,
+                                limit=limit + 1 - len(manus),
+                                filt=_state_filter(rank), no_id=False)
+        manus.extend(docs)
+        ranks.extend([rank] * len(docs))
+        rank, after = rank + 1, None
+    if len(manus) <= limit:
+        return manus, None
+    next_cursor = pg.encode_cursor([ranks[limit - 1],
+                                    manus[limit - 1][MANU_ID]])
+    return manus[:limit], next_cursor
+
+
 def filter_manuscripts_by_state(state: str) -> list:
     """
     Filters manuscripts to only those in a specific state.
@@ -224,10 +487,6 @@ def filter_manuscripts_by_state(state: str) -> list:
     if state not in query.VALID_STATES:
         raise ValueError(f"Valid states: {query.VALID_STATES}")
 
-    # Get all manuscripts
-    manuscripts = read()
-
-    # Filter to only those in the specified state
-    filtered_manuscripts = [m for m in manuscripts if m[CURR_STATE] == state]
-
-    return filtered_manuscripts
+    # Let the DB do the filtering so only matching manuscripts are sent
+    return dbc.query(MANU_COLLECT, {CURR_STATE: state}, no_id=False,
+                     cached=True)
@@ -1,7 +1,9 @@
 # masthead.py
 
-from data.people import has_role, read, NAME, EMAIL, AFFILIATION
+from data.people import (has_role, NAME, EMAIL, AFFILIATION, ROLES,
+                         PEOPLE_COLLECT)
 import data.roles as rls
+import data.db_connect as dbc
 
 MH_FIELDS = [NAME, AFFILIATION]
 
@@ -22,10 +24,13 @@ def get_masthead() -> dict:
     """
     masthead = {}
     mh_roles = rls.get_masthead_roles()
+    # One query for everyone on the masthead, then group them by role.
+    people = dbc.query(PEOPLE_COLLECT, {ROLES: {'$in': list(mh_roles)}},
+                       projection={NAME: 1, EMAIL: 1, ROLES: 1},
+                       cached=True)
     for mh_role, text in mh_roles.items():
         people_w_role = []
-        people = read()
-        for _id, person in people.items():
+        for person in people:
             if has_role(person, mh_role):
                 rec = create_mh_rec(person)
                 people_w_role.append(rec)
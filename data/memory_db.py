@@ -0,0 +1,1092 @@
+"""
+An in-process storage engine that stands in for MongoDB.
+MemoryClient answers the subset of the pymongo API that db_connect uses:
+find (with projection, sort, skip and limit), the single, many and bulk
+writes, and create_index. Filters support equality (including matching
+inside arrays), $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $exists,
+$size, $all, $elemMatch, $and, $or and $nor. Updates support $set,
+$unset, $inc, $push, $addToSet, $pull and $setOnInsert (with the
+positional `$` in paths), and update
+pipelines of $set and $unset stages, whose expressions may use $filter,
+$map, $cond, $size, $in, $ifNull, $add, $concatArrays, $setUnion, and
+the comparison and boolean operators.
+Every index keeps a hash table and a sorted list on its first field,
+so equality, $in and range filters on an indexed field do not scan the
+collection. Unique indexes are enforced.
+AsyncMemoryClient wraps a MemoryClient for data/aio, standing in for
+pymongo.AsyncMongoClient.
+Select it with MONGO_BACKEND=memory.
+"""
+import bisect
+import copy
+import datetime
+import threading
+from types import SimpleNamespace
+
+from bson import ObjectId
+import pymongo as pm
+
+MONGO_ID = '_id'
+ID_INDEX = '_id_'
+DUP_KEY_CODE = 11000
+
+COMPARISONS = {
+    '$gt': lambda a, b: a > b,
+    '$gte': lambda a, b: a >= b,
+    '$lt': lambda a, b: a < b,
+    '$lte': lambda a, b: a <= b,
+}
+RANGE_OPS = set(COMPARISONS)
+
+
+def _type_rank(val) -> int:
+    """
+    Mongo orders values of different types by type first; so do we.
+    """
+    if val is None:
+        return 0
+    if isinstance(val, bool):
+        return 7
+    if isinstance(val, (int, float)):
+        return 1
+    if isinstance(val, str):
+        return 2
+    if isinstance(val, dict):
+        return 3
+    if isinstance(val, (list, tuple)):
+        return 4
+    if isinstance(val, ObjectId):
+        return 6
+    if isinstance(val, datetime.datetime):
+        return 8
+    return 9
+
+
+def sort_key(val):
+    if isinstance(val, dict):
+        return (3, tuple((k, sort_key(v)) for k, v in val.items()))
+    if isinstance(val, (list, tuple)):
+        return (4, tuple(sort_key(v) for v in val))
+    rank = _type_rank(val)
+    if rank == 9:
+        return (rank, repr(val))
+    return (rank, val)
+
+
+def _comparable(a, b) -> bool:
+    return _type_rank(a) == _type_rank(b)
+
+
+def resolve(doc, path: str) -> list:
+    """
+    Return the values found at a dotted path, reaching into arrays of
+    subdocuments as Mongo does. An empty list means the path is missing.
+    """
+    vals = [doc]
+    for part in path.split('.'):
+        nxt = []
+        for val in vals:
+            if isinstance(val, dict):
+                if part in val:
+                    nxt.append(val[part])
+            elif isinstance(val, list):
+                if part.isdigit():
+                    if int(part) < len(val):
+                        nxt.append(val[int(part)])
+                else:
+                    nxt.extend(elem[part] for elem in val
+                               if isinstance(elem, dict) and part in elem)
+        vals = nxt
+    return vals
+
+
+def _expand(vals: list) -> list:
+    """
+    A field matches if its value, or any element of an array value, does.
+    """
+    out = []
+    for val in vals:
+        out.append(val)
+        if isinstance(val, list):
+            out.extend(val)
+    return out
+
+
+def _equals(vals: list, target) -> bool:
+    if target is None and not vals:
+        return True
+    return any(val == target for val in _expand(vals))
+
+
+def _is_operator_dict(cond) -> bool:
+    return (isinstance(cond, dict) and len(cond) > 0
+            and all(k.startswith('$') for k in cond))
+
+
+def _match_elem(elem, cond) -> bool:
+    if _is_operator_dict(cond):
+        return _match_field([elem], cond)
+    if isinstance(elem, dict):
+        return matches(elem, cond)
+    return elem == cond
+
+
+def _match_field(vals: list, cond) -> bool:
+    if not _is_operator_dict(cond):
+        return _equals(vals, cond)
+    for op, arg in cond.items():
+        if op == '$eq':
+            ok = _equals(vals, arg)
+        elif op == '$ne':
+            ok = not _equals(vals, arg)
+        elif op in COMPARISONS:
+            ok = any(_comparable(val, arg) and COMPARISONS[op](val, arg)
+                     for val in _expand(vals))
+        elif op == '$in':
+            ok = any(_equals(vals, target) for target in arg)
+        elif op == '$nin':
+            ok = not any(_equals(vals, target) for target in arg)
+        elif op == '$exists':
+            ok = bool(vals) == bool(arg)
+        elif op == '$size':
+            ok = any(isinstance(val, list) and len(val) == arg
+                     for val in vals)
+        elif op == '$all':
+            ok = all(_equals(vals, target) for target in arg)
+        elif op == '$elemMatch':
+            ok = any(isinstance(val, list)
+                     and any(_match_elem(elem, arg) for elem in val)
+                     for val in vals)
+        else:
+            raise ValueError(f'Unsupported query operator: {op}')
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc: dict, filt: dict) -> bool:
+    """
+    Does doc match the Mongo filter filt?
+    """
+    for field, cond in (filt or {}).items():
+        if field == '$and':
+            ok = all(matches(doc, sub) for sub in cond)
+        elif field == '$or':
+            ok = any(matches(doc, sub) for sub in cond)
+        elif field == '$nor':
+            ok = not any(matches(doc, sub) for sub in cond)
+        elif field.startswith('$'):
+            raise ValueError(f'Unsupported query operator: {field}')
+        else:
+            ok = _match_field(resolve(doc, field), cond)
+        if not ok:
+            return False
+    return True
+
+
+def _parent(doc: dict, path: str, create: bool):
+    """
+    Return (container, last key) for a dotted path.
+    """
+    parts = path.split('.')
+    node = doc
+    for part in parts[:-1]:
+        if isinstance(node, list):
+            node = node[int(part)]
+        else:
+            if part not in node:
+                if not create:
+                    return None, parts[-1]
+                node[part] = {}
+            node = node[part]
+    return node, parts[-1]
+
+
+def _get(doc, path, default=None):
+    node, key = _parent(doc, path, create=False)
+    if node is None:
+        return default
+    if isinstance(node, list):
+        return node[int(key)] if int(key) < len(node) else default
+    return node.get(key, default)
+
+
+def _set(doc, path, val):
+    node, key = _parent(doc, path, create=True)
+    if isinstance(node, list):
+        node[int(key)] = val
+    else:
+        node[key] = val
+
+
+def _unset(doc, path):
+    node, key = _parent(doc, path, create=False)
+    if isinstance(node, dict):
+        node.pop(key, None)
+
+
+def _each(arg) -> list:
+    if isinstance(arg, dict) and '$each' in arg:
+        return list(arg['$each'])
+    return [arg]
+
+
+def _array_at(doc, path) -> list:
+    arr = _get(doc, path)
+    if arr is None:
+        arr = []
+        _set(doc, path, arr)
+    if not isinstance(arr, list):
+        raise pm.errors.OperationFailure(f'{path} is not an array')
+    return arr
+
+
+def _compare(op):
+    return lambda a, b: COMPARISONS[op](sort_key(a), sort_key(b))
+
+
+EXPR_COMPARISONS = {
+    '$eq': lambda a, b: a == b,
+    '$ne': lambda a, b: a != b,
+    '$gt': _compare('$gt'),
+    '$gte': _compare('$gte'),
+    '$lt': _compare('$lt'),
+    '$lte': _compare('$lte'),
+}
+
+
+def evaluate(expr, doc: dict, variables=None):
+    """
+    Evaluate an aggregation expression against doc.
+    """
+    variables = variables or {}
+    if isinstance(expr, str) and expr.startswith('$$'):
+        name, _, path = expr[2:].partition('.')
+        val = variables.get(name)
+        return _get(val, path) if path else val
+    if isinstance(expr, str) and expr.startswith('$'):
+        return _get(doc, expr[1:])
+    if isinstance(expr, list):
+        return [evaluate(e, doc, variables) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if not _is_operator_dict(expr):
+        return {k: evaluate(v, doc, variables) for k, v in expr.items()}
+    (op, arg), = expr.items()
+    if op == '$literal':
+        return arg
+    if op in ('$filter', '$map'):
+        name = arg.get('as', 'this')
+        items = evaluate(arg['input'], doc, variables) or []
+        body = arg['cond'] if op == '$filter' else arg['in']
+        out = []
+        for item in items:
+            val = evaluate(body, doc, dict(variables, **{name: item}))
+            if op == '$map':
+                out.append(val)
+            elif val:
+                out.append(item)
+        return out
+    if op == '$cond':
+        if isinstance(arg, dict):
+            arg = [arg['if'], arg['then'], arg['else']]
+        test, then, other = arg
+        return evaluate(then if evaluate(test, doc, variables) else other,
+                        doc, variables)
+    if op == '$ifNull':
+        for e in arg:
+            val = evaluate(e, doc, variables)
+            if val is not None:
+                return val
+        return None
+    args = evaluate(arg if isinstance(arg, list) else [arg], doc, variables)
+    if op in EXPR_COMPARISONS:
+        return EXPR_COMPARISONS[op](*args)
+    if op == '$size':
+        return len(args[0])
+    if op == '$in':
+        return args[0] in args[1]
+    if op == '$add':
+        return sum(args)
+    if op == '$concatArrays':
+        return [item for arr in args for item in arr]
+    if op == '$setUnion':
+        out = []
+        for item in (item for arr in args for item in arr):
+            if item not in out:
+                out.append(item)
+        return out
+    if op == '$and':
+        return all(args)
+    if op == '$or':
+        return any(args)
+    if op == '$not':
+        return not args[0]
+    raise ValueError(f'Unsupported expression operator: {op}')
+
+
+def apply_pipeline(doc: dict, pipeline: list):
+    """
+    Apply an update pipeline to doc, in place.
+    """
+    for stage in pipeline:
+        (op, arg), = stage.items()
+        if op in ('$set', '$addFields'):
+            vals = {path: evaluate(expr, doc) for path, expr in arg.items()}
+            for path, val in vals.items():
+                _set(doc, path, copy.deepcopy(val))
+        elif op == '$unset':
+            for path in [arg] if isinstance(arg, str) else arg:
+                _unset(doc, path)
+        else:
+            raise ValueError(f'Unsupported pipeline stage: {op}')
+
+
+def _and_terms(filt: dict):
+    """
+    Yield (field, condition) for each term of filt, looking inside $and.
+    """
+    for field, cond in (filt or {}).items():
+        if field == '$and':
+            for sub in cond:
+                yield from _and_terms(sub)
+        else:
+            yield field, cond
+
+
+def _positional_index(doc: dict, filt: dict, array_path: str) -> int:
+    """
+    The index of the first element of the array at array_path that
+    the query filt matched on, for the positional `$` operator.
+    """
+    arr = _get(doc, array_path)
+    if isinstance(arr, list):
+        for field, cond in _and_terms(filt):
+            if field == array_path:
+                if isinstance(cond, dict) and '$elemMatch' in cond:
+                    cond = cond['$elemMatch']
+                hits = [_match_elem(elem, cond) for elem in arr]
+            elif field.startswith(array_path + '.'):
+                sub = field[len(array_path) + 1:]
+                hits = [_match_field(resolve(elem, sub), cond)
+                        for elem in arr]
+            else:
+                continue
+            if True in hits:
+                return hits.index(True)
+    raise pm.errors.OperationFailure(
+        'The positional operator did not find the match needed from '
+        'the query.')
+
+
+def _positional(doc: dict, path: str, filt: dict) -> str:
+    parts = path.split('.')
+    if '$' not in parts:
+        return path
+    i = parts.index('$')
+    parts[i] = str(_positional_index(doc, filt, '.'.join(parts[:i])))
+    return '.'.join(parts)
+
+
+def apply_update(doc: dict, update, is_insert=False, filt=None):
+    """
+    Apply a Mongo update document (or update pipeline) to doc, in place.
+    filt is the query that matched doc, for positional `$` paths.
+    """
+    if isinstance(update, list):
+        apply_pipeline(doc, update)
+        return
+    for op, fields in update.items():
+        if op == '$setOnInsert' and not is_insert:
+            continue
+        for path, arg in fields.items():
+            path = _positional(doc, path, filt)
+            if op in ('$set', '$setOnInsert'):
+                _set(doc, path, copy.deepcopy(arg))
+            elif op == '$unset':
+                _unset(doc, path)
+            elif op == '$inc':
+                _set(doc, path, _get(doc, path, 0) + arg)
+            elif op == '$push':
+                _array_at(doc, path).extend(copy.deepcopy(_each(arg)))
+            elif op == '$addToSet':
+                arr = _array_at(doc, path)
+                for val in _each(arg):
+                    if val not in arr:
+                        arr.append(copy.deepcopy(val))
+            elif op == '$pull':
+                arr = _get(doc, path)
+                if isinstance(arr, list):
+                    arr[:] = [elem for elem in arr
+                              if not _match_elem(elem, arg)]
+            else:
+                raise ValueError(f'Unsupported update operator: {op}')
+
+
+def _upsert_seed(filt: dict) -> dict:
+    """
+    The fields an upsert copies from its filter into the new doc.
+    """
+    doc = {}
+    for field, cond in (filt or {}).items():
+        if field.startswith('$'):
+            continue
+        if _is_operator_dict(cond):
+            if '$eq' in cond:
+                _set(doc, field, copy.deepcopy(cond['$eq']))
+        else:
+            _set(doc, field, copy.deepcopy(cond))
+    return doc
+
+
+def project(doc: dict, projection) -> dict:
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    keep_id = projection.get(MONGO_ID, 1)
+    fields = {f: v for f, v in projection.items() if f != MONGO_ID}
+    if any(fields.values()):
+        out = {}
+        for field in fields:
+            vals = resolve(doc, field)
+            if vals:
+                _set(out, field, vals[0])
+    else:
+        out = dict(doc)
+        for field in fields:
+            _unset(out, field)
+    if keep_id and MONGO_ID in doc:
+        out[MONGO_ID] = doc[MONGO_ID]
+    else:
+        out.pop(MONGO_ID, None)
+    return out
+
+
+class Index:
+    """
+    A secondary index: a hash table and a sorted list of the values of
+    its first field (each element, for arrays), plus a map of full key
+    tuples when the index is unique.
+    """
+    def __init__(self, name: str, keys: list, unique=False):
+        self.name = name
+        self.keys = keys
+        self.field = keys[0][0]
+        self.unique = unique
+        self.hashed = {}
+        self.sorted_keys = []
+        self.sorted_ids = []
+        self.unique_keys = {}
+
+    def info(self) -> dict:
+        info = {'v': 2, 'key': list(self.keys)}
+        if self.unique:
+            info['unique'] = True
+        return info
+
+    def _first_vals(self, doc) -> list:
+        vals = resolve(doc, self.field)
+        if not vals:
+            return [None]
+        out = []
+        for val in vals:
+            if isinstance(val, list):
+                out.extend(val if val else [None])
+            else:
+                out.append(val)
+        return out
+
+    def _full_key(self, doc) -> tuple:
+        return tuple(sort_key(_get(doc, field)) for field, _ in self.keys)
+
+    def conflicts(self, doc, doc_id) -> bool:
+        if not self.unique:
+            return False
+        owner = self.unique_keys.get(self._full_key(doc))
+        return owner is not None and owner != doc_id
+
+    def add(self, doc, doc_id):
+        for val in self._first_vals(doc):
+            skey = sort_key(val)
+            self.hashed.setdefault(skey, set()).add(doc_id)
+            pos = bisect.bisect_right(self.sorted_keys, skey)
+            self.sorted_keys.insert(pos, skey)
+            self.sorted_ids.insert(pos, doc_id)
+        if self.unique:
+            self.unique_keys[self._full_key(doc)] = doc_id
+
+    def remove(self, doc, doc_id):
+        for val in self._first_vals(doc):
+            skey = sort_key(val)
+            ids = self.hashed.get(skey)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self.hashed[skey]
+            lo = bisect.bisect_left(self.sorted_keys, skey)
+            hi = bisect.bisect_right(self.sorted_keys, skey)
+            for pos in range(lo, hi):
+                if self.sorted_ids[pos] == doc_id:
+                    del self.sorted_keys[pos]
+                    del self.sorted_ids[pos]
+                    break
+        if self.unique:
+            key = self._full_key(doc)
+            if self.unique_keys.get(key) == doc_id:
+                del self.unique_keys[key]
+
+    def _range(self, cond: dict) -> set:
+        """
+        Range ops only match values of the bound's own type, so each
+        bound also clips the scan to that type's stretch of the list.
+        """
+        lo, hi = 0, len(self.sorted_keys)
+        for op in RANGE_OPS & set(cond):
+            skey = sort_key(cond[op])
+            type_lo = bisect.bisect_left(self.sorted_keys, (skey[0],))
+            type_hi = bisect.bisect_left(self.sorted_keys, (skey[0] + 1,))
+            if op == '$gt':
+                lo = max(lo, bisect.bisect_right(self.sorted_keys, skey))
+            elif op == '$gte':
+                lo = max(lo, bisect.bisect_left(self.sorted_keys, skey))
+            elif op == '$lt':
+                hi = min(hi, bisect.bisect_left(self.sorted_keys, skey))
+            else:
+                hi = min(hi, bisect.bisect_right(self.sorted_keys, skey))
+            lo, hi = max(lo, type_lo), min(hi, type_hi)
+        return set(self.sorted_ids[lo:hi])
+
+    def lookup(self, cond):
+        """
+        Return the ids that may match cond on our first field, or None
+        if this index cannot narrow the search.
+        """
+        if not _is_operator_dict(cond):
+            if isinstance(cond, (dict, list)):
+                return None
+            return set(self.hashed.get(sort_key(cond), ()))
+        if '$eq' in cond:
+            return self.lookup(cond['$eq'])
+        if '$in' in cond:
+            ids = set()
+            for target in cond['$in']:
+                if isinstance(target, (dict, list)):
+                    return None
+                ids |= self.hashed.get(sort_key(target), set())
+            return ids
+        if RANGE_OPS & set(cond):
+            return self._range(cond)
+        return None
+
+
+class Cursor:
+    """
+    A lazily evaluated find: sort, skip and limit chain as in pymongo.
+    """
+    def __init__(self, collection, filt, projection):
+        self._collection = collection
+        self._filter = filt or {}
+        self._projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None):
+        if isinstance(key_or_list, str):
+            key_or_list = [(key_or_list, direction or pm.ASCENDING)]
+        self._sort = list(key_or_list)
+        return self
+
+    def skip(self, n: int):
+        self._skip = n
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int):
+        return self
+
+    def close(self):
+        pass
+
+    def explain(self) -> dict:
+        return self._collection.explain(self._filter, self._sort)
+
+    def __iter__(self):
+        docs = self._collection._find_docs(self._filter)
+        if self._sort:
+            for field, direction in reversed(self._sort):
+                docs.sort(key=lambda doc: sort_key(_get(doc, field)),
+                          reverse=direction == pm.DESCENDING)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        for doc in docs:
+            yield project(copy.deepcopy(doc), self._projection)
+
+
+class Collection:
+    def __init__(self, name: str):
+        self.name = name
+        self._docs = {}
+        self._seq = {}
+        self._indexes = {}
+        self._lock = threading.RLock()
+        self._next_seq = 0
+
+    # indexes
+
+    def create_index(self, keys, name=None, unique=False, **kwargs):
+        if isinstance(keys, str):
+            keys = [(keys, pm.ASCENDING)]
+        keys = list(keys)
+        name = name or '_'.join(f'{f}_{d}' for f, d in keys)
+        with self._lock:
+            if name in self._indexes:
+                return name
+            index = Index(name, keys, unique=unique)
+            for doc_id, doc in self._docs.items():
+                if index.conflicts(doc, doc_id):
+                    raise pm.errors.DuplicateKeyError(
+                        f'E11000 duplicate key building {name}',
+                        DUP_KEY_CODE)
+                index.add(doc, doc_id)
+            self._indexes[name] = index
+        return name
+
+    def index_information(self) -> dict:
+        with self._lock:
+            info = {ID_INDEX: {'v': 2, 'key': [(MONGO_ID, 1)]}}
+            for name, index in self._indexes.items():
+                info[name] = index.info()
+            return info
+
+    def drop_index(self, name: str):
+        with self._lock:
+            del self._indexes[name]
+
+    # reads
+
+    def _plan(self, filt: dict):
+        """
+        Return (index name, candidate ids) for the most selective usable
+        index, or (None, None) to scan the whole collection. An $or whose
+        every branch can use an index is answered by the union of their
+        candidates, with a tuple of the branches' index names.
+        """
+        if MONGO_ID in filt and not isinstance(filt[MONGO_ID], dict):
+            ids = {filt[MONGO_ID]} if filt[MONGO_ID] in self._docs else set()
+            return ID_INDEX, ids
+        best_name, best = None, None
+        for index in self._indexes.values():
+            if index.field in filt:
+                ids = index.lookup(filt[index.field])
+                if ids is not None and (best is None or len(ids) < len(best)):
+                    best_name, best = index.name, ids
+        if best is None and filt.get('$or'):
+            plans = [self._plan(branch) for branch in filt['$or']]
+            if all(name is not None for name, _ in plans):
+                return (tuple(name for name, _ in plans),
+                        set().union(*(ids for _, ids in plans)))
+        return best_name, best
+
+    def _sort_index(self, filt: dict, sort):
+        """
+        Return an index whose order gives `sort`, once any leading fields
+        that filt pins to one value are skipped, or None. Of several,
+        prefer the one that skips the most pinned fields.
+        """
+        if not sort:
+            return None
+        sort = list(sort)
+        sort_fields = [field for field, _ in sort]
+        pinned = {field for field, cond in filt.items()
+                  if not field.startswith('$') and field not in sort_fields
+                  and (not _is_operator_dict(cond) or '$eq' in cond)}
+        best, best_skipped = None, -1
+        for index in self._indexes.values():
+            keys = list(index.keys)
+            while keys and keys[0][0] in pinned:
+                keys = keys[1:]
+            skipped = len(index.keys) - len(keys)
+            keys = keys[:len(sort)]
+            if [field for field, _ in keys] != sort_fields:
+                continue
+            signs = {direction * want for (_, direction), (_, want)
+                     in zip(keys, sort)}
+            if len(signs) == 1 and skipped > best_skipped:
+                best, best_skipped = index, skipped
+        return best
+
+    def explain(self, filt: dict, sort=None) -> dict:
+        """
+        Describe how a find would run, in the shape of Mongo's explain
+        output: the winning plan's stages and the execution stats.
+        """
+        with self._lock:
+            name, ids = self._plan(filt)
+            sort_index = self._sort_index(filt, sort)
+            if sort_index is not None and (name is None
+                                           or sort_index.field in filt):
+                name = sort_index.name
+                ids = sort_index.lookup(filt[sort_index.field]) \
+                    if sort_index.field in filt else None
+                if ids is None:
+                    ids = set(self._docs)
+                sorted_by_index = True
+            else:
+                sorted_by_index = False
+            examined = len(self._docs) if ids is None else len(ids)
+            returned = len(self._find_docs(filt))
+        if name is None:
+            plan = {'stage': 'COLLSCAN'}
+        elif isinstance(name, tuple):
+            plan = {'stage': 'FETCH',
+                    'inputStage': {'stage': 'OR', 'inputStages': [
+                        {'stage': 'IXSCAN', 'indexName': branch}
+                        for branch in name]}}
+        else:
+            plan = {'stage': 'FETCH',
+                    'inputStage': {'stage': 'IXSCAN', 'indexName': name}}
+        if sort and not sorted_by_index:
+            plan = {'stage': 'SORT', 'inputStage': plan}
+        return {'queryPlanner': {'winningPlan': plan},
+                'executionStats': {'nReturned': returned,
+                                   'totalDocsExamined': examined}}
+
+    def _find_docs(self, filt: dict) -> list:
+        with self._lock:
+            _, ids = self._plan(filt)
+            if ids is None:
+                candidates = self._docs.values()
+            else:
+                # keep insertion order, as a collection scan would
+                candidates = [self._docs[i] for i in
+                              sorted(ids, key=self._seq.__getitem__)]
+            return [doc for doc in candidates if matches(doc, filt)]
+
+    def find(self, filt=None, projection=None):
+        return Cursor(self, filt, projection)
+
+    def find_one(self, filt=None, projection=None):
+        for doc in self.find(filt, projection).limit(1):
+            return doc
+        return None
+
+    def count_documents(self, filt=None) -> int:
+        return len(self._find_docs(filt or {}))
+
+    # writes
+
+    def _check_unique(self, doc, doc_id):
+        for index in self._indexes.values():
+            if index.conflicts(doc, doc_id):
+                raise pm.errors.DuplicateKeyError(
+                    f'E11000 duplicate key error collection: {self.name} '
+                    f'index: {index.name}', DUP_KEY_CODE)
+
+    def _insert(self, doc: dict):
+        doc.setdefault(MONGO_ID, ObjectId())
+        stored = copy.deepcopy(doc)
+        doc_id = stored[MONGO_ID]
+        if doc_id in self._docs:
+            raise pm.errors.DuplicateKeyError(
+                f'E11000 duplicate key error collection: {self.name} '
+                f'index: {ID_INDEX}', DUP_KEY_CODE)
+        self._check_unique(stored, doc_id)
+        self._docs[doc_id] = stored
+        self._seq[doc_id] = self._next_seq
+        self._next_seq += 1
+        for index in self._indexes.values():
+            index.add(stored, doc_id)
+        return doc_id
+
+    def _replace(self, old: dict, new: dict):
+        doc_id = old[MONGO_ID]
+        new[MONGO_ID] = doc_id
+        self._check_unique(new, doc_id)
+        for index in self._indexes.values():
+            index.remove(old, doc_id)
+        self._docs[doc_id] = new
+        for index in self._indexes.values():
+            index.add(new, doc_id)
+
+    def insert_one(self, doc: dict):
+        with self._lock:
+            return SimpleNamespace(inserted_id=self._insert(doc),
+                                   acknowledged=True)
+
+    def insert_many(self, docs: list, ordered=True):
+        ops = [pm.InsertOne(doc) for doc in docs]
+        self.bulk_write(ops, ordered=ordered)
+        return SimpleNamespace(inserted_ids=[doc[MONGO_ID] for doc in docs],
+                               acknowledged=True)
+
+    def _update(self, filt, update, upsert=False, many=False):
+        with self._lock:
+            docs = self._find_docs(filt or {})
+            if not many:
+                docs = docs[:1]
+            modified = 0
+            for old in docs:
+                new = copy.deepcopy(old)
+                apply_update(new, update, filt=filt)
+                if new != old:
+                    self._replace(old, new)
+                    modified += 1
+            upserted_id = None
+            if not docs and upsert:
+                new = _upsert_seed(filt)
+                apply_update(new, update, is_insert=True)
+                upserted_id = self._insert(new)
+            return SimpleNamespace(matched_count=len(docs),
+                                   modified_count=modified,
+                                   upserted_id=upserted_id,
+                                   acknowledged=True)
+
+    def find_one_and_update(self, filt, update, projection=None, sort=None,
+                            upsert=False,
+                            return_document=pm.ReturnDocument.BEFORE,
+                            **kwargs):
+        with self._lock:
+            docs = self._find_docs(filt or {})
+            if sort:
+                for field, direction in reversed(list(sort)):
+                    docs.sort(key=lambda doc: sort_key(_get(doc, field)),
+                              reverse=direction == pm.DESCENDING)
+            if docs:
+                old = docs[0]
+                new = copy.deepcopy(old)
+                apply_update(new, update, filt=filt)
+                if new != old:
+                    self._replace(old, new)
+                found = new if return_document else old
+            elif upsert:
+                new = _upsert_seed(filt)
+                apply_update(new, update, is_insert=True)
+                self._insert(new)
+                found = new if return_document else None
+            else:
+                found = None
+            if found is None:
+                return None
+            return project(copy.deepcopy(found), projection)
+
+    def update_one(self, filt, update, upsert=False, **kwargs):
+        return self._update(filt, update, upsert=upsert)
+
+    def update_many(self, filt, update, upsert=False, **kwargs):
+        return self._update(filt, update, upsert=upsert, many=True)
+
+    def _delete(self, filt, many=False):
+        with self._lock:
+            docs = self._find_docs(filt or {})
+            if not many:
+                docs = docs[:1]
+            for doc in docs:
+                for index in self._indexes.values():
+                    index.remove(doc, doc[MONGO_ID])
+                del self._docs[doc[MONGO_ID]]
+                del self._seq[doc[MONGO_ID]]
+            return SimpleNamespace(deleted_count=len(docs),
+                                   acknowledged=True)
+
+    def delete_one(self, filt):
+        return self._delete(filt)
+
+    def delete_many(self, filt):
+        return self._delete(filt, many=True)
+
+    def _run_op(self, op):
+        """
+        Run one pymongo bulk op; returns (kind, upserted id or None).
+        """
+        if isinstance(op, pm.InsertOne):
+            self._insert(op._doc)
+            return 'inserted', None
+        if isinstance(op, (pm.UpdateOne, pm.UpdateMany)):
+            res = self._update(op._filter, op._doc, upsert=op._upsert,
+                               many=isinstance(op, pm.UpdateMany))
+            return 'updated', res
+        if isinstance(op, (pm.DeleteOne, pm.DeleteMany)):
+            res = self._delete(op._filter,
+                               many=isinstance(op, pm.DeleteMany))
+            return 'deleted', res
+        raise ValueError(f'Unsupported bulk op: {op}')
+
+    def bulk_write(self, ops: list, ordered=True):
+        counts = {'inserted': 0, 'matched': 0, 'modified': 0, 'deleted': 0}
+        upserted = {}
+        errors = []
+        with self._lock:
+            for i, op in enumerate(ops):
+                try:
+                    kind, res = self._run_op(op)
+                except pm.errors.DuplicateKeyError as err:
+                    errors.append({'index': i, 'code': DUP_KEY_CODE,
+                                   'errmsg': str(err)})
+                    if ordered:
+                        break
+                    continue
+                if kind == 'inserted':
+                    counts['inserted'] += 1
+                elif kind == 'updated':
+                    counts['matched'] += res.matched_count
+                    counts['modified'] += res.modified_count
+                    if res.upserted_id is not None:
+                        upserted[i] = res.upserted_id
+                else:
+                    counts['deleted'] += res.deleted_count
+        if errors:
+            raise pm.errors.BulkWriteError({
+                'writeErrors': errors,
+                'upserted': [{'index': i, '_id': _id}
+                             for i, _id in upserted.items()],
+                'nInserted': counts['inserted'],
+            })
+        return SimpleNamespace(inserted_count=counts['inserted'],
+                               matched_count=counts['matched'],
+                               modified_count=counts['modified'],
+                               deleted_count=counts['deleted'],
+                               upserted_ids=upserted,
+                               acknowledged=True)
+
+    def drop(self):
+        with self._lock:
+            self._docs.clear()
+            self._seq.clear()
+            self._indexes.clear()
+
+
+class Database:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> Collection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = Collection(name)
+            return self._collections[name]
+
+    def command(self, cmd, *args, **kwargs) -> dict:
+        if cmd == 'ping':
+            return {'ok': 1.0}
+        raise pm.errors.OperationFailure(f'Unsupported command: {cmd}')
+
+    def list_collection_names(self) -> list:
+        return list(self._collections)
+
+    def drop_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+
+
+class MemoryClient:
+    """
+    Stands in for pymongo.MongoClient: client[db][collection].
+    """
+    def __init__(self, *args, **kwargs):
+        self._dbs = {}
+        self._lock = threading.Lock()
+        self.admin = Database('admin')
+
+    def __getitem__(self, name: str) -> Database:
+        with self._lock:
+            if name not in self._dbs:
+                self._dbs[name] = Database(name)
+            return self._dbs[name]
+
+    def drop_database(self, name: str):
+        with self._lock:
+            self._dbs.pop(name, None)
+
+    def close(self):
+        pass
+
+
+class AsyncCursor:
+    """
+    A Cursor for async for, standing in for pymongo's AsyncCursor.
+    """
+    def __init__(self, cursor: Cursor):
+        self._cursor = cursor
+        self._it = None
+
+    def sort(self, key_or_list, direction=None):
+        self._cursor.sort(key_or_list, direction)
+        return self
+
+    def skip(self, n: int):
+        self._cursor.skip(n)
+        return self
+
+    def limit(self, n: int):
+        self._cursor.limit(n)
+        return self
+
+    def batch_size(self, n: int):
+        return self
+
+    async def close(self):
+        pass
+
+    def __aiter__(self):
+        self._it = iter(self._cursor)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncCollection:
+    """
+    A Collection whose calls are awaited, as on pymongo's
+    AsyncCollection. Each call runs at once: none of them does I/O.
+    """
+    def __init__(self, collection: Collection):
+        self._collection = collection
+
+    def find(self, filt=None, projection=None) -> AsyncCursor:
+        return AsyncCursor(self._collection.find(filt, projection))
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncDatabase:
+    def __init__(self, db: Database):
+        self._db = db
+
+    def __getitem__(self, name: str) -> AsyncCollection:
+        return AsyncCollection(self._db[name])
+
+    async def command(self, cmd, *args, **kwargs) -> dict:
+        return self._db.command(cmd, *args, **kwargs)
+
+
+class AsyncMemoryClient:
+    """
+    Stands in for pymongo.AsyncMongoClient. Pass the sync layer's
+    MemoryClient to share its data, as both layers would share a server.
+    """
+    def __init__(self, client: MemoryClient = None):
+        self._client = client if client is not None else MemoryClient()
+        self.admin = AsyncDatabase(self._client.admin)
+
+    def __getitem__(self, name: str) -> AsyncDatabase:
+        return AsyncDatabase(self._client[name])
+
+    async def close(self):
+        pass
@@ -0,0 +1,315 @@
+"""
+Timing and counters for data layer operations.
+db_connect and aio/db_connect wrap every call that goes to Mongo with
+timed(). For each collection and operation we keep a latency histogram,
+call and document counts, and a count of each filter shape seen. Calls
+slower than SLOW_QUERY_MS go to the slow query log with the endpoint
+that made them.
+Sizing results means encoding them to BSON again, which on a big read
+costs about as much as the read's own decoding. So it is off by default:
+DB_METRICS_BYTE_SAMPLE=N sizes the results of 1 call in N, and counts
+those calls as sized, so bytes / sized is the mean result size.
+"""
+from collections import deque
+import contextvars
+from functools import wraps
+import inspect
+import itertools
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+import os
+import threading
+import time
+
+import bson
+
+ENABLED = os.environ.get('DB_METRICS', '1') == '1'
+# size the results of 1 call in this many; 0 never does
+BYTE_SAMPLE = int(os.environ.get('DB_METRICS_BYTE_SAMPLE', '0'))
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+# if set, the slow query log also goes to this file
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG')
+
+# histogram bucket upper bounds, in ms; the last bucket is unbounded
+BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000]
+MAX_SHAPES = 50
+MAX_RECENT_SLOW = 100
+
+# stats fields
+CALLS = 'calls'
+TOTAL_MS = 'total_ms'
+MAX_MS = 'max_ms'
+HISTOGRAM = 'histogram'
+DOCS = 'docs'
+BYTES = 'bytes'
+SIZED = 'sized'
+SHAPES = 'shapes'
+SLOW = 'slow'
+
+# slow log fields
+COLLECTION = 'collection'
+OP = 'op'
+SHAPE = 'shape'
+MS = 'ms'
+ENDPOINT = 'endpoint'
+
+ANY_VALUE = '?'
+
+logger = logging.getLogger('slow_queries')
+logger.setLevel(logging.WARNING)
+if SLOW_QUERY_LOG:
+    handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=1024 * 1024,
+                                  backupCount=5)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    logger.addHandler(handler)
+
+_endpoint = contextvars.ContextVar('endpoint', default=None)
+
+_lock = threading.Lock()
+# 'collection.op' -> stats
+_stats = {}
+_recent_slow = deque(maxlen=MAX_RECENT_SLOW)
+_listeners = []
+_byte_calls = itertools.count()
+
+
+def add_listener(listener):
+    """
+    Call listener(collection, op, filt, args) as each timed call starts,
+    where args maps the call's argument names to the values passed.
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def _notify(collection, op, filt, args):
+    for listener in _listeners:
+        listener(collection, op, filt, args)
+
+
+def set_endpoint(name):
+    """
+    Name the endpoint making data calls in this context; None to clear.
+    """
+    _endpoint.set(name)
+
+
+def get_endpoint():
+    return _endpoint.get()
+
+
+def filter_shape(filt):
+    """
+    Return filt with every value replaced by ANY_VALUE, so that queries
+    differing only in their values have the same shape.
+    """
+    if isinstance(filt, dict):
+        return {k: filter_shape(v) if (k.startswith('$')
+                                       or isinstance(v, dict)) else ANY_VALUE
+                for k, v in filt.items()}
+    if isinstance(filt, (list, tuple)):
+        return [filter_shape(v) for v in filt]
+    return ANY_VALUE
+
+
+def _shape_key(filt) -> str:
+    return json.dumps(filter_shape(filt or {}), sort_keys=True)
+
+
+def _doc_count(result) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    if isinstance(result, int):
+        return result
+    for attr in ('matched_count', 'deleted_count'):
+        count = getattr(result, attr, None)
+        if isinstance(count, int):
+            return count
+    return 1
+
+
+def _size_this_call() -> bool:
+    return BYTE_SAMPLE > 0 and next(_byte_calls) % BYTE_SAMPLE == 0
+
+
+def _doc_bytes(doc) -> int:
+    try:
+        return len(bson.encode(doc))
+    except Exception:
+        return 0
+
+
+def _result_bytes(result) -> int:
+    if isinstance(result, dict):
+        return _doc_bytes(result)
+    if isinstance(result, (list, tuple)):
+        return sum(_doc_bytes(doc) for doc in result if isinstance(doc, dict))
+    return 0
+
+
+def _new_stats() -> dict:
+    return {CALLS: 0, TOTAL_MS: 0.0, MAX_MS: 0.0,
+            HISTOGRAM: [0] * (len(BUCKETS_MS) + 1),
+            DOCS: 0, BYTES: 0, SIZED: 0, SHAPES: {}, SLOW: 0}
+
+
+def _bucket(ms: float) -> int:
+    for i, bound in enumerate(BUCKETS_MS):
+        if ms <= bound:
+            return i
+    return len(BUCKETS_MS)
+
+
+def record(collection, op, filt, ms: float, docs: int, nbytes: int = None):
+    """
+    Add one call to the stats, and to the slow log if it was slow.
+    nbytes is None if the call's results were not sized.
+    """
+    shape = _shape_key(filt)
+    is_slow = ms >= SLOW_QUERY_MS
+    with _lock:
+        stats = _stats.setdefault(f'{collection}.{op}', _new_stats())
+        stats[CALLS] += 1
+        stats[TOTAL_MS] += ms
+        stats[MAX_MS] = max(stats[MAX_MS], ms)
+        stats[HISTOGRAM][_bucket(ms)] += 1
+        stats[DOCS] += docs
+        if nbytes is not None:
+            stats[BYTES] += nbytes
+            stats[SIZED] += 1
+        if shape in stats[SHAPES] or len(stats[SHAPES]) < MAX_SHAPES:
+            stats[SHAPES][shape] = stats[SHAPES].get(shape, 0) + 1
+        if is_slow:
+            stats[SLOW] += 1
+    if is_slow:
+        entry = {COLLECTION: collection, OP: op, SHAPE: shape,
+                 MS: round(ms, 3), DOCS: docs, ENDPOINT: get_endpoint()}
+        with _lock:
+            _recent_slow.append(entry)
+        logger.warning(json.dumps(entry))
+
+
+def _iter_timed(gen, collection, op, filt):
+    """
+    Time a generator over its whole life, but count only the time spent
+    inside it, not in the caller between documents.
+    """
+    elapsed = 0.0
+    docs = 0
+    nbytes = 0 if _size_this_call() else None
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                doc = next(gen)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            docs += 1
+            if nbytes is not None:
+                nbytes += _doc_bytes(doc)
+            yield doc
+    finally:
+        gen.close()
+        record(collection, op, filt, elapsed * 1000, docs, nbytes)
+
+
+def timed(op: str, filt_arg: str = None):
+    """
+    Decorate a data layer function that takes a `collection` argument.
+    Args:
+        op: the operation name to record, e.g. 'find'
+        filt_arg: the name of the argument holding the filter, if any
+    Generator functions are timed across their iteration, and
+    coroutine functions until they return.
+    """
+    def decorate(func):
+        sig = inspect.signature(func)
+        is_gen = inspect.isgeneratorfunction(func)
+        is_async = inspect.iscoroutinefunction(func)
+
+        def call_info(args, kwargs):
+            bound = sig.bind_partial(*args, **kwargs).arguments
+            return (bound.get('collection'),
+                    bound.get(filt_arg) if filt_arg else None, bound)
+
+        if is_gen:
+            @wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                collection, filt, bound = call_info(args, kwargs)
+                _notify(collection, op, filt, bound)
+                if not ENABLED:
+                    return func(*args, **kwargs)
+                return _iter_timed(func(*args, **kwargs), collection, op,
+                                   filt)
+            return gen_wrapper
+
+        def finish(collection, filt, start, result):
+            ms = (time.perf_counter() - start) * 1000
+            record(collection, op, filt, ms, _doc_count(result),
+                   _result_bytes(result) if _size_this_call() else None)
+
+        if is_async:
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                collection, filt, bound = call_info(args, kwargs)
+                _notify(collection, op, filt, bound)
+                if not ENABLED:
+                    return await func(*args, **kwargs)
+                result = None
+                start = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                    return result
+                finally:
+                    finish(collection, filt, start, result)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            collection, filt, bound = call_info(args, kwargs)
+            _notify(collection, op, filt, bound)
+            if not ENABLED:
+                return func(*args, **kwargs)
+            result = None
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                return result
+            finally:
+                finish(collection, filt, start, result)
+        return wrapper
+    return decorate
+
+
+def get_stats() -> dict:
+    """
+    Return a copy of the stats, keyed 'collection.op', plus the most
+    recent slow calls.
+    """
+    with _lock:
+        stats = {name: dict(s, **{HISTOGRAM: list(s[HISTOGRAM]),
+                                  SHAPES: dict(s[SHAPES])})
+                 for name, s in _stats.items()}
+        return {'ops': stats, 'buckets_ms': BUCKETS_MS,
+                'recent_slow': list(_recent_slow)}
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _recent_slow.clear()
+
+
+def after_fork():
+    """
+    A forked child starts with empty stats and a fresh lock.
+    """
+    global _lock
+    _lock = threading.Lock()
+    _stats.clear()
+    _recent_slow.clear()
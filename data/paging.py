@@ -0,0 +1,56 @@
+"""
+Keyset (cursor token) paging.
+A page picks up right after the last key of the page before it, so every
+page is one index range scan, however deep into the results it is.
+The token handed to clients is opaque: base64 of the last key values.
+"""
+import base64
+import binascii
+import json
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+def page_size(limit=None) -> int:
+    """
+    Clamp a requested page size to [1, MAX_PAGE_SIZE].
+    """
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def encode_cursor(key_vals: list) -> str:
+    raw = json.dumps(key_vals, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _is_a(val, kind) -> bool:
+    # JSON has no separate bool, but Python counts True as an int
+    return isinstance(val, kind) and not (kind is int
+                                          and isinstance(val, bool))
+
+
+def decode_cursor(token: str, types: tuple = None) -> list:
+    """
+    Return the key values in a cursor token.
+    Args:
+        token: as from encode_cursor()
+        types: if given, the type each key value must have, in order
+    Raises ValueError if the token is not one of ours, or does not hold
+    one value of each type in types.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        key_vals = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise ValueError(f'Bad page cursor: {token}')
+    if not isinstance(key_vals, list):
+        raise ValueError(f'Bad page cursor: {token}')
+    if types is not None and (
+            len(key_vals) != len(types)
+            or not all(_is_a(val, kind)
+                       for val, kind in zip(key_vals, types))):
+        raise ValueError(f'Bad page cursor: {token}')
+    return key_vals
@@ -1,12 +1,12 @@
 # people.py
 import re
-from werkzeug.security import generate_password_hash, check_password_hash
 
 import data.roles as rls
 from data.roles import PERSON_ROLES
+import data.cascade as cascade
 import data.db_connect as dbc
-
-client = dbc.connect_db()
+import data.paging as pg
+import security.passwords as pw
 
 PEOPLE_COLLECT = 'people'
 MIN_USER_NAME_LEN = 2
@@ -82,12 +82,15 @@ def create(name: str, affiliation: str, email: str, roles: list,
         is_manu_author: if True, password is optional (for manu submissions)
     Returns:
         string: email value in dictionary
+    If the email is already taken, nothing changes and the email is
+    still returned. A password is only hashed once the email is known
+    to be free: that costs one indexed read, against a hash of hundreds
+    of ms. Without a password, the insert and the existence check are
+    one upsert. Either way the upsert, not the read, decides a race.
     """
-    # Check if person already exists
-    existing = read_one(email)
-    if existing:
-        return email
-
+    if password or not is_manu_author:
+        if exists(email):
+            return email
     # Password required unless it's a manuscript author
     if not is_manu_author and not password:
         raise ValueError("Password is required for non-manuscript users")
@@ -100,13 +103,42 @@ def create(name: str, affiliation: str, email: str, roles: list,
             ROLES: roles
         }
         if password:
-            person[PASSWORD] = generate_password_hash(password)
+            person[PASSWORD] = pw.hash_password(password)
 
-        if dbc.create(PEOPLE_COLLECT, person):
-            return email
+        dbc.create_if_absent(PEOPLE_COLLECT, {EMAIL: email}, person)
+        return email
     return None
 
 
+def create_many(people: list) -> list:
+    """
+    Creates many people at once, for seeding and imports.
+    Args:
+        people: list of dicts with NAME, AFFILIATION, EMAIL, ROLES
+                and (optionally) PASSWORD
+    Returns:
+        list: one bulk result per person, in order; people whose email
+              is already taken fail with a duplicate key error
+    """
+    recs = []
+    to_hash = []
+    for person in people:
+        is_valid_person(person[EMAIL], roles=person[ROLES])
+        rec = {
+            NAME: person.get(NAME),
+            AFFILIATION: person.get(AFFILIATION),
+            EMAIL: person[EMAIL],
+            ROLES: person[ROLES]
+        }
+        if person.get(PASSWORD):
+            to_hash.append((rec, person[PASSWORD]))
+        recs.append(rec)
+    hashes = pw.hash_many([password for _, password in to_hash])
+    for (rec, _), hashed in zip(to_hash, hashes):
+        rec[PASSWORD] = hashed
+    return dbc.create_many(PEOPLE_COLLECT, recs)
+
+
 def update(curr_email: str, name: str, affil: str, email: str, roles: list):
     """
     Updates a Person's name, affiliation, roles, or email
@@ -115,15 +147,12 @@ def update(curr_email: str, name: str, affil: str, email: str, roles: list):
         affiliation (str, optional): New affiliation to update.
         email (str): Current email of the person.
         roles (list, optional): New roles to add to roles list.
+    A new email is carried over to every manuscript that refers to
+    the old one.
 
     Returns:
         string: email value in dictionary
     """
-    if not exists(curr_email):
-        raise ValueError(
-            f'Trying to update person that does not exist: '
-            f'{curr_email=}'
-        )
     if is_valid_person(curr_email, roles=roles):
         update_data = {
             NAME: name,
@@ -131,9 +160,18 @@ def update(curr_email: str, name: str, affil: str, email: str, roles: list):
             EMAIL: email,
             ROLES: roles
         }
-        dbc.update(PEOPLE_COLLECT,
-                   {EMAIL: curr_email},
-                   update_data)
+        try:
+            result = dbc.update(PEOPLE_COLLECT,
+                                {EMAIL: curr_email},
+                                update_data)
+        except dbc.DuplicateKeyError:
+            raise ValueError(f'Email already in use: {email=}')
+        if result.matched_count == 0:
+            raise ValueError(
+                f'Trying to update person that does not exist: '
+                f'{curr_email=}'
+            )
+        cascade.rename(curr_email, email)
         return email
 
 
@@ -145,10 +183,36 @@ def read() -> dict:
     Returns:
         dict: dictionary of users keyed by email
     """
-    people = dbc.read_dict(PEOPLE_COLLECT, EMAIL)
+    people = dbc.read_dict(PEOPLE_COLLECT, EMAIL, cached=True)
     return people
 
 
+def iter_people(batch_size: int = None):
+    """
+    Yields (email, person) pairs one at a time, in the shape read()
+    returns them, without loading the whole collection.
+    """
+    return dbc.iter_dict(PEOPLE_COLLECT, EMAIL, batch_size=batch_size)
+
+
+def read_page(cursor: str = None, limit: int = None) -> tuple:
+    """
+    Reads one page of people, in email order.
+    Args:
+        cursor: token from the previous page, or None for the first page
+        limit: page size (capped at paging.MAX_PAGE_SIZE)
+    Returns:
+        tuple: (dict of people keyed by email, token for the next page
+                or None if this is the last page)
+    """
+    after = pg.decode_cursor(cursor, (str,))[0] if cursor else None
+    docs, more = dbc.read_page(PEOPLE_COLLECT, EMAIL, after=after,
+                               limit=pg.page_size(limit))
+    people = {person[EMAIL]: person for person in docs}
+    next_cursor = pg.encode_cursor([docs[-1][EMAIL]]) if more else None
+    return people, next_cursor
+
+
 def read_name(email: str) -> str:
     """Just an easy function to swap out email for name:
     Args:
@@ -157,11 +221,12 @@ def read_name(email: str) -> str:
         str: name of the person
         None: if person does not exist
     """
-    person = read_one(email)
+    person = dbc.query(PEOPLE_COLLECT, {EMAIL: email},
+                       projection={NAME: 1}, limit=1)
     if not person:
         return None
     else:
-        return person.get(NAME)
+        return person[0].get(NAME)
 
 
 def read_one(email: str) -> dict:
@@ -178,31 +243,52 @@ def exists(email: str) -> bool:
 
 def delete(email: str):
     """
-    Deletes given entity Person.
+    Deletes given entity Person, and every manuscript's reference to
+    them as author or referee.
     Returns the person deleted.
     Args:
         string: email
     Returns:
         Bool: DB person entry.
     """
-    if not exists(email):
+    deleted = dbc.delete(PEOPLE_COLLECT, {EMAIL: email})
+    if not deleted:
         raise ValueError(f"Person does not exist: {email=}")
-    print(f'{EMAIL=}, {email=}')
-    return dbc.delete(PEOPLE_COLLECT, {EMAIL: email})
+    cascade.remove(email)
+    return deleted
 
 
 def authenticate(email: str, password: str) -> dict:
     """
     Authenticate a person with email and password
     Returns None if authentication fails
+    Raises pw.PoolBusy if too many logins are already being checked.
+    A password stored with outdated hash parameters is rehashed.
     """
     person = read_one(email)
     if not person or not person.get(PASSWORD):
         return None
 
-    if check_password_hash(person.get(PASSWORD), password):
-        return person
-    return None
+    stored = person[PASSWORD]
+    if not pw.verify_password(stored, password):
+        return None
+    if pw.needs_rehash(stored):
+        rehash(email, stored, password)
+    return person
+
+
+def rehash(email: str, stored: str, password: str):
+    """
+    Store password hashed with the current parameters, unless the
+    stored hash has changed since we read it. Best effort: if the pool
+    is busy, the next login will try again.
+    """
+    try:
+        hashed = pw.hash_password(password)
+    except pw.PoolBusy:
+        return
+    dbc.update_ops(PEOPLE_COLLECT, {EMAIL: email, PASSWORD: stored},
+                   {'$set': {PASSWORD: hashed}})
 
 
 def change_password():
@@ -216,39 +302,33 @@ def get_referees() -> list:
     Returns:
         list: List of referee emails
     """
-    referees = []
-    people = dbc.read_dict(PEOPLE_COLLECT, EMAIL)
-    for person in people.values():
-        if has_role(person, 'RE'):
-            referees.append(person.get(EMAIL))
-    return referees
+    referees = dbc.query(PEOPLE_COLLECT, {ROLES: rls.RE_CODE},
+                         projection={EMAIL: 1})
+    return [person.get(EMAIL) for person in referees]
 
 
 def add_manuscript(email: str, manuscript_id: str) -> bool:
     """
-    Add a manuscript ID to person's list of submissions
+    Add a manuscript ID to person's list of submissions, and count it.
+    One atomic update, so it is safe to repeat and to run concurrently.
+    Returns:
+        bool: True if the manuscript is on the person's list,
+              False if there is no such person
     """
-    person = read_one(email)
-    if not person:
-        return False
-
-    manuscripts = person.get(MANUSCRIPTS, [])
-    if manuscript_id not in manuscripts:
-        manuscripts.append(manuscript_id)
-
-    update = {
-        MANUSCRIPTS: manuscripts,
-        SUBMISSION_COUNT: len(manuscripts)
-    }
-
-    return dbc.update_one(PEOPLE_COLLECT, {EMAIL: email}, {"$set": update})
+    if dbc.append_with_count(PEOPLE_COLLECT, {EMAIL: email}, MANUSCRIPTS,
+                             manuscript_id, SUBMISSION_COUNT):
+        return True
+    # nothing matched: already listed, or no such person
+    return dbc.read_one(PEOPLE_COLLECT,
+                        {EMAIL: email, MANUSCRIPTS: manuscript_id}) is not None
 
 
 def get_manuscripts(email: str) -> list:
     """
     Get list of manuscript IDs submitted by person
     """
-    person = read_one(email)
+    person = dbc.query(PEOPLE_COLLECT, {EMAIL: email},
+                       projection={MANUSCRIPTS: 1}, limit=1)
     if not person:
         return []
-    return person.get(MANUSCRIPTS, [])
+    return person[0].get(MANUSCRIPTS, [])
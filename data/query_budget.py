@@ -0,0 +1,158 @@
+"""
+Request-scoped counting of data layer calls, to catch round trip
+regressions: the same query issued more than once, many queries of one
+shape (the N+1 pattern: one query per item of a loop), or more calls
+than an endpoint's declared budget.
+Problems are logged as warnings; in strict mode (for tests, or with
+QUERY_BUDGET_STRICT=1) they raise QueryBudgetExceeded instead.
+Calls served by the identity map or the query cache never reach Mongo
+and are not counted.
+"""
+from collections import Counter
+from contextlib import contextmanager
+import contextvars
+from functools import wraps
+import json
+import logging
+import os
+
+import data.identity_map as idm
+import data.metrics as mt
+
+STRICT = os.environ.get('QUERY_BUDGET_STRICT', '0') == '1'
+# a request may not make more calls than this unless it declares a budget
+DEFAULT_BUDGET = int(os.environ.get('QUERY_BUDGET', '50'))
+# how many times one exact query may run per request
+REPEAT_LIMIT = 1
+# how many queries of one shape a request may make before we call it N+1
+SHAPE_LIMIT = 10
+
+# problem kinds
+REPEATED = 'repeated'
+N_PLUS_ONE = 'n_plus_one'
+OVER_BUDGET = 'over_budget'
+
+logger = logging.getLogger('query_budget')
+
+_tracker = contextvars.ContextVar('query_budget', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class Tracker:
+    """
+    The data layer calls made in one request (or with block).
+    Trackers nest: a call counts towards every open tracker.
+    """
+    def __init__(self, budget=None, strict=None, parent=None):
+        self.budget = budget
+        self.strict = STRICT if strict is None else strict
+        self.parent = parent
+        self.total = 0
+        self.queries = Counter()
+        self.shapes = Counter()
+
+    def note(self, collection, op, filt):
+        self.total += 1
+        self.queries[(collection, op, idm.freeze(filt))] += 1
+        shape = json.dumps(mt.filter_shape(filt or {}), sort_keys=True)
+        self.shapes[(collection, op, shape)] += 1
+
+    def count(self, collection=None, op=None) -> int:
+        """
+        How many calls matched this collection and/or op?
+        """
+        return sum(n for (coll, cop, _), n in self.queries.items()
+                   if collection in (None, coll) and op in (None, cop))
+
+    def problems(self) -> list:
+        found = []
+        for (coll, op, filt), n in self.queries.items():
+            if n > REPEAT_LIMIT:
+                found.append(f'{REPEATED}: {coll}.{op} {filt} ran {n} times')
+        for (coll, op, shape), n in self.shapes.items():
+            if n > SHAPE_LIMIT:
+                found.append(f'{N_PLUS_ONE}: {coll}.{op} {shape} '
+                             f'ran {n} times')
+        budget = DEFAULT_BUDGET if self.budget is None else self.budget
+        if self.total > budget:
+            found.append(f'{OVER_BUDGET}: {self.total} calls, '
+                         f'budget {budget}')
+        return found
+
+    def check(self, where=None):
+        """
+        Warn about (or, if strict, raise on) any problems.
+        """
+        found = self.problems()
+        if not found:
+            return
+        msg = f'{where or "data calls"}: ' + '; '.join(found)
+        if self.strict:
+            raise QueryBudgetExceeded(msg)
+        logger.warning(msg)
+
+
+def note(collection, op, filt, args=None):
+    tracker = _tracker.get()
+    while tracker is not None:
+        tracker.note(collection, op, filt)
+        tracker = tracker.parent
+
+
+mt.add_listener(note)
+
+
+def begin(budget=None, strict=None) -> Tracker:
+    """
+    Start counting calls for the current request.
+    """
+    tracker = Tracker(budget=budget, strict=strict, parent=_tracker.get())
+    _tracker.set(tracker)
+    return tracker
+
+
+def end(where=None):
+    """
+    Stop counting and check what the request did.
+    """
+    tracker = _tracker.get()
+    if tracker is None:
+        return
+    _tracker.set(tracker.parent)
+    tracker.check(where)
+
+
+def current():
+    return _tracker.get()
+
+
+@contextmanager
+def track(budget=None, strict=True):
+    """
+    Count the calls made in a with block, e.g. to assert on them in a
+    test. Strict by default, so any problem fails the block.
+    """
+    tracker = begin(budget=budget, strict=strict)
+    try:
+        yield tracker
+    finally:
+        _tracker.set(tracker.parent)
+    tracker.check('tracked block')
+
+
+def budget(max_calls: int):
+    """
+    Declare how many data calls an endpoint method may make.
+    """
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            tracker = _tracker.get()
+            if tracker is not None:
+                tracker.budget = max_calls
+            return func(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,122 @@
+"""
+A process-level cache of query results for read-mostly collections.
+Entries are bounded in number (LRU) and age (TTL). Each collection has
+a version number that our writes bump, and an entry made under an
+older version is treated as a miss. Writes made by other processes are
+only seen once the TTL runs out.
+"""
+from collections import OrderedDict
+import copy
+import os
+import threading
+import time
+
+import data.identity_map as idm
+
+MAX_ENTRIES = int(os.environ.get('QUERY_CACHE_SIZE', '256'))
+TTL_SECS = float(os.environ.get('QUERY_CACHE_TTL', '30'))
+
+# stats fields
+HITS = 'hits'
+MISSES = 'misses'
+EVICTIONS = 'evictions'
+
+MISS = object()
+
+_lock = threading.Lock()
+# key -> (expiry time, collection version, result)
+_entries = OrderedDict()
+# (db, collection) -> version
+_versions = {}
+_stats = {HITS: 0, MISSES: 0, EVICTIONS: 0}
+
+
+def _now() -> float:
+    return time.monotonic()
+
+
+def make_key(db, collection, *args) -> tuple:
+    """
+    Build a cache key from a query's arguments (filter, projection...).
+    """
+    return (db, collection) + tuple(idm.freeze(arg) for arg in args)
+
+
+def bump(db, collection):
+    """
+    Invalidate every cached result for a collection we just wrote to.
+    """
+    with _lock:
+        _versions[(db, collection)] = _versions.get((db, collection), 0) + 1
+
+
+def get(key):
+    """
+    Return a copy of the cached result for key, or MISS.
+    """
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            expires, version, result = entry
+            if expires > _now() and version == _versions.get(key[:2], 0):
+                _entries.move_to_end(key)
+                _stats[HITS] += 1
+                return copy.deepcopy(result)
+            del _entries[key]
+        _stats[MISSES] += 1
+        return MISS
+
+
+def put(key, result, version: int):
+    """
+    Cache result, unless the collection was written to since `version`
+    (as read with version_of() before the query ran).
+    """
+    if MAX_ENTRIES <= 0:
+        return
+    with _lock:
+        if version != _versions.get(key[:2], 0):
+            return
+        _entries[key] = (_now() + TTL_SECS, version, copy.deepcopy(result))
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats[EVICTIONS] += 1
+
+
+def version_of(db, collection) -> int:
+    with _lock:
+        return _versions.get((db, collection), 0)
+
+
+def cached(key, compute):
+    """
+    Return the cached result for key, or compute, cache and return it.
+    """
+    result = get(key)
+    if result is not MISS:
+        return result
+    version = version_of(*key[:2])
+    result = compute()
+    put(key, result, version)
+    return result
+
+
+def get_stats() -> dict:
+    with _lock:
+        return dict(_stats, size=len(_entries))
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def after_fork():
+    """
+    Start a forked child with an empty cache and a fresh lock, since the
+    parent may have held the lock when it forked.
+    """
+    global _lock
+    _lock = threading.Lock()
+    _entries.clear()
@@ -0,0 +1,83 @@
+from unittest.mock import patch
+
+import pytest
+
+import data.cascade as cascade
+import data.manuscripts as manu
+import data.manus.fields as flds
+import data.manus.query as query
+import data.memory_db as mdb
+import data.people as ppl
+
+OLD = "old@nyu.edu"
+NEW = "new@nyu.edu"
+OTHER = "other@nyu.edu"
+
+
+@pytest.fixture
+def manus():
+    """
+    Three manuscripts referring to OLD: as author, as the only referee
+    (with a report), and as one of two referees.
+    """
+    with patch("data.db_connect.client", mdb.MemoryClient()):
+        authored = manu.create_manuscript("Authored", OLD)
+        only_ref = manu.create_manuscript("Only referee", OTHER)
+        manu.handle_action(only_ref, query.SUBMITTED, query.ASSIGN_REF,
+                           ref=OLD)
+        manu.set_referee_report(only_ref, OLD, "fine", manu.ACCEPT)
+        two_refs = manu.create_manuscript("Two referees", OTHER)
+        manu.handle_action(two_refs, query.SUBMITTED, query.ASSIGN_REF,
+                           ref=OTHER)
+        manu.handle_action(two_refs, query.IN_REF_REV, query.ASSIGN_REF,
+                           ref=OLD)
+        yield authored, only_ref, two_refs
+
+
+def test_rename(manus):
+    authored, only_ref, two_refs = manus
+    before = manu.read_one(only_ref)[manu.VERSION]
+    report = cascade.rename(OLD, NEW)
+    assert report == {cascade.AUTHOR: 1, cascade.REFEREES: 2,
+                      cascade.REFEREE_REPORTS: 1}
+    assert manu.read_one(authored)[manu.AUTHOR] == NEW
+    doc = manu.read_one(only_ref)
+    assert doc[flds.REFEREES] == [NEW]
+    assert doc[flds.REFEREE_REPORTS][0][flds.REFEREE] == NEW
+    assert doc[manu.VERSION] == before + 2
+    assert manu.read_one(two_refs)[flds.REFEREES] == [OTHER, NEW]
+
+
+def test_rename_chunked(manus):
+    seen = []
+    report = cascade.rename(OLD, NEW, chunk_size=1,
+                            progress=lambda step, done: seen.append(
+                                (step, done)))
+    assert report[cascade.REFEREES] == 2
+    assert (cascade.REFEREES, 1) in seen
+    assert (cascade.REFEREES, 2) in seen
+    assert manu.get_manuscript(OLD) == []
+
+
+def test_remove(manus):
+    authored, only_ref, two_refs = manus
+    report = cascade.remove(OLD)
+    assert report[cascade.LAST_REFEREE] == 1
+    assert report[cascade.REFEREES] == 1
+    assert cascade.AUTHOR not in manu.read_one(authored)
+    doc = manu.read_one(only_ref)
+    assert doc[flds.REFEREES] == []
+    assert doc[flds.REFEREE_REPORTS] == []
+    assert doc[manu.CURR_STATE] == query.SUBMITTED
+    doc = manu.read_one(two_refs)
+    assert doc[flds.REFEREES] == [OTHER]
+    assert doc[manu.CURR_STATE] == query.IN_REF_REV
+
+
+def test_people_update_cascades(manus):
+    authored, _, _ = manus
+    ppl.create("Old", "NYU", OLD, ["AU"], is_manu_author=True)
+    ppl.update(OLD, "Old", "NYU", NEW, ["AU"])
+    assert manu.read_one(authored)[manu.AUTHOR] == NEW
+    ppl.delete(NEW)
+    assert manu.AUTHOR not in manu.read_one(authored)
@@ -0,0 +1,88 @@
+from unittest.mock import patch
+
+import data.db_connect as db
+import data.explain_audit as ea
+import data.memory_db as mdb
+import security.security as sec
+
+IXSCAN_PLAN = {
+    "queryPlanner": {"winningPlan": {
+        "stage": "FETCH",
+        "inputStage": {"stage": "IXSCAN", "indexName": "email_1"},
+    }},
+    "executionStats": {"nReturned": 1, "totalDocsExamined": 1},
+}
+
+COLLSCAN_PLAN = {
+    "queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}},
+    "executionStats": {"nReturned": 2, "totalDocsExamined": 500},
+}
+
+# newer servers nest the classic plan under queryPlan
+SBE_SORT_PLAN = {
+    "queryPlanner": {"winningPlan": {"queryPlan": {
+        "stage": "SORT",
+        "inputStage": {"stage": "FETCH", "inputStage": {
+            "stage": "IXSCAN", "indexName": "curr_state_1_manu_id_1"}},
+    }}},
+    "executionStats": {"nReturned": 5, "totalDocsExamined": 5},
+}
+
+
+def test_analyze_index_backed():
+    report = ea.analyze(IXSCAN_PLAN, {"email": "a@x.com"})
+    assert report[ea.STAGES] == ["FETCH", "IXSCAN"]
+    assert report[ea.INDEXES] == ["email_1"]
+    assert report[ea.PROBLEMS] == []
+
+
+def test_analyze_collscan():
+    report = ea.analyze(COLLSCAN_PLAN, {"name": "A"})
+    assert report[ea.RATIO] == 250
+    assert "collection scan" in report[ea.PROBLEMS]
+    assert len(report[ea.PROBLEMS]) == 2
+
+
+def test_analyze_full_read_may_scan():
+    assert ea.analyze(COLLSCAN_PLAN, {})[ea.PROBLEMS] == []
+
+
+def test_analyze_in_memory_sort():
+    report = ea.analyze(SBE_SORT_PLAN, {"curr_state": "SUB"},
+                        [("title", 1)])
+    assert report[ea.PROBLEMS] == ["in-memory sort"]
+
+
+def test_capture_one_per_shape():
+    with ea.capture():
+        ea.note("people", "find_one", {"email": "a@x.com"})
+        ea.note("people", "find_one", {"email": "b@x.com"})
+        ea.note("people", "insert_one", None)
+    ea.note("people", "find_one", {"name": "A"})
+    assert ea.captured() == [
+        (db.GAME_DB, "people", "find_one", {"email": "a@x.com"}, None)]
+
+
+def test_audit_flags_unindexed_query():
+    client = mdb.MemoryClient()
+    client[db.GAME_DB]["people"].insert_one({"name": "A"})
+    with patch("data.db_connect.client", client):
+        reports = ea.audit([(db.GAME_DB, "people", "find",
+                             {"name": "A"}, None)])
+    assert ea.failures(reports) == reports
+
+
+def test_workload_is_index_backed():
+    with patch("data.db_connect.client", mdb.MemoryClient()), \
+            patch.object(sec, "snapshot", None):
+        ea.seed()
+        with ea.capture():
+            ea.workload()
+        reports = ea.audit()
+    assert reports
+    assert ea.failures(reports) == []
+    audited = {(report[ea.COLLECTION], report[ea.OP]) for report in reports}
+    assert {("manuscripts", "find_one_and_update"),
+            ("manuscripts", "update_many"),
+            ("manuscripts", "count_documents"),
+            ("security", "find")} <= audited
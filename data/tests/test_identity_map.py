@@ -0,0 +1,72 @@
+from unittest.mock import MagicMock, patch
+
+import data.db_connect as db
+import data.identity_map as idm
+
+TEST_COLLECTION = "test_collection"
+TEST_DB = "gamesDB"
+TEST_FILTER = {"email": "a@nyu.edu"}
+
+
+def test_get_outside_scope():
+    idm.put(TEST_DB, TEST_COLLECTION, TEST_FILTER, {"name": "A"})
+    assert idm.get(TEST_DB, TEST_COLLECTION, TEST_FILTER) is idm.MISS
+
+
+def test_get_returns_copy():
+    with idm.scope():
+        idm.put(TEST_DB, TEST_COLLECTION, TEST_FILTER, {"roles": ["AU"]})
+        doc = idm.get(TEST_DB, TEST_COLLECTION, TEST_FILTER)
+        doc["roles"].append("ED")
+        assert idm.get(TEST_DB, TEST_COLLECTION,
+                       TEST_FILTER) == {"roles": ["AU"]}
+
+
+def test_apply_update():
+    with idm.scope():
+        idm.put(TEST_DB, TEST_COLLECTION, TEST_FILTER, {"name": "A"})
+        idm.put(TEST_DB, TEST_COLLECTION, {"name": "A"}, {"name": "A"})
+        idm.apply_update(TEST_DB, TEST_COLLECTION, TEST_FILTER,
+                         {"name": "B"})
+        assert idm.get(TEST_DB, TEST_COLLECTION,
+                       TEST_FILTER) == {"name": "B"}
+        assert idm.get(TEST_DB, TEST_COLLECTION, {"name": "A"}) is idm.MISS
+
+
+def test_apply_update_changing_key():
+    with idm.scope():
+        idm.put(TEST_DB, TEST_COLLECTION, TEST_FILTER, {"name": "A"})
+        idm.apply_update(TEST_DB, TEST_COLLECTION, TEST_FILTER,
+                         {"email": "b@nyu.edu"})
+        assert idm.get(TEST_DB, TEST_COLLECTION, TEST_FILTER) is idm.MISS
+
+
+@patch("data.db_connect.client", new_callable=MagicMock)
+def test_read_one_hits_map(mock_client):
+    db.client = mock_client
+    mock_collection = mock_client[TEST_DB][TEST_COLLECTION]
+    mock_collection.find = MagicMock(return_value=[{"name": "A"}])
+    with idm.scope():
+        db.read_one(TEST_COLLECTION, TEST_FILTER)
+        assert db.read_one(TEST_COLLECTION, TEST_FILTER) == {"name": "A"}
+        mock_collection.find.assert_called_once()
+
+        db.update(TEST_COLLECTION, TEST_FILTER, {"name": "B"})
+        assert db.read_one(TEST_COLLECTION, TEST_FILTER) == {"name": "B"}
+        mock_collection.find.assert_called_once()
+
+        db.delete(TEST_COLLECTION, TEST_FILTER)
+        assert db.read_one(TEST_COLLECTION, TEST_FILTER) is None
+        mock_collection.find.assert_called_once()
+
+
+@patch("data.db_connect.client", new_callable=MagicMock)
+def test_create_forgets_misses(mock_client):
+    db.client = mock_client
+    mock_collection = mock_client[TEST_DB][TEST_COLLECTION]
+    mock_collection.find = MagicMock(return_value=[])
+    with idm.scope():
+        assert db.read_one(TEST_COLLECTION, TEST_FILTER) is None
+        db.create(TEST_COLLECTION, {"email": "a@nyu.edu"})
+        db.read_one(TEST_COLLECTION, TEST_FILTER)
+        assert mock_collection.find.call_count == 2
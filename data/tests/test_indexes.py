@@ -0,0 +1,90 @@
+from unittest.mock import MagicMock, patch
+
+import pymongo as pm
+
+import data.cascade as cascade
+import data.db_connect as db
+import data.explain_audit as ea
+import data.indexes as idx
+import data.manuscripts as manu
+import data.manus.fields as flds
+import data.memory_db as mdb
+import data.people as ppl
+
+PEOPLE_SPECS = idx.get_indexes(ppl.PEOPLE_COLLECT)
+EMAIL_INDEX = idx.index_name([(ppl.EMAIL, pm.ASCENDING)])
+ROLES_INDEX = idx.index_name([(ppl.ROLES, pm.ASCENDING)])
+
+
+def test_index_name():
+    assert idx.index_name([('a', 1), ('b', -1)]) == 'a_1_b_-1'
+
+
+def test_key_fields_have_unique_indexes():
+    unique = [spec[idx.KEYS] for spec in PEOPLE_SPECS
+              if spec.get(idx.UNIQUE)]
+    assert [(ppl.EMAIL, pm.ASCENDING)] in unique
+
+
+@patch("data.db_connect.client", new_callable=MagicMock)
+def test_ensure_creates_missing(mock_client):
+    db.client = mock_client
+    coll = mock_client[db.GAME_DB][ppl.PEOPLE_COLLECT]
+    coll.index_information.return_value = {
+        idx.ID_INDEX: {'key': [('_id', 1)]},
+    }
+    report = idx.ensure_collection(ppl.PEOPLE_COLLECT)
+    assert coll.create_index.call_count == len(PEOPLE_SPECS)
+    assert EMAIL_INDEX in report[idx.CREATED]
+    assert not report[idx.DRIFT]
+
+
+@patch("data.db_connect.client", new_callable=MagicMock)
+def test_ensure_is_idempotent(mock_client):
+    db.client = mock_client
+    coll = mock_client[db.GAME_DB][ppl.PEOPLE_COLLECT]
+    coll.index_information.return_value = {
+        idx.ID_INDEX: {'key': [('_id', 1)]},
+        EMAIL_INDEX: {'key': [(ppl.EMAIL, 1)], 'unique': True},
+        ROLES_INDEX: {'key': [(ppl.ROLES, 1)]},
+    }
+    report = idx.ensure_collection(ppl.PEOPLE_COLLECT)
+    coll.create_index.assert_not_called()
+    assert set(report[idx.OK]) == {EMAIL_INDEX, ROLES_INDEX}
+
+
+@patch("data.db_connect.client", new_callable=MagicMock)
+def test_ensure_reports_drift(mock_client):
+    db.client = mock_client
+    coll = mock_client[db.GAME_DB][ppl.PEOPLE_COLLECT]
+    coll.index_information.return_value = {
+        idx.ID_INDEX: {'key': [('_id', 1)]},
+        EMAIL_INDEX: {'key': [(ppl.EMAIL, 1)]},  # should be unique
+        ROLES_INDEX: {'key': [(ppl.ROLES, 1)]},
+        'name_1': {'key': [('name', 1)]},
+    }
+    report = idx.ensure_collection(ppl.PEOPLE_COLLECT)
+    coll.create_index.assert_not_called()
+    assert len(report[idx.DRIFT]) == 2
+
+
+def test_ensure_in_background():
+    with patch.object(idx, 'ensure_indexes') as ensure:
+        thread = idx.ensure_indexes_in_background()
+        thread.join(timeout=5)
+    ensure.assert_called_once_with(db.GAME_DB)
+
+
+@patch('data.db_connect.client', mdb.MemoryClient())
+def test_referee_report_filters_use_indexes():
+    idx.ensure_collection(manu.MANU_COLLECT)
+    db.create(manu.MANU_COLLECT, {
+        manu.MANU_ID: 'm1', flds.REFEREES: ['r1@nyu.edu'],
+        flds.REFEREE_REPORTS: [{flds.REFEREE: 'r1@nyu.edu'}]})
+    email = 'r1@nyu.edu'
+    for filt in ({cascade.REPORT_REFEREE: email},
+                 {'$or': [{flds.REFEREES: email},
+                          {cascade.REPORT_REFEREE: email}]}):
+        report = ea.analyze(ea.explain(manu.MANU_COLLECT, filt), filt)
+        assert ea.COLLSCAN not in report[ea.STAGES]
+        assert report[ea.PROBLEMS] == []
@@ -6,7 +6,11 @@ import pytest
 from unittest.mock import patch
 
 import data.manuscripts as manuscripts
+import data.manus.fields as flds
 import data.manus.query as query
+import data.memory_db as mdb
+import data.paging as pg
+import data.query_budget as qb
 
 
 @patch('data.manuscripts.read')
@@ -58,31 +62,97 @@ def test_sort_manuscripts_by_state(mock_read):
     )
 
 
-@patch('data.manuscripts.read')
-def test_filter_manuscripts_by_state(mock_read):
+@patch('data.manuscripts.dbc.query')
+def test_filter_manuscripts_by_state(mock_query):
     """
     Test that manuscripts are filtered correctly by state.
     """
-    # Create mock manuscripts with different states
+    # The DB only hands back the manuscripts matching the filter
     mock_manuscripts = [
-        {'manu_id': '1', 'curr_state': query.PUBLISHED},
         {'manu_id': '2', 'curr_state': query.SUBMITTED},
         {'manu_id': '3', 'curr_state': query.SUBMITTED},
-        {'manu_id': '4', 'curr_state': query.REJECTED},
     ]
 
     # Set up the mock to return our test data
-    mock_read.return_value = mock_manuscripts
+    mock_query.return_value = mock_manuscripts
 
     # Call the function to filter for SUBMITTED manuscripts
     result = manuscripts.filter_manuscripts_by_state(query.SUBMITTED)
 
+    # The state filter must be pushed to the DB
+    mock_query.assert_called_once_with(manuscripts.MANU_COLLECT,
+                                       {'curr_state': query.SUBMITTED},
+                                       no_id=False, cached=True)
     # Should only return manuscripts with SUBMITTED state
     assert len(result) == 2
     assert all(m['curr_state'] == query.SUBMITTED for m in result)
     assert set(m['manu_id'] for m in result) == {'2', '3'}
 
 
+@patch('data.manuscripts.dbc.query')
+def test_get_manuscript_by_author(mock_query):
+    """
+    Test that the author filter is pushed to the DB.
+    """
+    mock_query.return_value = [{'manu_id': '1', 'author': 'a@nyu.edu'}]
+    result = manuscripts.get_manuscript('a@nyu.edu')
+    mock_query.assert_called_once_with(manuscripts.MANU_COLLECT,
+                                       {manuscripts.AUTHOR: 'a@nyu.edu'},
+                                       no_id=False)
+    assert result == mock_query.return_value
+
+
+def fake_read_page(manus):
+    """
+    A stand-in for dbc.read_page() over a list of manuscripts.
+    """
+    def read_page(collection, key, after=None, limit=25, filt=None,
+                  **kwargs):
+        state = filt['curr_state']
+        if isinstance(state, dict):
+            docs = [m for m in manus if m['curr_state'] not in state['$nin']]
+        else:
+            docs = [m for m in manus if m['curr_state'] == state]
+        docs = sorted((m for m in docs if after is None or m[key] > after),
+                      key=lambda m: m[key])
+        return docs[:limit], len(docs) > limit
+    return read_page
+
+
+def test_read_sorted_page():
+    """
+    Walking the pages gives the same order as sort_manuscripts_by_state().
+    """
+    mock_manuscripts = [
+        {'manu_id': str(i), 'curr_state': state}
+        for i, state in enumerate([query.PUBLISHED, query.SUBMITTED,
+                                   query.COPY_EDIT, query.SUBMITTED,
+                                   query.REJECTED, 'INVALID_STATE',
+                                   query.PUBLISHED])
+    ]
+    with patch('data.manuscripts.dbc.read_page',
+               side_effect=fake_read_page(mock_manuscripts)):
+        pages = []
+        cursor = None
+        while True:
+            page, cursor = manuscripts.read_sorted_page(cursor, limit=2)
+            pages.append(page)
+            if cursor is None:
+                break
+    with patch('data.manuscripts.read', return_value=mock_manuscripts):
+        expected = manuscripts.sort_manuscripts_by_state()
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    assert [m['manu_id'] for page in pages for m in page] == \
+        [m['manu_id'] for m in expected]
+
+
+@pytest.mark.parametrize("key_vals", [[-1, "0"],
+                                      [len(query.VALID_STATES) + 1, "0"]])
+def test_read_sorted_page_rank_out_of_range(key_vals):
+    with pytest.raises(ValueError):
+        manuscripts.read_sorted_page(pg.encode_cursor(key_vals))
+
+
 def test_filter_manuscripts_by_invalid_state():
     """
     Test that an invalid state raises a ValueError.
@@ -93,3 +163,190 @@ def test_filter_manuscripts_by_invalid_state():
 
 if __name__ == '__main__':
     pytest.main(['-xvs', __file__])
+
+
+@pytest.fixture
+def manu_id():
+    """
+    A fresh submitted manuscript in the in-memory engine.
+    """
+    with patch('data.db_connect.client', mdb.MemoryClient()):
+        yield manuscripts.create_manuscript('Title', 'author@nyu.edu')
+
+
+def test_editor_move_not_a_bypass(manu_id):
+    manuscripts.update_manuscript(manu_id, {manuscripts.CURR_STATE:
+                                            query.PUBLISHED})
+    with pytest.raises(ValueError):
+        manuscripts.handle_action(manu_id, query.PUBLISHED,
+                                  query.EDITOR_MOVE)
+    assert manuscripts.read_one(manu_id)[manuscripts.CURR_STATE] \
+        == query.PUBLISHED
+
+
+def test_assign_ref_with_report_one_round_trip(manu_id):
+    with qb.track() as calls:
+        manuscripts.handle_action(manu_id, query.SUBMITTED, query.ASSIGN_REF,
+                                  ref='r1@nyu.edu',
+                                  extra={flds.VERDICT: manuscripts.ACCEPT})
+    assert calls.total == 1
+    manus = manuscripts.read_one(manu_id)
+    assert manus[flds.REFEREE_REPORTS] == [
+        {flds.VERDICT: manuscripts.ACCEPT, flds.REFEREE: 'r1@nyu.edu'}]
+
+
+@pytest.mark.parametrize("kwargs", [
+    {'ref': 'r1@nyu.edu', 'extra': {flds.VERDICT: 'BOGUS'}},
+    {},
+    {'ref': None},
+])
+def test_assign_ref_rejected_before_writing(manu_id, kwargs):
+    with pytest.raises(ValueError):
+        manuscripts.handle_action(manu_id, query.SUBMITTED, query.ASSIGN_REF,
+                                  **kwargs)
+    manus = manuscripts.read_one(manu_id)
+    assert manus[manuscripts.CURR_STATE] == query.SUBMITTED
+    assert manus[flds.REFEREES] == []
+    assert manus[manuscripts.VERSION] == 0
+
+
+def test_handle_action_one_round_trip(manu_id):
+    with qb.track() as calls:
+        new_state = manuscripts.handle_action(manu_id, query.SUBMITTED,
+                                              query.REJECT)
+    assert calls.total == 1
+    assert new_state == query.REJECTED
+    manu = manuscripts.read_one(manu_id)
+    assert manu[manuscripts.CURR_STATE] == query.REJECTED
+    assert manu[manuscripts.VERSION] == 1
+
+
+def test_handle_action_referees(manu_id):
+    assert manuscripts.handle_action(manu_id, query.SUBMITTED,
+                                     query.ASSIGN_REF,
+                                     ref='r1@nyu.edu') == query.IN_REF_REV
+    manuscripts.handle_action(manu_id, query.IN_REF_REV, query.ASSIGN_REF,
+                              ref='r2@nyu.edu')
+    assert manuscripts.handle_action(manu_id, query.IN_REF_REV,
+                                     query.DELETE_REF,
+                                     ref='r1@nyu.edu') == query.IN_REF_REV
+    assert manuscripts.handle_action(manu_id, query.IN_REF_REV,
+                                     query.DELETE_REF,
+                                     ref='r2@nyu.edu') == query.SUBMITTED
+    manu = manuscripts.read_one(manu_id)
+    assert manu[flds.REFEREES] == []
+    assert manu[manuscripts.VERSION] == 4
+
+
+def test_handle_action_stale_state(manu_id):
+    manuscripts.handle_action(manu_id, query.SUBMITTED, query.REJECT)
+    with pytest.raises(manuscripts.StaleStateError):
+        manuscripts.handle_action(manu_id, query.SUBMITTED, query.WITHDRAW)
+    assert manuscripts.read_one(manu_id)[manuscripts.CURR_STATE] == \
+        query.REJECTED
+
+
+def test_handle_action_stale_version(manu_id):
+    manuscripts.handle_action(manu_id, query.SUBMITTED, query.ASSIGN_REF,
+                              ref='r1@nyu.edu', version=0)
+    with pytest.raises(manuscripts.StaleStateError):
+        manuscripts.handle_action(manu_id, query.IN_REF_REV, query.ACCEPT,
+                                  version=0)
+    assert manuscripts.handle_action(manu_id, query.IN_REF_REV, query.ACCEPT,
+                                     version=1) == query.COPY_EDIT
+
+
+def test_handle_action_not_found(manu_id):
+    with pytest.raises(ValueError, match='not found'):
+        manuscripts.handle_action('no_such_id', query.SUBMITTED,
+                                  query.REJECT)
+
+
+def test_handle_action_unknown_referee(manu_id):
+    manuscripts.handle_action(manu_id, query.SUBMITTED, query.ASSIGN_REF,
+                              ref='r1@nyu.edu')
+    with pytest.raises(ValueError, match='not a referee'):
+        manuscripts.handle_action(manu_id, query.IN_REF_REV,
+                                  query.DELETE_REF, ref='r2@nyu.edu')
+
+
+def test_handle_action_bad_action(manu_id):
+    with pytest.raises(ValueError):
+        manuscripts.handle_action(manu_id, query.SUBMITTED, query.DONE)
+
+
+def test_assign_ref_twice(manu_id):
+    manuscripts.handle_action(manu_id, query.SUBMITTED, query.ASSIGN_REF,
+                              ref='r1@nyu.edu')
+    manuscripts.handle_action(manu_id, query.IN_REF_REV, query.ASSIGN_REF,
+                              ref='r1@nyu.edu')
+    assert manuscripts.read_one(manu_id)[flds.REFEREES] == ['r1@nyu.edu']
+
+
+def test_set_referee_report(manu_id):
+    manuscripts.handle_action(manu_id, query.SUBMITTED, query.ASSIGN_REF,
+                              ref='r1@nyu.edu',
+                              extra={flds.REPORT: 'Fine.'})
+    manuscripts.handle_action(manu_id, query.IN_REF_REV, query.ASSIGN_REF,
+                              ref='r2@nyu.edu')
+    manuscripts.set_referee_report(manu_id, 'r1@nyu.edu',
+                                   verdict=manuscripts.ACCEPT)
+    manuscripts.set_referee_report(manu_id, 'r2@nyu.edu', report='No.',
+                                   verdict=manuscripts.REJECT)
+    reports = manuscripts.read_one(manu_id)[flds.REFEREE_REPORTS]
+    assert reports == [
+        {flds.REFEREE: 'r1@nyu.edu', flds.REPORT: 'Fine.',
+         flds.VERDICT: manuscripts.ACCEPT},
+        {flds.REFEREE: 'r2@nyu.edu', flds.REPORT: 'No.',
+         flds.VERDICT: manuscripts.REJECT},
+    ]
+    # removing a referee removes their report too
+    manuscripts.handle_action(manu_id, query.IN_REF_REV, query.DELETE_REF,
+                              ref='r1@nyu.edu')
+    reports = manuscripts.read_one(manu_id)[flds.REFEREE_REPORTS]
+    assert [r[flds.REFEREE] for r in reports] == ['r2@nyu.edu']
+
+
+def test_set_referee_report_errors(manu_id):
+    with pytest.raises(ValueError, match='not a referee'):
+        manuscripts.set_referee_report(manu_id, 'r1@nyu.edu', report='Hi')
+    with pytest.raises(ValueError, match='verdict'):
+        manuscripts.set_referee_report(manu_id, 'r1@nyu.edu',
+                                       verdict='MAYBE')
+
+
+def test_create_manuscript_no_pre_read():
+    with patch('data.db_connect.client', mdb.MemoryClient()):
+        with qb.track() as calls:
+            manuscripts.create_manuscript('Title', 'author@nyu.edu')
+        assert calls.total == 1
+
+
+def test_create_manuscript_id_collision():
+    with patch('data.db_connect.client', mdb.MemoryClient()):
+        manuscripts.dbc.get_collection(manuscripts.MANU_COLLECT).create_index(
+            [(manuscripts.MANU_ID, 1)], unique=True)
+        taken = manuscripts.create_manuscript('First', 'author@nyu.edu')
+        fresh = manuscripts.generate_id()
+        with patch('data.manus.ids.new_id', side_effect=[taken, fresh]):
+            assert manuscripts.create_manuscript('Second', 'a@nyu.edu') \
+                == fresh
+        assert manuscripts.read_one(taken)[manuscripts.TITLE] == 'First'
+
+
+def test_create_manuscripts_id_collision():
+    with patch('data.db_connect.client', mdb.MemoryClient()):
+        manuscripts.dbc.get_collection(manuscripts.MANU_COLLECT).create_index(
+            [(manuscripts.MANU_ID, 1)], unique=True)
+        taken = manuscripts.create_manuscript('First', 'author@nyu.edu')
+        block = [taken, manuscripts.generate_id()]
+        fresh = [manuscripts.generate_id()]
+        with patch('data.manus.ids.allocate_block',
+                   side_effect=[block, fresh]):
+            results = manuscripts.create_manuscripts(
+                [{manuscripts.TITLE: f'T{i}', manuscripts.AUTHOR: 'a@nyu.edu'}
+                 for i in range(2)])
+        assert all(result['ok'] for result in results)
+        assert [r[manuscripts.MANU_ID] for r in results] == \
+            [fresh[0], block[1]]
+        assert manuscripts.id_space_stats()[manuscripts.ids.USED] == 3
@@ -0,0 +1,151 @@
+import asyncio
+
+import pymongo as pm
+import pytest
+
+import data.memory_db as mdb
+
+DOCS = [
+    {"email": "a@x.com", "name": "A", "roles": ["AU"], "age": 30},
+    {"email": "b@x.com", "name": "B", "roles": ["AU", "RE"], "age": 40},
+    {"email": "c@x.com", "name": "C", "roles": ["ED"], "age": 50},
+]
+
+
+@pytest.fixture
+def coll():
+    coll = mdb.MemoryClient()["testDB"]["people"]
+    coll.create_index([("email", pm.ASCENDING)], name="email_1",
+                      unique=True)
+    coll.create_index([("roles", pm.ASCENDING)], name="roles_1")
+    coll.create_index([("age", pm.ASCENDING)], name="age_1")
+    coll.insert_many([dict(doc) for doc in DOCS])
+    return coll
+
+
+def names(docs):
+    return [doc["name"] for doc in docs]
+
+
+def test_find_eq(coll):
+    assert names(coll.find({"email": "b@x.com"})) == ["B"]
+
+
+def test_find_in_array(coll):
+    assert names(coll.find({"roles": "AU"})) == ["A", "B"]
+
+
+def test_find_range_uses_index(coll):
+    assert names(coll.find({"age": {"$gte": 40}})) == ["B", "C"]
+    assert names(coll.find({"age": {"$gt": 30, "$lt": 50}})) == ["B"]
+    assert coll.find_one({"age": {"$lt": "x"}}) is None
+
+
+def test_index_matches_scan(coll):
+    unindexed = mdb.MemoryClient()["testDB"]["people"]
+    unindexed.insert_many([dict(doc) for doc in DOCS])
+    for filt in ({"roles": {"$in": ["ED", "RE"]}}, {"age": {"$lte": 40}},
+                 {"roles": {"$nin": ["AU"]}}, {"email": {"$exists": True}},
+                 {"$or": [{"name": "A"}, {"age": 50}]}):
+        assert names(coll.find(filt)) == names(unindexed.find(filt))
+
+
+def test_sort_skip_limit(coll):
+    cursor = coll.find({}).sort([("age", pm.DESCENDING)]).skip(1).limit(1)
+    assert names(cursor) == ["B"]
+
+
+def test_projection(coll):
+    doc = coll.find_one({"name": "A"}, {"_id": 0, "email": 1})
+    assert doc == {"email": "a@x.com"}
+
+
+def test_returns_copies(coll):
+    doc = coll.find_one({"name": "A"})
+    doc["roles"].append("XX")
+    assert coll.find_one({"name": "A"})["roles"] == ["AU"]
+
+
+def test_unique_index(coll):
+    with pytest.raises(pm.errors.DuplicateKeyError):
+        coll.insert_one({"email": "a@x.com"})
+    with pytest.raises(pm.errors.DuplicateKeyError):
+        coll.update_one({"name": "B"}, {"$set": {"email": "a@x.com"}})
+    assert coll.find_one({"name": "B"})["email"] == "b@x.com"
+
+
+def test_update_ops(coll):
+    res = coll.update_one({"name": "A"}, {"$addToSet": {"roles": "RE"},
+                                          "$inc": {"age": 1}})
+    assert res.matched_count == 1
+    assert names(coll.find({"roles": "RE"})) == ["A", "B"]
+    coll.update_many({}, {"$pull": {"roles": "AU"}})
+    assert names(coll.find({"roles": "AU"})) == []
+    assert coll.find_one({"name": "A"})["age"] == 31
+
+
+def test_upsert(coll):
+    res = coll.update_one({"email": "d@x.com"},
+                          {"$setOnInsert": {"name": "D"}}, upsert=True)
+    assert res.upserted_id is not None
+    assert coll.find_one({"email": "d@x.com"})["name"] == "D"
+    res = coll.update_one({"email": "d@x.com"},
+                          {"$setOnInsert": {"name": "E"}}, upsert=True)
+    assert res.upserted_id is None
+    assert coll.find_one({"email": "d@x.com"})["name"] == "D"
+
+
+def test_delete(coll):
+    assert coll.delete_many({"roles": "AU"}).deleted_count == 2
+    assert names(coll.find({})) == ["C"]
+    assert coll.find_one({"email": "a@x.com"}) is None
+
+
+def test_bulk_write_unordered(coll):
+    with pytest.raises(pm.errors.BulkWriteError) as err:
+        coll.bulk_write([pm.InsertOne({"email": "a@x.com"}),
+                         pm.InsertOne({"email": "e@x.com"})], ordered=False)
+    assert [e["index"] for e in err.value.details["writeErrors"]] == [0]
+    assert coll.count_documents({"email": "e@x.com"}) == 1
+
+
+def test_index_information(coll):
+    info = coll.index_information()
+    assert info["email_1"]["unique"]
+    assert info["roles_1"]["key"] == [("roles", pm.ASCENDING)]
+
+
+def test_find_one_and_update_pipeline(coll):
+    doc = coll.find_one_and_update(
+        {"name": "B"},
+        [{"$set": {"roles": {"$filter": {
+            "input": "$roles", "cond": {"$ne": ["$$this", "AU"]}}}}},
+         {"$set": {"n_roles": {"$size": "$roles"},
+                   "old": {"$cond": [{"$gte": ["$age", 40]}, True, False]},
+                   "age": {"$add": [{"$ifNull": ["$age", 0]}, 1]}}}],
+        projection={"_id": 0, "roles": 1, "n_roles": 1, "old": 1, "age": 1},
+        return_document=pm.ReturnDocument.AFTER)
+    assert doc == {"roles": ["RE"], "n_roles": 1, "old": True, "age": 41}
+
+
+def test_find_one_and_update_no_match(coll):
+    assert coll.find_one_and_update({"name": "Z"},
+                                    {"$set": {"age": 1}}) is None
+
+
+def test_async_client_shares_data():
+    async def run(aclient):
+        acoll = aclient["testDB"]["people"]
+        await acoll.insert_one({"email": "d@x.com", "name": "D", "age": 60})
+        found = await acoll.find_one({"email": "a@x.com"})
+        docs = [doc async for doc in acoll.find({}, {"name": 1, "_id": 0})
+                .sort("age", pm.DESCENDING).limit(2)]
+        assert (await aclient.admin.command("ping"))["ok"]
+        return found, docs
+
+    sync_client = mdb.MemoryClient()
+    sync_client["testDB"]["people"].insert_one(dict(DOCS[0]))
+    found, docs = asyncio.run(run(mdb.AsyncMemoryClient(sync_client)))
+    assert found["name"] == "A"
+    assert docs == [{"name": "D"}, {"name": "A"}]
+    assert sync_client["testDB"]["people"].count_documents({}) == 2
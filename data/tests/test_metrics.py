@@ -0,0 +1,145 @@
+import asyncio
+import itertools
+from unittest.mock import MagicMock, patch
+
+import bson
+
+import data.db_connect as db
+import data.metrics as mt
+
+TEST_COLLECTION = "metrics_collection"
+TEST_DB = "gamesDB"
+TEST_DOC = {"email": "a@x.com", "name": "A"}
+
+
+def op_stats(op):
+    return mt.get_stats()["ops"].get(f"{TEST_COLLECTION}.{op}")
+
+
+def test_filter_shape():
+    filt = {"email": "a@x.com", "age": {"$gt": 3},
+            "$or": [{"name": "A"}, {"name": "B"}]}
+    assert mt.filter_shape(filt) == {
+        "email": "?", "age": {"$gt": "?"},
+        "$or": [{"name": "?"}, {"name": "?"}],
+    }
+
+
+def test_timed_call():
+    mt.reset()
+
+    @mt.timed("find_one", filt_arg="filt")
+    def find(collection, filt):
+        return dict(TEST_DOC)
+
+    with patch.object(mt, "BYTE_SAMPLE", 1):
+        find(TEST_COLLECTION, {"email": "a@x.com"})
+        find(TEST_COLLECTION, filt={"email": "b@x.com"})
+    stats = op_stats("find_one")
+    assert stats[mt.CALLS] == 2
+    assert stats[mt.DOCS] == 2
+    assert stats[mt.BYTES] > 0
+    assert stats[mt.SIZED] == 2
+    assert stats[mt.SHAPES] == {'{"email": "?"}': 2}
+    assert sum(stats[mt.HISTOGRAM]) == 2
+
+
+def test_bytes_off_by_default():
+    mt.reset()
+
+    @mt.timed("find_one")
+    def find(collection):
+        return dict(TEST_DOC)
+
+    with patch("data.metrics.bson.encode") as encode:
+        find(TEST_COLLECTION)
+    encode.assert_not_called()
+    stats = op_stats("find_one")
+    assert stats[mt.BYTES] == 0
+    assert stats[mt.SIZED] == 0
+
+
+def test_bytes_sampled():
+    mt.reset()
+
+    @mt.timed("find")
+    def find(collection):
+        return [dict(TEST_DOC), dict(TEST_DOC)]
+
+    with patch.object(mt, "BYTE_SAMPLE", 2), \
+            patch.object(mt, "_byte_calls", itertools.count()):
+        for _ in range(4):
+            find(TEST_COLLECTION)
+    stats = op_stats("find")
+    assert stats[mt.CALLS] == 4
+    assert stats[mt.SIZED] == 2
+    assert stats[mt.BYTES] == 4 * len(bson.encode(TEST_DOC))
+
+
+def test_timed_coroutine():
+    mt.reset()
+
+    @mt.timed("find_one", filt_arg="filt")
+    async def find(collection, filt):
+        return dict(TEST_DOC)
+
+    assert asyncio.run(find(TEST_COLLECTION, {"email": "a@x.com"})) \
+        == TEST_DOC
+    stats = op_stats("find_one")
+    assert stats[mt.CALLS] == 1
+    assert stats[mt.DOCS] == 1
+
+
+def test_timed_generator_records_on_exhaustion():
+    mt.reset()
+
+    @mt.timed("find")
+    def gen(collection):
+        yield dict(TEST_DOC)
+        yield dict(TEST_DOC)
+
+    docs = gen(TEST_COLLECTION)
+    assert op_stats("find") is None
+    assert len(list(docs)) == 2
+    assert op_stats("find")[mt.DOCS] == 2
+
+
+def test_timed_records_errors():
+    mt.reset()
+
+    @mt.timed("delete_one")
+    def fail(collection):
+        raise ValueError("boom")
+
+    try:
+        fail(TEST_COLLECTION)
+    except ValueError:
+        pass
+    assert op_stats("delete_one")[mt.CALLS] == 1
+
+
+def test_slow_query_log():
+    mt.reset()
+    mt.set_endpoint("people_people")
+    try:
+        with patch.object(mt, "SLOW_QUERY_MS", 0), \
+                patch.object(mt.logger, "warning") as warning:
+            mt.record(TEST_COLLECTION, "find", {"email": "x"}, 5.0, 1, 10)
+    finally:
+        mt.set_endpoint(None)
+    warning.assert_called_once()
+    slow = mt.get_stats()["recent_slow"]
+    assert slow[-1][mt.ENDPOINT] == "people_people"
+    assert op_stats("find")[mt.SLOW] == 1
+
+
+@patch("data.db_connect.client", new_callable=MagicMock)
+def test_db_calls_are_timed(mock_client):
+    mt.reset()
+    db.client = mock_client
+    mock_collection = mock_client[TEST_DB][TEST_COLLECTION]
+    mock_collection.find = MagicMock(return_value=iter([dict(TEST_DOC)]))
+    db.query(TEST_COLLECTION, {"email": "a@x.com"})
+    stats = op_stats("find")
+    assert stats[mt.CALLS] == 1
+    assert stats[mt.DOCS] == 1
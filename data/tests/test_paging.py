@@ -0,0 +1,42 @@
+import pytest
+
+import data.paging as pg
+
+
+def test_cursor_round_trip():
+    key_vals = [3, "applebananacherry"]
+    token = pg.encode_cursor(key_vals)
+    assert isinstance(token, str)
+    assert pg.decode_cursor(token) == key_vals
+
+
+@pytest.mark.parametrize("token", ["not a cursor!", "e30", "!!!"])
+def test_decode_bad_cursor(token):
+    with pytest.raises(ValueError):
+        pg.decode_cursor(token)
+
+
+@pytest.mark.parametrize("key_vals", [
+    [],
+    ["applebananacherry"],
+    [3, "applebananacherry", "extra"],
+    ["3", "applebananacherry"],
+    [True, "applebananacherry"],
+    [3, None],
+])
+def test_decode_cursor_wrong_shape(key_vals):
+    token = pg.encode_cursor(key_vals)
+    with pytest.raises(ValueError):
+        pg.decode_cursor(token, (int, str))
+
+
+def test_decode_cursor_right_shape():
+    token = pg.encode_cursor([3, "applebananacherry"])
+    assert pg.decode_cursor(token, (int, str)) == [3, "applebananacherry"]
+
+
+def test_page_size():
+    assert pg.page_size() == pg.DEFAULT_PAGE_SIZE
+    assert pg.page_size(0) == 1
+    assert pg.page_size(10) == 10
+    assert pg.page_size(10 ** 6) == pg.MAX_PAGE_SIZE
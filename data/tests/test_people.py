@@ -5,6 +5,9 @@ import pytest
 import data.people as ppl
 from data.roles import TEST_CODE
 import data.db_connect as db
+import data.memory_db as mdb
+import data.query_budget as qb
+import security.passwords as pw
 sys.path.insert(0, os.path.abspath(os.path.join
                                    (os.path.dirname(__file__), '../../')))
 
@@ -45,12 +48,15 @@ def test_create_person(mock_client):
     mock_collection.find.return_value = []
     assert not ppl.exists(ADD_EMAIL)
 
-    mock_collection.insert_one.return_value = MagicMock(inserted_id="123")
+    mock_collection.update_one.return_value = MagicMock(upserted_id="123")
 
     # Test creating person with password
     ppl.create("Professor Callahan", "NYU", ADD_EMAIL, roles=TEST_CODE,
                password=TEST_PASSWORD)
-    mock_collection.insert_one.assert_called_once()
+    mock_collection.update_one.assert_called_once()
+    filt, update = mock_collection.update_one.call_args.args
+    assert filt == {ppl.EMAIL: ADD_EMAIL}
+    assert update["$setOnInsert"][ppl.NAME] == "Professor Callahan"
 
     # Test creating person without password (should fail)
     with pytest.raises(ValueError, match="Password is required"):
@@ -59,7 +65,7 @@ def test_create_person(mock_client):
     # Test creating manuscript author without password (should work)
     ppl.create("Professor Callahan", "NYU", ADD_EMAIL, roles=TEST_CODE,
                is_manu_author=True)
-    mock_collection.insert_one.assert_called()
+    mock_collection.update_one.assert_called()
 
 
 def test_update_person():
@@ -69,35 +75,46 @@ def test_update_person():
     mock_email = "updatetest@nyu.edu"
     mock_roles = [TEST_CODE]
 
-    with patch('data.people.exists', return_value=True):
+    with patch('data.people.dbc.update',
+               return_value=MagicMock(matched_count=1)), \
+            patch('data.people.cascade.rename') as rename:
         with patch('data.people.is_valid_person', return_value=True):
             result = ppl.update(mock_email, mock_name, mock_affiliation,
                                 mock_new_email, mock_roles)
             assert result == mock_new_email
+    rename.assert_called_once_with(mock_email, mock_new_email)
+
+
+def test_update_missing_or_taken():
+    with patch("data.db_connect.client", mdb.MemoryClient()):
+        db.get_collection(ppl.PEOPLE_COLLECT).create_index(
+            [(ppl.EMAIL, 1)], unique=True)
+        with pytest.raises(ValueError, match="does not exist"):
+            ppl.update(ADD_EMAIL, "A", "NYU", ADD_EMAIL, ["AU"])
+        ppl.create("A", "NYU", ADD_EMAIL, ["AU"], is_manu_author=True)
+        ppl.create("B", "NYU", TEMP_EMAIL, ["AU"], is_manu_author=True)
+        with pytest.raises(ValueError, match="already in use"):
+            ppl.update(ADD_EMAIL, "A", "NYU", TEMP_EMAIL, ["AU"])
 
 
-@patch("data.people.exists")
 @patch("data.people.dbc.client")
-def test_delete_person(mock_client, mock_exists):
+def test_delete_person(mock_client):
     mock_collection = mock_client["gamesDB"]["people"]
     db.client = mock_client  # Ensure the client is properly mocked
 
-    mock_exists.return_value = True  # Person exists before deletion
     mock_collection.delete_one.return_value.deleted_count = 1
     # Simulate successful deletion
 
-    ppl.delete(TEMP_EMAIL)
+    assert ppl.delete(TEMP_EMAIL) == 1
 
-    # Validate `exists` call
-    mock_exists.assert_called_once_with(TEMP_EMAIL)
-    # Ensure `exists` is only called once
-
-    # Validate `delete_one` call
+    # One round trip: the delete itself says whether the person existed
     mock_collection.delete_one.assert_called_once_with({ppl.EMAIL: TEMP_EMAIL})
+    mock_collection.find.assert_not_called()
+    mock_collection.find_one.assert_not_called()
 
-    # Debugging outputs to inspect actual calls
-    print("mock_delete_one args:", mock_collection.delete_one.call_args_list)
-    print("mock_exists call args:", mock_exists.call_args_list)
+    mock_collection.delete_one.return_value.deleted_count = 0
+    with pytest.raises(ValueError):
+        ppl.delete(TEMP_EMAIL)
 
 
 @patch("data.people.read", return_value={"id1": {"name": "Test User"}})
@@ -127,53 +144,60 @@ def test_create_bad_email():
                    password=TEST_PASSWORD)
 
 
-@patch("data.people.dbc.create")
-@patch("data.people.read_one")
-def test_create_duplicate_person(mock_read_one, mock_create):
+def test_create_duplicate_person():
     dup = "duplicate@nyu.edu"
-    existing_person = {
-        "email": dup,
-        "name": "Original User",
-        "affiliation": "NYU",
-        "roles": [TEST_CODE],
-        "manuscripts": [],
-        "submission_count": 0
-    }
-
-    # First creation - no existing user
-    mock_read_one.return_value = None
-    mock_create.return_value = True
-
-    result = ppl.create("Original User", "NYU", dup, TEST_CODE,
-                        password=TEST_PASSWORD)
-    assert result == dup
-    mock_read_one.assert_called_once_with(dup)
-    mock_create.assert_called_once()
-
-    # Second creation - user exists
-    mock_read_one.return_value = existing_person
-    mock_read_one.reset_mock()
-    mock_create.reset_mock()
-
-    # Should return existing user info without creating new record
-    result = ppl.create("Duplicate User", "NYU", dup, TEST_CODE,
-                        password=TEST_PASSWORD)
-    assert result == dup
-    mock_read_one.assert_called_once_with(dup)
-    mock_create.assert_not_called()
-
-    # Test with password
-    mock_read_one.return_value = {
-        **existing_person,
-        "password": "hashed_password"
-    }
-    mock_read_one.reset_mock()
-
-    result = ppl.create("Another User", "NYU", dup, TEST_CODE,
-                        password=TEST_PASSWORD)
-    assert result == dup
-    mock_read_one.assert_called_once_with(dup)
-    mock_create.assert_not_called()
+    with patch("data.db_connect.client", mdb.MemoryClient()):
+        db.get_collection(ppl.PEOPLE_COLLECT).create_index(
+            [(ppl.EMAIL, 1)], unique=True)
+        with qb.track() as calls:
+            result = ppl.create("Original User", "NYU", dup, TEST_CODE,
+                                password=TEST_PASSWORD)
+        assert result == dup
+        # one indexed read, then the upsert
+        assert calls.count(op="find_one") == 1
+        assert calls.count(op="update_one") == 1
+
+        # Should return the email without changing the existing record,
+        # and without paying for a password hash
+        with patch("data.people.pw.hash_password") as hash_password:
+            result = ppl.create("Duplicate User", "NYU", dup, TEST_CODE,
+                                password=TEST_PASSWORD)
+        hash_password.assert_not_called()
+        assert result == dup
+        # as it always did, even with no password
+        assert ppl.create("Duplicate User", "NYU", dup, TEST_CODE) == dup
+        assert ppl.read_one(dup)[ppl.NAME] == "Original User"
+        assert db.get_collection(ppl.PEOPLE_COLLECT).count_documents(
+            {ppl.EMAIL: dup}) == 1
+
+
+def test_create_manu_author_is_one_upsert():
+    with patch("data.db_connect.client", mdb.MemoryClient()):
+        with qb.track() as calls:
+            assert ppl.create("Author", "NYU", ADD_EMAIL, TEST_CODE,
+                              is_manu_author=True) == ADD_EMAIL
+        assert calls.total == 1
+        assert ppl.exists(ADD_EMAIL)
+
+
+def test_create_race_loser():
+    """
+    Two racing upserts can both miss; the unique index makes the loser
+    fail with a duplicate key error, which is not an error for create.
+    """
+    with patch("data.db_connect.client", new_callable=MagicMock) as client:
+        coll = client[db.GAME_DB][ppl.PEOPLE_COLLECT]
+        coll.update_one.side_effect = db.DuplicateKeyError("E11000")
+        assert ppl.create("Racer", "NYU", ADD_EMAIL, TEST_CODE,
+                          password=TEST_PASSWORD) == ADD_EMAIL
+
+
+@patch("data.people.dbc.query")
+def test_get_referees(mock_query):
+    mock_query.return_value = [{ppl.EMAIL: "ref@nyu.edu"}]
+    assert ppl.get_referees() == ["ref@nyu.edu"]
+    filt = mock_query.call_args.args[1]
+    assert filt == {ppl.ROLES: "RE"}
 
 
 @pytest.mark.skip(reason="Feature not yet implemented")
@@ -228,3 +252,47 @@ def test_is_invalid_email(email):
 def test_is_valid_complex_email():
     complex_email = "zcd.220!220@n.y-u.edu"
     assert ppl.is_valid_email(complex_email)
+
+
+def test_add_manuscript():
+    with patch("data.db_connect.client", mdb.MemoryClient()):
+        db.create(ppl.PEOPLE_COLLECT, dict(TEST_DOC))
+        with qb.track() as calls:
+            assert ppl.add_manuscript(ADD_EMAIL, "manu1")
+        assert calls.total == 1
+        # repeating it is a no-op
+        assert ppl.add_manuscript(ADD_EMAIL, "manu1")
+        assert ppl.add_manuscript(ADD_EMAIL, "manu2")
+        person = ppl.read_one(ADD_EMAIL)
+        assert person[ppl.MANUSCRIPTS] == ["manu1", "manu2"]
+        assert person[ppl.SUBMISSION_COUNT] == 2
+        assert not ppl.add_manuscript("nobody@nyu.edu", "manu1")
+
+
+@patch("data.db_connect.client", new_callable=MagicMock)
+def test_append_with_count(mock_client):
+    db.client = mock_client
+    mock_collection = mock_client[db.GAME_DB][ppl.PEOPLE_COLLECT]
+    mock_collection.update_one.return_value.matched_count = 1
+    assert db.append_with_count(ppl.PEOPLE_COLLECT, {"email": "a"},
+                                "manuscripts", "m1", "submission_count")
+    mock_collection.update_one.assert_called_once_with(
+        {"email": "a", "manuscripts": {"$ne": "m1"}},
+        {"$addToSet": {"manuscripts": "m1"},
+         "$inc": {"submission_count": 1}})
+
+
+def test_authenticate_rehashes_old_hashes():
+    old_method = "pbkdf2:sha256:1000"
+    new_method = "pbkdf2:sha256:2000"
+    with patch("data.db_connect.client", mdb.MemoryClient()), \
+            patch("security.passwords.HASH_METHOD", old_method):
+        ppl.create("A", "NYU", ADD_EMAIL, ["AU"], password=TEST_PASSWORD)
+        with patch("security.passwords.HASH_METHOD", new_method):
+            assert ppl.authenticate(ADD_EMAIL, "wrong") is None
+            assert pw.method_of(ppl.read_one(ADD_EMAIL)[ppl.PASSWORD]) \
+                == old_method
+            assert ppl.authenticate(ADD_EMAIL, TEST_PASSWORD)
+            stored = ppl.read_one(ADD_EMAIL)[ppl.PASSWORD]
+            assert pw.method_of(stored) == new_method
+            assert ppl.authenticate(ADD_EMAIL, TEST_PASSWORD)
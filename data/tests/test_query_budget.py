@@ -0,0 +1,70 @@
+import pytest
+
+import data.metrics as mt
+import data.query_budget as qb
+
+TEST_COLLECTION = "budget_collection"
+
+
+@mt.timed("find_one", filt_arg="filt")
+def find_one(collection, filt):
+    return None
+
+
+def test_track_counts_calls():
+    with qb.track() as calls:
+        find_one(TEST_COLLECTION, {"email": "a@x.com"})
+        find_one(TEST_COLLECTION, {"email": "b@x.com"})
+    assert calls.total == 2
+    assert calls.count(TEST_COLLECTION, "find_one") == 2
+    assert calls.count(op="find") == 0
+
+
+def test_no_tracker_no_count():
+    assert qb.current() is None
+    find_one(TEST_COLLECTION, {"email": "a@x.com"})
+
+
+def test_repeated_query_strict():
+    with pytest.raises(qb.QueryBudgetExceeded, match=qb.REPEATED):
+        with qb.track():
+            find_one(TEST_COLLECTION, {"email": "a@x.com"})
+            find_one(TEST_COLLECTION, {"email": "a@x.com"})
+
+
+def test_n_plus_one_strict():
+    with pytest.raises(qb.QueryBudgetExceeded, match=qb.N_PLUS_ONE):
+        with qb.track():
+            for i in range(qb.SHAPE_LIMIT + 1):
+                find_one(TEST_COLLECTION, {"email": f"{i}@x.com"})
+
+
+def test_budget_strict():
+    @qb.budget(1)
+    def handler():
+        find_one(TEST_COLLECTION, {"email": "a@x.com"})
+        find_one(TEST_COLLECTION, {"name": "A"})
+
+    with pytest.raises(qb.QueryBudgetExceeded, match=qb.OVER_BUDGET):
+        qb.begin(strict=True)
+        try:
+            handler()
+        finally:
+            qb.end()
+
+
+def test_not_strict_only_warns():
+    qb.begin(strict=False)
+    find_one(TEST_COLLECTION, {"email": "a@x.com"})
+    find_one(TEST_COLLECTION, {"email": "a@x.com"})
+    qb.end()
+    assert qb.current() is None
+
+
+def test_nested_trackers():
+    with qb.track() as outer:
+        find_one(TEST_COLLECTION, {"email": "a@x.com"})
+        with qb.track() as inner:
+            find_one(TEST_COLLECTION, {"email": "b@x.com"})
+    assert inner.total == 1
+    assert outer.total == 2
@@ -0,0 +1,88 @@
+from unittest.mock import MagicMock, patch
+
+import data.db_connect as db
+import data.memory_db as mdb
+import data.query_cache as qc
+
+TEST_COLLECTION = "cache_collection"
+TEST_DB = "gamesDB"
+TEST_FILTER = {"curr_state": "SUB"}
+
+
+def test_cached_computes_once():
+    key = qc.make_key(TEST_DB, TEST_COLLECTION, "once", TEST_FILTER)
+    compute = MagicMock(return_value=[{"a": 1}])
+    assert qc.cached(key, compute) == [{"a": 1}]
+    assert qc.cached(key, compute) == [{"a": 1}]
+    compute.assert_called_once()
+
+
+def test_cached_returns_copy():
+    key = qc.make_key(TEST_DB, TEST_COLLECTION, "copy")
+    qc.cached(key, lambda: [{"a": 1}])
+    qc.cached(key, lambda: None).append({"b": 2})
+    assert qc.cached(key, lambda: None) == [{"a": 1}]
+
+
+def test_bump_invalidates():
+    key = qc.make_key(TEST_DB, TEST_COLLECTION, "bump")
+    qc.cached(key, lambda: "old")
+    qc.bump(TEST_DB, TEST_COLLECTION)
+    assert qc.cached(key, lambda: "new") == "new"
+
+
+def test_ttl_expires():
+    key = qc.make_key(TEST_DB, TEST_COLLECTION, "ttl")
+    qc.cached(key, lambda: "old")
+    with patch("data.query_cache._now", return_value=qc._now() + 3600):
+        assert qc.cached(key, lambda: "new") == "new"
+
+
+def test_evictions():
+    before = qc.get_stats()[qc.EVICTIONS]
+    with patch("data.query_cache.MAX_ENTRIES", 2):
+        for i in range(4):
+            qc.cached(qc.make_key(TEST_DB, TEST_COLLECTION, "lru", i),
+                      lambda: i)
+    assert qc.get_stats()[qc.EVICTIONS] >= before + 2
+
+
+@patch("data.db_connect.client", new_callable=MagicMock)
+def test_query_cached_until_write(mock_client):
+    db.client = mock_client
+    mock_collection = mock_client[TEST_DB][TEST_COLLECTION]
+    mock_collection.find = MagicMock(return_value=[{"name": "test"}])
+    stats = qc.get_stats()
+
+    db.query(TEST_COLLECTION, TEST_FILTER, cached=True)
+    db.query(TEST_COLLECTION, TEST_FILTER, cached=True)
+    mock_collection.find.assert_called_once()
+    assert qc.get_stats()[qc.HITS] == stats[qc.HITS] + 1
+
+    db.update(TEST_COLLECTION, {"name": "test"}, {"name": "new"})
+    db.query(TEST_COLLECTION, TEST_FILTER, cached=True)
+    assert mock_collection.find.call_count == 2
+
+
+def read_during(coll, method):
+    """
+    Make coll's `method` run a cached read just before it writes, as a
+    concurrent request could.
+    """
+    write = getattr(coll, method)
+
+    def racing_write(*args, **kwargs):
+        db.query(TEST_COLLECTION, cached=True)
+        return write(*args, **kwargs)
+    return patch.object(coll, method, side_effect=racing_write)
+
+
+def test_bulk_writes_invalidate_after_writing():
+    with patch("data.db_connect.client", mdb.MemoryClient()):
+        coll = db.get_collection(TEST_COLLECTION)
+        with read_during(coll, "insert_many"):
+            db.create_many(TEST_COLLECTION, [{"a": 1}])
+        assert db.query(TEST_COLLECTION, cached=True) == [{"a": 1}]
+        with read_during(coll, "bulk_write"):
+            db.upsert_many(TEST_COLLECTION, "a", [{"a": 1, "b": 2}])
+        assert db.query(TEST_COLLECTION, cached=True) == [{"a": 1, "b": 2}]
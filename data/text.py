@@ -18,7 +18,7 @@ def read():
         - Returns a dictionary of users keyed on user email.
         - Each user email must be the key for another dictionary.
     """
-    text = dbc.read_dict(TEXT_COLLECT, KEY)
+    text = dbc.read_dict(TEXT_COLLECT, KEY, cached=True)
     print(f'{text=}')
     return text
 
@@ -27,21 +27,27 @@ def create(key: str, title: str, text: str) -> bool:
     """
     Creates text:
         - takes key, title, text (all str)
-        - returns True if created successfully, False otherwise
+        - returns the key, whether it was new or already there
     """
-    # check if dict exists
-    existing = read_one(key)
-    if existing:
-        return key
     txt = {
         KEY: key,
         TITLE: title,
         TEXT: text
     }
-    if dbc.create(TEXT_COLLECT, txt):
-        return key
-    else:
-        return None
+    dbc.create_if_absent(TEXT_COLLECT, {KEY: key}, txt)
+    return key
+
+
+def create_many(entries: list) -> list:
+    """
+    Creates many texts at once:
+        - takes a list of dicts with key, title, text
+        - returns one bulk result per entry, in order; entries whose key
+          is already taken fail with a duplicate key error
+    """
+    txts = [{KEY: entry[KEY], TITLE: entry.get(TITLE), TEXT: entry.get(TEXT)}
+            for entry in entries]
+    return dbc.create_many(TEXT_COLLECT, txts)
 
 
 def delete(key: str) -> bool:
@@ -50,10 +56,10 @@ def delete(key: str) -> bool:
         - Text to delete (str)
         - returns True if deleted successfully, False otherwise
     """
-    if not read_one(key):
+    deleted = dbc.delete(TEXT_COLLECT, {KEY: key})
+    if not deleted:
         return False
-    print(f'{KEY=}, {key=}')
-    return dbc.delete(TEXT_COLLECT, {KEY: key})
+    return deleted
 
 
 def update(key: str, title: str = None, text: str = None) -> bool:
@@ -64,11 +70,6 @@ def update(key: str, title: str = None, text: str = None) -> bool:
             text to update (optional)
         -   returns True if updated successfully, False otherwise
     """
-    if read_one(key) is None:
-        raise ValueError(
-            f'Trying to update person that does not exist: '
-            f'{key=}'
-        )
     update_data = {
         KEY: key,
         TITLE: title,
@@ -77,7 +78,11 @@ def update(key: str, title: str = None, text: str = None) -> bool:
     ret = dbc.update(TEXT_COLLECT,
                      {KEY: key},
                      update_data)
-    print(f'Update result: {ret=}')
+    if ret.matched_count == 0:
+        raise ValueError(
+            f'Trying to update text that does not exist: '
+            f'{key=}'
+        )
     return key
 
 
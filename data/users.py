@@ -1,7 +1,7 @@
 import data.db_connect as db
 import data.people as ppl
 import data.roles as rls
-from werkzeug.security import generate_password_hash, check_password_hash
+import security.passwords as pw
 """
 This module interfaces to our user data.
 """
@@ -41,7 +41,7 @@ def create_user(email: str, password: str) -> dict:
     # Create new user
     user = {
         "email": email,
-        "password": generate_password_hash(password),
+        "password": pw.hash_password(password),
         "roles": person_roles
     }
 
@@ -57,7 +57,7 @@ def authenticate_user(email: str, password: str) -> dict:
     Authenticate a user and return their info if successful.
     """
     user = db.get_one("users", {"email": email})
-    if not user or not check_password_hash(user["password"], password):
+    if not user or not pw.verify_password(user["password"], password):
         raise AuthError("Invalid email or password")
 
     return {
@@ -0,0 +1,132 @@
+"""
+Per-call cost of a permission decision, with thousands of features and
+users: the compiled table (security.decide()) against walking the
+records as is_permitted() used to.
+    python -m security.benchmark [features] [users]
+"""
+import random
+import sys
+import timeit
+
+import security.security as sec
+import security.tokens as tok
+
+FEATURES = 2000
+USERS = 5000
+# users listed per (feature, action)
+USERS_PER_ACTION = 50
+ACTIONS = (sec.CREATE, sec.READ, sec.UPDATE, sec.DELETE)
+CALLS = 20_000
+
+
+def make_recs(n_features: int, n_users: int, seed: int = 0) -> tuple:
+    """
+    Return (records, users): random security records over n_features
+    features, with user lists drawn from n_users users and a login
+    check on writes.
+    """
+    rand = random.Random(seed)
+    users = [f'user{i}@nyu.edu' for i in range(n_users)]
+    recs = {}
+    for i in range(n_features):
+        feature = {}
+        for action in ACTIONS:
+            feature[action] = {
+                sec.USER_LIST: rand.sample(users, min(USERS_PER_ACTION,
+                                                      n_users)),
+                sec.CHECKS: {sec.LOGIN: True} if action != sec.READ else {},
+            }
+        recs[f'feature{i}'] = feature
+    return recs, users
+
+
+def interpret(recs: dict, feature_name: str, action: str, user_id: str,
+              **kwargs) -> bool:
+    """
+    The decision as is_permitted() made it before the records were
+    compiled, for comparison.
+    """
+    action_cfg = (recs.get(feature_name) or {}).get(action)
+    if action_cfg is None:
+        return False
+    ul = action_cfg.get(sec.USER_LIST, [])
+    if ul and user_id not in ul:
+        return False
+    for ck, param in action_cfg.get(sec.CHECKS, {}).items():
+        if ck not in sec.CHECK_FUNCS or not sec.CHECK_FUNCS[ck](
+                user_id, **{ck: param, **kwargs}):
+            return False
+    return True
+
+
+def make_calls(recs: dict, users: list, n: int, seed: int = 1) -> list:
+    """
+    n (feature, action, user, login key) calls: half by a listed user,
+    half by a random one.
+    """
+    rand = random.Random(seed)
+    features = list(recs)
+    calls = []
+    for i in range(n):
+        feature = rand.choice(features)
+        action = rand.choice(ACTIONS)
+        if i % 2:
+            user = rand.choice(recs[feature][action][sec.USER_LIST])
+        else:
+            user = rand.choice(users)
+        calls.append((feature, action, user))
+    tokens = {user: tok.issue(user) for _, _, user in calls}
+    return [(f, a, u, tokens[u]) for f, a, u in calls]
+
+
+def per_call_us(decide, calls: list) -> float:
+    def run():
+        for feature, action, user, key in calls:
+            decide(feature, action, user, login_key=key)
+    run()  # warm up, e.g. the token cache
+    return min(timeit.repeat(run, number=1, repeat=3)) / len(calls) * 1e6
+
+
+def compare(recs: dict, calls: list) -> tuple:
+    """
+    Return (us per call walking the records, us per call compiled,
+    how many calls the two decided differently).
+    """
+    saved = sec.snapshot
+    sec.snapshot = sec.make_snapshot(recs)
+    try:
+        compiled = per_call_us(sec.decide, calls)
+        disagree = sum(sec.decide(f, a, u, login_key=k)
+                       != interpret(recs, f, a, u, login_key=k)
+                       for f, a, u, k in calls)
+    finally:
+        sec.snapshot = saved
+    walked = per_call_us(
+        lambda *args, **kwargs: interpret(recs, *args, **kwargs), calls)
+    return walked, compiled, disagree
+
+
+def main() -> int:
+    n_features = int(sys.argv[1]) if len(sys.argv) > 1 else FEATURES
+    n_users = int(sys.argv[2]) if len(sys.argv) > 2 else USERS
+    recs, users = make_recs(n_features, n_users)
+    calls = make_calls(recs, users, CALLS)
+    print(f'{n_features} features x {len(ACTIONS)} actions, '
+          f'{n_users} users, {USERS_PER_ACTION} listed per action')
+    print(f'{"us per call":28} {"walked":>8} {"compiled":>8}')
+    # writes also pay for the login check, i.e. verifying a token
+    for label, subset in (
+            ('reads (user list only)', [c for c in calls
+                                        if c[1] == sec.READ]),
+            ('all (with login checks)', calls)):
+        walked, compiled, disagree = compare(recs, subset)
+        if disagree:
+            print(f'ERROR: the two disagree on {disagree} calls')
+            return 1
+        print(f'{label:28} {walked:8.2f} {compiled:8.2f} '
+              f'({walked / compiled:.1f}x)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+The audit log of permission decisions, kept off the request path.
+log() only samples the decision and puts it on a queue. A background
+writer thread takes decisions off the queue in batches, formats them
+as JSON lines, writes the batch and flushes once. It also rotates the
+file, gzipping old logs, so no request waits on any of that.
+Every deny is logged; allows are sampled 1 in ALLOW_SAMPLE (1 logs
+them all). If the writer falls MAX_QUEUE decisions behind, new ones
+are dropped and counted rather than blocking.
+"""
+import atexit
+import gzip
+import itertools
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+import os
+import queue
+import shutil
+import threading
+import time
+
+LOG_FILE = os.environ.get('SECURITY_LOG', 'security.log')
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 2
+ALLOW_SAMPLE = int(os.environ.get('SECURITY_LOG_ALLOW_SAMPLE', '1'))
+MAX_QUEUE = 10_000
+BATCH_SIZE = 500
+# params whose values must not reach the log
+SECRET_PARAMS = {'login_key'}
+REDACTED = '***'
+
+# stats fields
+QUEUED = 'queued'
+SAMPLED_OUT = 'sampled_out'
+DROPPED = 'dropped'
+WRITTEN = 'written'
+
+_STOP = object()
+
+_queue = queue.Queue(maxsize=MAX_QUEUE)
+_allows = itertools.count()
+_lock = threading.Lock()
+_writer = None
+_writer_pid = None
+_stats = {QUEUED: 0, SAMPLED_OUT: 0, DROPPED: 0, WRITTEN: 0}
+
+
+def _gzip_rotate(source: str, dest: str):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class BatchFileHandler(RotatingFileHandler):
+    """
+    A rotating file handler that gzips what it rotates out and flushes
+    only when flush_batch() says so, not after every record.
+    """
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, delay=True, encoding='utf-8', **kwargs)
+        self.namer = lambda name: f'{name}.gz'
+        self.rotator = _gzip_rotate
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+def _format(decision: tuple) -> logging.LogRecord:
+    created, feature, action, user_id, allowed, params = decision
+    params = {k: REDACTED if k in SECRET_PARAMS else v
+              for k, v in params.items()}
+    msg = json.dumps({
+        'feature': feature,
+        'action': action,
+        'user': user_id,
+        'allowed': allowed,
+        'params': params,
+    }, default=str)
+    return logging.makeLogRecord({'msg': msg, 'created': created,
+                                  'levelno': logging.INFO,
+                                  'levelname': 'INFO'})
+
+
+def _count(field: str, n: int = 1):
+    with _lock:
+        _stats[field] += n
+
+
+def _write(handler, batch: list):
+    for decision in batch:
+        try:
+            handler.handle(_format(decision))
+        except Exception:
+            _count(DROPPED)
+    handler.flush_batch()
+    _count(WRITTEN, len(batch))
+
+
+def _run(handler):
+    stopping = False
+    while not stopping:
+        batch = [_queue.get()]
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        if _STOP in batch:
+            stopping = True
+            batch = [d for d in batch if d is not _STOP]
+        _write(handler, batch)
+        for _ in range(len(batch) + stopping):
+            _queue.task_done()
+    handler.close()
+
+
+def _writer_running() -> bool:
+    # a forked child does not inherit its parent's writer thread
+    return (_writer is not None and _writer_pid == os.getpid()
+            and _writer.is_alive())
+
+
+def _ensure_writer():
+    global _writer, _writer_pid
+    if _writer_running():
+        return
+    with _lock:
+        if not _writer_running():
+            handler = BatchFileHandler(LOG_FILE, maxBytes=MAX_BYTES,
+                                       backupCount=BACKUP_COUNT)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            _writer = threading.Thread(target=_run, args=(handler,),
+                                       name='security-log', daemon=True)
+            _writer_pid = os.getpid()
+            _writer.start()
+
+
+def log(feature: str, action: str, user_id: str, allowed: bool,
+        params: dict):
+    """
+    Queue one decision for the log, subject to sampling.
+    """
+    if allowed and ALLOW_SAMPLE > 1 and next(_allows) % ALLOW_SAMPLE:
+        _count(SAMPLED_OUT)
+        return
+    _ensure_writer()
+    try:
+        _queue.put_nowait((time.time(), feature, action, user_id, allowed,
+                           params))
+    except queue.Full:
+        _count(DROPPED)
+        return
+    _count(QUEUED)
+
+
+def flush():
+    """
+    Wait until every queued decision is written.
+    """
+    if _writer_running():
+        _queue.join()
+
+
+def stop():
+    if _writer_running():
+        _queue.put(_STOP)
+        _writer.join(timeout=5)
+
+
+def get_stats() -> dict:
+    with _lock:
+        return dict(_stats, backlog=_queue.qsize())
+
+
+atexit.register(stop)
@@ -0,0 +1,209 @@
+"""
+Password hashing and checking, off the request thread.
+A hash costs tens to hundreds of ms of CPU. Run inline, it holds the
+GIL for all of that, and every other request in the worker waits. So
+hashes run in a small process pool instead. The number of hashes
+waiting or running is capped: past MAX_PENDING, a new one fails with
+PoolBusy at once (endpoints answer 503), rather than queueing behind
+a login burst.
+The hash cost is set by PASSWORD_HASH_METHOD; calibrate() (or running
+this module) finds the pbkdf2 iterations that take a target time on
+this machine. A stored hash made with other parameters still checks,
+and needs_rehash() tells the caller to store a fresh one.
+    python -m security.passwords [target ms]
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+import functools
+import multiprocessing
+import os
+import statistics
+import sys
+import threading
+import time
+
+from werkzeug.security import (DEFAULT_PBKDF2_ITERATIONS,
+                               check_password_hash, generate_password_hash)
+
+ALGORITHM = 'pbkdf2:sha256'
+HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD',
+                             f'{ALGORITHM}:{DEFAULT_PBKDF2_ITERATIONS}')
+# worker processes; 0 hashes inline, on the calling thread
+WORKERS = int(os.environ.get('PASSWORD_WORKERS', '2'))
+# hashes allowed to wait for a worker, on top of those running
+MAX_QUEUE = int(os.environ.get('PASSWORD_QUEUE', '16'))
+MAX_PENDING = WORKERS + MAX_QUEUE
+
+# calibration
+TARGET_MS = 250
+# below this, pbkdf2-sha256 is weaker than current guidance
+MIN_ITERATIONS = 210_000
+SAMPLE_ITERATIONS = 50_000
+SAMPLES = 5
+
+# stats fields
+PENDING = 'pending'
+HASHED = 'hashed'
+VERIFIED = 'verified'
+REJECTED = 'rejected'
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+_stats = {PENDING: 0, HASHED: 0, VERIFIED: 0, REJECTED: 0}
+
+
+class PoolBusy(Exception):
+    """
+    Too many password hashes are already waiting.
+    """
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn, not fork: a forked child would inherit our threads'
+            # locks (pymongo's among them) in whatever state they were
+            _pool = ProcessPoolExecutor(
+                max_workers=WORKERS,
+                mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _count(field: str, n: int = 1):
+    with _lock:
+        _stats[field] += n
+
+
+def _release(_future=None):
+    _count(PENDING, -1)
+    _slots.release()
+
+
+def _submit(func, *args, block=False) -> Future:
+    """
+    Start func(*args) in the pool and return its future.
+    Raises PoolBusy if MAX_PENDING calls are already pending, unless
+    block is set, in which case we wait for a slot.
+    """
+    if not WORKERS:
+        future = Future()
+        future.set_result(func(*args))
+        return future
+    if not _slots.acquire(blocking=block):
+        _count(REJECTED)
+        raise PoolBusy(f'{MAX_PENDING} password hashes already pending')
+    _count(PENDING)
+    try:
+        future = _get_pool().submit(func, *args)
+    except Exception:
+        _release()
+        raise
+    future.add_done_callback(_release)
+    return future
+
+
+def submit_hash(password: str, block: bool = False) -> Future:
+    """
+    Start hashing a password with the current HASH_METHOD.
+    """
+    _count(HASHED)
+    return _submit(generate_password_hash, password, HASH_METHOD,
+                   block=block)
+
+
+def submit_verify(stored: str, password: str) -> Future:
+    """
+    Start checking a password against a stored hash.
+    """
+    _count(VERIFIED)
+    return _submit(check_password_hash, stored, password)
+
+
+def hash_password(password: str) -> str:
+    return submit_hash(password).result()
+
+
+def hash_many(passwords: list) -> list:
+    """
+    Hash many passwords at once, for seeding and imports. Waits for
+    pool slots rather than failing when the pool is busy.
+    """
+    futures = [submit_hash(password, block=True) for password in passwords]
+    return [future.result() for future in futures]
+
+
+def verify_password(stored: str, password: str) -> bool:
+    return submit_verify(stored, password).result()
+
+
+def method_of(stored: str) -> str:
+    """
+    The method a stored hash was made with, e.g. 'pbkdf2:sha256:600000'.
+    """
+    return stored.split('$', 1)[0]
+
+
+@functools.lru_cache(maxsize=None)
+def full_method(method: str) -> str:
+    """
+    The method as a hash made with it records it, with werkzeug's
+    defaults filled in: 'pbkdf2' is 'pbkdf2:sha256:600000', say.
+    Found by hashing a probe, in the pool, once per method.
+    """
+    return method_of(_submit(generate_password_hash, 'probe', method,
+                             block=True).result())
+
+
+def needs_rehash(stored: str) -> bool:
+    """
+    Was this hash made with parameters other than the current ones?
+    """
+    return method_of(stored) != full_method(HASH_METHOD)
+
+
+def get_stats() -> dict:
+    with _lock:
+        return dict(_stats, method=HASH_METHOD, workers=WORKERS,
+                    max_pending=MAX_PENDING)
+
+
+def time_hash(method: str, samples: int = SAMPLES) -> float:
+    """
+    The median time, in ms, to hash a password with method, here.
+    """
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        generate_password_hash('calibration', method)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def calibrate(target_ms: float = TARGET_MS) -> int:
+    """
+    Return the pbkdf2 iterations that take about target_ms on this
+    machine, rounded down to a thousand. pbkdf2's cost is linear in
+    its iterations, so we time a sample and scale.
+    """
+    ms = time_hash(f'{ALGORITHM}:{SAMPLE_ITERATIONS}')
+    iterations = int(SAMPLE_ITERATIONS * target_ms / ms)
+    return max(iterations // 1000 * 1000, 1000)
+
+
+def main() -> int:
+    target_ms = float(sys.argv[1]) if len(sys.argv) > 1 else TARGET_MS
+    iterations = calibrate(target_ms)
+    method = f'{ALGORITHM}:{iterations}'
+    print(f'{time_hash(method):.0f} ms per hash with {method}')
+    if iterations < MIN_ITERATIONS:
+        print(f'WARNING: fewer than {MIN_ITERATIONS} iterations is weak; '
+              f'allow more time per hash.')
+    print(f'export PASSWORD_HASH_METHOD={method}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,12 @@
-from functools import wraps
+from collections import namedtuple
+from functools import partial, wraps
 import logging
-import json
-from logging.handlers import RotatingFileHandler
-from functools import wraps
+import os
+import threading
 
-# import data.db_connect as dbc
+import data.db_connect as dbc
+import security.decision_log as dl
+import security.tokens as tok
 
 """
 Our record format to meet our requirements (see security.md) will be:
@@ -50,25 +52,34 @@ Our record format to meet our requirements (see security.md) will be:
     },
     feature_name2: # etc.
 }
-"""
-
 
-# set up a dedicated security logger that writes to security.log
-logger = logging.getLogger('security')
-logger.setLevel(logging.INFO)
+In the DB, each feature is one doc in COLLECT_NAME:
+    {feature: feature_name1, actions: {create: {...}, read: {...}, ...}}
+and one more doc, {feature: VERSION_DOC, version: n}, counts changes.
+Every write through this module bumps the version.
 
-# rotate after 5 MB, keep 2 backups
-handler = RotatingFileHandler('security.log',
-                              maxBytes=5*1024*1024,
-                              backupCount=2,
-                              encoding='utf-8')
-handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(message)s'
-))
-logger.addHandler(handler)
+Permission checks never wait on the DB. The records and their compiled
+table are one immutable snapshot, swapped in whole. A background
+thread reads just the version doc every RELOAD_S seconds, and only
+when it has moved does it load the records and swap in a new snapshot,
+so a policy change takes effect within seconds, without a restart.
+The first snapshot is loaded by that thread too, started by the first
+check (or by start(), at startup); until it arrives, the compiled
+temp_recs apply. If the DB cannot be reached, the last snapshot stays
+in force. Until any records have been saved to the DB, temp_recs apply.
+"""
 
 
 COLLECT_NAME = 'security'
+# seconds between version checks; 0 never reloads
+RELOAD_S = float(os.environ.get('SECURITY_RELOAD_S', '5'))
+
+# DB fields
+FEATURE = 'feature'
+ACTIONS = 'actions'
+VERSION = 'version'
+VERSION_DOC = '__version__'
+
 CREATE = 'create'
 READ = 'read'
 UPDATE = 'update'
@@ -85,8 +96,20 @@ BAD_FEATURE = 'baaaaad feature'
 PEOPLE_MISSING_ACTION = READ
 GOOD_USER_ID = 'ejc369@nyu.edu'
 
-security_recs = None
-# These will come from the DB soon:
+logger = logging.getLogger(__name__)
+
+# version: the DB's version doc when loaded (None if there is none);
+# recs: the records; table: recs as compiled by compile_recs().
+# Never changed in place: a reload swaps in a new one.
+Snapshot = namedtuple('Snapshot', ['version', 'recs', 'table'])
+snapshot = None
+
+_load_lock = threading.Lock()
+_reloader = None
+_reloader_pid = None
+_stop_reloading = threading.Event()
+
+# What applies until records are saved to the DB:
 temp_recs = {
     PEOPLE: {
         CREATE: {
@@ -101,9 +124,9 @@ temp_recs = {
 
 def is_valid_key(user_id: str, login_key: str):
     """
-    This is just a mock of the real is_valid_key() we'll write later.
+    Is login_key a live session token (see tokens.py) for user_id?
     """
-    return True
+    return tok.verify(login_key) == user_id
 
 
 def check_login(user_id: str, **kwargs):
@@ -118,11 +141,183 @@ CHECK_FUNCS = {
 }
 
 
+def _deny(user_id: str, **kwargs) -> bool:
+    return False
+
+
+def compile_recs(recs: dict) -> dict:
+    """
+    Flatten security records for is_permitted(), so a check is one
+    dict lookup, one set lookup and a call per check.
+    Returns:
+        dict: (feature, action) -> (frozenset of users, or None if any
+              user will do; tuple of checks), where each check is its
+              CHECK_FUNCS function with its param bound, to be called
+              as check(user_id, **kwargs). An unknown check denies.
+    """
+    table = {}
+    for feature, actions in recs.items():
+        for action, cfg in actions.items():
+            users = frozenset(cfg.get(USER_LIST) or ()) or None
+            checks = tuple(
+                partial(CHECK_FUNCS[ck], **{ck: param})
+                if ck in CHECK_FUNCS else _deny
+                for ck, param in cfg.get(CHECKS, {}).items())
+            table[(feature, action)] = (users, checks)
+    return table
+
+
+def make_snapshot(recs: dict, version: int = None) -> Snapshot:
+    return Snapshot(version, recs, compile_recs(recs))
+
+
+# in force until the first snapshot is loaded
+_fallback = make_snapshot(temp_recs)
+
+
+def fetch_version() -> int:
+    """
+    The DB's version of the records: one indexed lookup of one field.
+    None if no records have been saved.
+    """
+    docs = dbc.query(COLLECT_NAME, {FEATURE: VERSION_DOC},
+                     projection={VERSION: 1}, limit=1)
+    return docs[0].get(VERSION) if docs else None
+
+
+def fetch_recs() -> dict:
+    docs = dbc.query(COLLECT_NAME, {FEATURE: {'$ne': VERSION_DOC}})
+    return {doc[FEATURE]: doc.get(ACTIONS, {}) for doc in docs}
+
+
+def load() -> Snapshot:
+    """
+    Load the records from the DB and swap in a new snapshot.
+    The version is read first: a write that lands between the two reads
+    leaves the snapshot looking older than it is, and the next check
+    loads it again, never the reverse.
+    If the DB cannot be reached, the snapshot in force is kept (or, if
+    there is none yet, temp_recs apply).
+    """
+    global snapshot
+    with _load_lock:
+        try:
+            version = fetch_version()
+            recs = fetch_recs() if version is not None else temp_recs
+            snapshot = make_snapshot(recs, version)
+        except Exception as err:
+            logger.warning(f'Could not load security records: {err}')
+            if snapshot is None:
+                snapshot = _fallback
+        loaded = snapshot
+    _ensure_reloader()
+    return loaded
+
+
+def refresh() -> bool:
+    """
+    Load the records if their version in the DB has moved.
+    Returns True if a new snapshot was loaded.
+    """
+    try:
+        version = fetch_version()
+    except Exception as err:
+        logger.warning(f'Could not check security records: {err}')
+        return False
+    if snapshot is not None and version == snapshot.version:
+        return False
+    load()
+    return True
+
+
+def _reload_loop():
+    if snapshot is None:
+        load()
+    while RELOAD_S > 0 and not _stop_reloading.wait(RELOAD_S):
+        refresh()
+
+
+def _reloader_running() -> bool:
+    # a forked child does not inherit its parent's reloader thread
+    return (_reloader is not None and _reloader_pid == os.getpid()
+            and _reloader.is_alive())
+
+
+def _ensure_reloader():
+    global _reloader, _reloader_pid
+    if _reloader_running() or (RELOAD_S <= 0 and snapshot is not None):
+        return
+    with _load_lock:
+        if not _reloader_running():
+            _stop_reloading.clear()
+            _reloader = threading.Thread(target=_reload_loop,
+                                         name='security-reload', daemon=True)
+            _reloader_pid = os.getpid()
+            _reloader.start()
+
+
+def start():
+    """
+    Load the first snapshot, and then keep it fresh, in the background.
+    """
+    _ensure_reloader()
+
+
+def stop_reloader():
+    if _reloader_running():
+        _stop_reloading.set()
+        _reloader.join(timeout=5)
+
+
+def current() -> Snapshot:
+    """
+    The snapshot in force. Never waits on the DB: before the first
+    snapshot is loaded, this starts loading it in the background and
+    returns the compiled temp_recs.
+    """
+    if snapshot is not None:
+        return snapshot
+    start()
+    return snapshot or _fallback
+
+
 def read() -> dict:
-    global security_recs
-    # dbc.read()
-    security_recs = temp_recs
-    return security_recs
+    """
+    Return the records in force.
+    The records are shared by every caller: do not change them.
+    """
+    return current().recs
+
+
+def bump_version() -> int:
+    doc = dbc.find_and_update(COLLECT_NAME, {FEATURE: VERSION_DOC},
+                              {'$inc': {VERSION: 1}}, upsert=True)
+    return doc[VERSION]
+
+
+def save_feature(feature_name: str, actions: dict) -> int:
+    """
+    Store a feature's records in the DB, replacing any it had, and load
+    them here at once. Other processes pick them up at their next
+    version check.
+    Returns the new version.
+    """
+    dbc.upsert_many(COLLECT_NAME, FEATURE,
+                    [{FEATURE: feature_name, ACTIONS: actions}])
+    version = bump_version()
+    load()
+    return version
+
+
+def delete_feature(feature_name: str) -> int:
+    """
+    Drop a feature's records from the DB; its actions are then denied.
+    Returns the new version.
+    """
+    dbc.delete(COLLECT_NAME, {FEATURE: feature_name})
+    version = bump_version()
+    load()
+    return version
 
 
 def needs_recs(fn):
@@ -131,51 +326,39 @@ def needs_recs(fn):
     """
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        global security_recs
-        if not security_recs:
-            security_recs = read()
+        start()
         return fn(*args, **kwargs)
     return wrapper
 
 
 @needs_recs
 def read_feature(feature_name: str) -> dict:
-    if feature_name in security_recs:
-        return security_recs[feature_name]
-    else:
-        return None
+    return current().recs.get(feature_name)
+
+
+def decide(feature_name: str, action: str, user_id: str,
+           **kwargs) -> bool:
+    """
+    Is user_id permitted action on feature_name? Not logged.
+    """
+    rule = current().table.get((feature_name, action))
+    # default-deny if no config exists
+    if rule is None:
+        return False
+    users, checks = rule
+    if users is not None and user_id not in users:
+        return False
+    for check in checks:
+        if not check(user_id, **kwargs):
+            return False
+    return True
 
 
-@needs_recs
 def is_permitted(feature_name: str, action: str,
                  user_id: str, **kwargs) -> bool:
+    allowed = decide(feature_name, action, user_id, **kwargs)
 
-    prot = read_feature(feature_name) or {}
-    action_cfg = prot.get(action)
+    # **LOG IT** before returning (queued; written off the request path)
+    dl.log(feature_name, action, user_id, allowed, kwargs)
 
-    # default-deny if no config exists
-    if action_cfg is None:
-        allowed = False
-    else:
-        # user_list check
-        ul = action_cfg.get(USER_LIST, [])
-        if ul and user_id not in ul:
-            allowed = False
-        else:
-            # run all checks
-            allowed = True
-            for ck, param in action_cfg.get(CHECKS, {}).items():
-                if ck not in CHECK_FUNCS or not CHECK_FUNCS[ck](user_id, **{ck: param, **kwargs}):
-                    allowed = False
-                    break
-
-    # **LOG IT** before returning
-    logger.info(json.dumps({
-        'feature': feature_name,
-        'action':   action,
-        'user':     user_id,
-        'allowed':  allowed,
-        'params':   kwargs
-    }))
-
-    return allowed
\ No newline at end of file
+    return allowed
@@ -0,0 +1,66 @@
+import gzip
+import json
+from unittest.mock import patch
+
+import pytest
+
+import security.decision_log as dl
+import security.security as sec
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    """
+    A writer of our own, on a temp file.
+    """
+    path = tmp_path / "security.log"
+    dl.stop()
+    with patch.object(dl, "LOG_FILE", str(path)):
+        yield path
+        dl.stop()
+
+
+def lines(path):
+    dl.flush()
+    return [json.loads(line.split(" ", 2)[2])
+            for line in path.read_text().splitlines()]
+
+
+def test_log_written(log_file):
+    dl.log(sec.PEOPLE, sec.CREATE, "a@nyu.edu", False,
+           {sec.LOGIN_KEY: "secret token", "ip": "1.2.3.4"})
+    [entry] = lines(log_file)
+    assert entry["user"] == "a@nyu.edu"
+    assert entry["allowed"] is False
+    assert entry["params"] == {sec.LOGIN_KEY: dl.REDACTED, "ip": "1.2.3.4"}
+
+
+def test_allows_sampled(log_file):
+    with patch.object(dl, "ALLOW_SAMPLE", 3), \
+            patch.object(dl, "_allows", iter(range(100))):
+        for _ in range(6):
+            dl.log(sec.PEOPLE, sec.READ, "a@nyu.edu", True, {})
+        for _ in range(2):
+            dl.log(sec.PEOPLE, sec.READ, "a@nyu.edu", False, {})
+    allowed = [entry["allowed"] for entry in lines(log_file)]
+    assert allowed.count(True) == 2
+    assert allowed.count(False) == 2
+
+
+def test_gzip_rotation(log_file):
+    with patch.object(dl, "MAX_BYTES", 500):
+        dl.stop()
+        for i in range(50):
+            dl.log(sec.PEOPLE, sec.READ, f"user{i}@nyu.edu", False, {})
+        dl.flush()
+    rotated = log_file.parent / "security.log.1.gz"
+    assert rotated.exists()
+    with gzip.open(rotated, "rt") as f:
+        assert "user" in f.read()
+
+
+def test_is_permitted_queues_decision():
+    with patch("security.security.dl.log") as log, \
+            patch.object(sec, "snapshot", sec.make_snapshot(sec.temp_recs)):
+        assert not sec.is_permitted(sec.PEOPLE, sec.CREATE, "nobody")
+    log.assert_called_once_with(sec.PEOPLE, sec.CREATE, "nobody", False, {})
@@ -0,0 +1,65 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+import security.passwords as pw
+
+FAST_METHOD = "pbkdf2:sha256:1000"
+
+
+@pytest.fixture
+def fast_hashes():
+    with patch.object(pw, "HASH_METHOD", FAST_METHOD):
+        yield
+
+
+def test_hash_and_verify_in_pool(fast_hashes):
+    hashed = pw.hash_password("secret")
+    assert pw.method_of(hashed) == FAST_METHOD
+    assert pw.verify_password(hashed, "secret")
+    assert not pw.verify_password(hashed, "wrong")
+    assert pw.get_stats()[pw.PENDING] == 0
+
+
+def test_hash_inline(fast_hashes):
+    with patch.object(pw, "WORKERS", 0):
+        hashed = pw.hash_password("secret")
+    assert pw.verify_password(hashed, "secret")
+
+
+def test_hash_many(fast_hashes):
+    hashes = pw.hash_many(["a", "b", "c"])
+    assert [pw.verify_password(h, p) for h, p in zip(hashes, "abc")] == \
+        [True, True, True]
+
+
+def test_pool_busy(fast_hashes):
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    with patch.object(pw, "_slots", slots):
+        with pytest.raises(pw.PoolBusy):
+            pw.hash_password("secret")
+    assert pw.get_stats()[pw.REJECTED] >= 1
+
+
+def test_needs_rehash():
+    with patch.object(pw, "HASH_METHOD", FAST_METHOD):
+        assert not pw.needs_rehash(f"{FAST_METHOD}$salt$hash")
+        assert pw.needs_rehash("pbkdf2:sha256:500$salt$hash")
+        assert pw.needs_rehash("scrypt:32768:8:1$salt$hash")
+
+
+def test_needs_rehash_short_method():
+    # werkzeug fills in scrypt's defaults, so a hash it made is current
+    with patch.object(pw, "HASH_METHOD", "scrypt"):
+        hashed = pw.hash_password("secret")
+        assert pw.method_of(hashed) != "scrypt"
+        assert not pw.needs_rehash(hashed)
+        assert pw.needs_rehash(f"{FAST_METHOD}$salt$hash")
+
+
+def test_calibrate():
+    # a sample of SAMPLE_ITERATIONS taking 25 ms scales to 250 ms
+    with patch.object(pw, "time_hash", return_value=25.0):
+        assert pw.calibrate(250) == pw.SAMPLE_ITERATIONS * 10
@@ -1,15 +1,45 @@
+import threading
+import time
+from unittest.mock import patch
+
 import pytest
 
+import data.db_connect as dbc
+import data.memory_db as mdb
+import security.benchmark as bench
 import security.security as sec
+import security.tokens as tok
+
+UPDATE_RULE = {sec.UPDATE: {sec.USER_LIST: [sec.GOOD_USER_ID],
+                            sec.CHECKS: {}}}
+
+
+@pytest.fixture(autouse=True)
+def memory_db():
+    """
+    An empty in-memory DB, no snapshot loaded and no reloader thread.
+    """
+    sec.stop_reloader()
+    with patch('data.db_connect.client', mdb.MemoryClient()), \
+            patch.object(sec, 'snapshot', None), \
+            patch.object(sec, 'RELOAD_S', 0):
+        yield
+        # let any background load finish while the DB is still ours
+        sec.stop_reloader()
 
 
 def test_check_login_good():
     assert sec.check_login(sec.GOOD_USER_ID,
-                           login_key='any key will do for now')
+                           login_key=tok.issue(sec.GOOD_USER_ID))
 
 
 def test_check_login_bad():
     assert not sec.check_login(sec.GOOD_USER_ID)
+    assert not sec.check_login(sec.GOOD_USER_ID,
+                               login_key='any key will do for now')
+    assert not sec.check_login(sec.GOOD_USER_ID,
+                               login_key=tok.issue('someone@nyu.edu'))
+    assert not sec.check_login('a@b.com', login_key='abc.\u00e9')
 
 
 def test_read():
@@ -44,4 +74,162 @@ def test_is_permitted_bad_check():
 
 def test_is_permitted_all_good():
     assert sec.is_permitted(sec.PEOPLE, sec.CREATE, sec.GOOD_USER_ID,
-                            login_key='any key for now')
\ No newline at end of file
+                            login_key='any key for now')
+
+
+def test_compile_recs():
+    table = sec.compile_recs({
+        sec.PEOPLE: {
+            sec.CREATE: {sec.USER_LIST: [sec.GOOD_USER_ID],
+                         sec.CHECKS: {sec.LOGIN: True, 'Bad check': True}},
+            sec.READ: {sec.USER_LIST: [], sec.CHECKS: {}},
+        },
+    })
+    users, checks = table[(sec.PEOPLE, sec.CREATE)]
+    assert users == frozenset([sec.GOOD_USER_ID])
+    assert len(checks) == 2
+    assert not checks[1](sec.GOOD_USER_ID)
+    assert table[(sec.PEOPLE, sec.READ)] == (None, ())
+
+
+def test_decide_uses_compiled_table():
+    sec.snapshot = sec.make_snapshot({
+        sec.PEOPLE: {sec.UPDATE: {sec.USER_LIST: [sec.GOOD_USER_ID],
+                                  sec.CHECKS: {sec.LOGIN: True}}},
+    })
+    key = tok.issue(sec.GOOD_USER_ID)
+    assert sec.decide(sec.PEOPLE, sec.UPDATE, sec.GOOD_USER_ID,
+                      login_key=key)
+    assert not sec.decide(sec.PEOPLE, sec.UPDATE, sec.GOOD_USER_ID)
+    assert not sec.decide(sec.PEOPLE, sec.UPDATE, 'someone@nyu.edu',
+                          login_key=key)
+    assert not sec.decide(sec.PEOPLE, sec.DELETE, sec.GOOD_USER_ID,
+                          login_key=key)
+
+
+def test_read_recompiles():
+    sec.load()
+    assert (sec.PEOPLE, sec.CREATE) in sec.snapshot.table
+
+
+def save_directly(feature, actions):
+    """
+    Write records as another process would, without loading them here.
+    """
+    dbc.upsert_many(sec.COLLECT_NAME, sec.FEATURE,
+                    [{sec.FEATURE: feature, sec.ACTIONS: actions}])
+    sec.bump_version()
+
+
+def test_first_check_never_waits():
+    save_directly(sec.PEOPLE, UPDATE_RULE)
+    db_free = threading.Event()
+
+    def slow_query(*args, **kwargs):
+        db_free.wait(5)
+        return real_query(*args, **kwargs)
+
+    real_query = dbc.query
+    with patch.object(dbc, 'query', side_effect=slow_query):
+        # the DB is stuck, yet we get an answer at once, from temp_recs
+        start = time.monotonic()
+        assert sec.read() is sec.temp_recs
+        assert not sec.decide(sec.PEOPLE, sec.UPDATE, sec.GOOD_USER_ID)
+        assert time.monotonic() - start < 1
+        db_free.set()
+        sec.stop_reloader()
+    assert sec.snapshot.version == 1
+    assert sec.decide(sec.PEOPLE, sec.UPDATE, sec.GOOD_USER_ID)
+
+
+def test_read_does_not_reload():
+    sec.save_feature(sec.PEOPLE, UPDATE_RULE)
+    with patch.object(dbc, 'query') as query:
+        assert sec.read() == {sec.PEOPLE: UPDATE_RULE}
+        assert sec.read_feature(sec.PEOPLE) == UPDATE_RULE
+    query.assert_not_called()
+
+
+def test_nothing_saved_uses_temp_recs():
+    snap = sec.load()
+    assert snap.version is None
+    assert snap.recs is sec.temp_recs
+
+
+def test_save_feature():
+    assert sec.save_feature(sec.PEOPLE, UPDATE_RULE) == 1
+    assert sec.snapshot.version == 1
+    assert sec.read_feature(sec.PEOPLE) == UPDATE_RULE
+    assert sec.decide(sec.PEOPLE, sec.UPDATE, sec.GOOD_USER_ID)
+    # temp_recs no longer apply
+    assert not sec.decide(sec.PEOPLE, sec.CREATE, sec.GOOD_USER_ID)
+    assert sec.save_feature(sec.PEOPLE, {}) == 2
+    assert not sec.decide(sec.PEOPLE, sec.UPDATE, sec.GOOD_USER_ID)
+
+
+def test_delete_feature():
+    sec.save_feature(sec.PEOPLE, UPDATE_RULE)
+    assert sec.delete_feature(sec.PEOPLE) == 2
+    assert sec.read_feature(sec.PEOPLE) is None
+    assert not sec.decide(sec.PEOPLE, sec.UPDATE, sec.GOOD_USER_ID)
+
+
+def test_refresh_only_loads_on_new_version():
+    sec.save_feature(sec.PEOPLE, UPDATE_RULE)
+    with patch.object(sec, 'fetch_recs', wraps=sec.fetch_recs) as fetch:
+        assert not sec.refresh()
+        fetch.assert_not_called()
+        save_directly(sec.PEOPLE, {})
+        assert sec.refresh()
+        fetch.assert_called_once()
+    assert not sec.decide(sec.PEOPLE, sec.UPDATE, sec.GOOD_USER_ID)
+
+
+def test_snapshot_swapped_whole():
+    sec.save_feature(sec.PEOPLE, UPDATE_RULE)
+    old = sec.snapshot
+    sec.save_feature(sec.PEOPLE, {})
+    assert sec.snapshot is not old
+    assert old.recs[sec.PEOPLE] == UPDATE_RULE
+    assert (sec.PEOPLE, sec.UPDATE) in old.table
+
+
+def test_db_down_keeps_snapshot():
+    sec.save_feature(sec.PEOPLE, UPDATE_RULE)
+    old = sec.snapshot
+    with patch.object(dbc, 'query',
+                      side_effect=dbc.pm.errors.ServerSelectionTimeoutError(
+                          'down')):
+        assert not sec.refresh()
+        assert sec.load() is old
+    assert sec.decide(sec.PEOPLE, sec.UPDATE, sec.GOOD_USER_ID)
+
+
+def test_db_down_at_start_uses_temp_recs():
+    with patch.object(dbc, 'query',
+                      side_effect=dbc.pm.errors.ServerSelectionTimeoutError(
+                          'down')):
+        assert sec.load().recs is sec.temp_recs
+
+
+def test_reloader_picks_up_change():
+    sec.save_feature(sec.PEOPLE, UPDATE_RULE)
+    with patch.object(sec, 'RELOAD_S', 0.01):
+        sec.load()
+        try:
+            save_directly(sec.PEOPLE, {})
+            deadline = time.monotonic() + 5
+            while (sec.snapshot.version != 2
+                   and time.monotonic() < deadline):
+                time.sleep(0.01)
+        finally:
+            sec.stop_reloader()
+    assert sec.snapshot.version == 2
+    assert not sec.decide(sec.PEOPLE, sec.UPDATE, sec.GOOD_USER_ID)
+
+
+def test_benchmark_agrees():
+    recs, users = bench.make_recs(20, 50)
+    calls = bench.make_calls(recs, users, 200)
+    _, _, disagree = bench.compare(recs, calls)
+    assert disagree == 0
@@ -0,0 +1,62 @@
+from unittest.mock import patch
+
+import security.tokens as tok
+
+USER = "ejc369@nyu.edu"
+
+
+def test_issue_and_verify():
+    token = tok.issue(USER)
+    assert tok.verify(token) == USER
+    # and again, from the cache
+    assert tok.verify(token) == USER
+
+
+def test_forged():
+    token = tok.issue(USER)
+    payload, sig = token.split(tok.SEPARATOR)
+    other_payload = tok.issue("intruder@nyu.edu").split(tok.SEPARATOR)[0]
+    assert tok.verify(f"{other_payload}{tok.SEPARATOR}{sig}") is None
+    assert tok.verify(payload) is None
+    assert tok.verify("not a token") is None
+    assert tok.verify(None) is None
+
+
+def test_non_ascii():
+    payload = tok.issue(USER).split(tok.SEPARATOR)[0]
+    assert tok.verify(f"{payload}{tok.SEPARATOR}abc\u00e9") is None
+    assert tok.verify(f"\u00e9{tok.SEPARATOR}abc") is None
+    assert tok.verify(f"{payload}{tok.SEPARATOR}\ud800") is None
+    assert not tok.revoke(f"{payload}{tok.SEPARATOR}abc\u00e9")
+
+
+def test_other_secret():
+    token = tok.issue(USER)
+    with patch.object(tok, "SECRET", b"another secret"):
+        tok.clear()
+        assert tok.verify(token) is None
+
+
+def test_expired():
+    token = tok.issue(USER, ttl_s=60)
+    assert tok.verify(token) == USER
+    with patch("security.tokens.time.time",
+               return_value=tok.time.time() + 61):
+        assert tok.verify(token) is None
+
+
+def test_revoke():
+    token = tok.issue(USER)
+    other = tok.issue(USER)
+    assert tok.verify(token) == USER
+    assert tok.revoke(token)
+    assert tok.verify(token) is None
+    assert tok.verify(other) == USER
+    assert not tok.revoke("not a token")
+
+
+def test_cache_is_bounded():
+    with patch.object(tok, "MAX_CACHED", 2):
+        for _ in range(5):
+            tok.verify(tok.issue(USER))
+        assert len(tok._verified) == 2
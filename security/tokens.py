@@ -0,0 +1,148 @@
+"""
+Signed, expiring session tokens.
+/people/login issues one once the password checks out; after that a
+request proves who it is with the token alone, and checking it costs
+an HMAC (or, for a token seen before, a dict lookup), never a password
+hash or a trip to the people collection.
+A token is base64url(payload) + '.' + base64url(HMAC-SHA256(payload)),
+where the payload holds the user, the expiry time and a random token
+ID, so that one token can be revoked (e.g. on logout).
+The secret comes from SESSION_SECRET. Without it, each process makes
+its own, and tokens die with the process and do not work across
+workers, so a warning is logged. Revocations are also per process.
+"""
+import base64
+from collections import OrderedDict
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SECRET = os.environ.get('SESSION_SECRET', '').encode()
+if not SECRET:
+    logger.warning('SESSION_SECRET is not set: tokens will only work in '
+                   'this process, until it exits')
+    SECRET = secrets.token_bytes(32)
+TTL_S = int(os.environ.get('SESSION_TTL_S', str(8 * 60 * 60)))
+# how many verified tokens to remember (one per live session is ideal)
+MAX_CACHED = int(os.environ.get('SESSION_CACHE_SIZE', '10000'))
+
+# payload fields
+USER = 'sub'
+EXPIRES = 'exp'
+TOKEN_ID = 'jti'
+
+CLAIMS = (USER, EXPIRES, TOKEN_ID)
+
+SEPARATOR = '.'
+
+_lock = threading.Lock()
+# token -> payload, least recently used first
+_verified = OrderedDict()
+# token ID -> expiry; dropped once the token would have expired anyway
+_revoked = {}
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(SECRET, payload.encode(),
+                               hashlib.sha256).digest())
+
+
+def issue(user_id: str, ttl_s: int = None) -> str:
+    """
+    Return a token proving user_id logged in, good for ttl_s seconds.
+    """
+    payload = _b64encode(json.dumps({
+        USER: user_id,
+        EXPIRES: int(time.time()) + (TTL_S if ttl_s is None else ttl_s),
+        TOKEN_ID: secrets.token_urlsafe(12),
+    }, separators=(',', ':')).encode())
+    return f'{payload}{SEPARATOR}{_sign(payload)}'
+
+
+def _decode(token: str) -> dict:
+    """
+    Return the token's payload if its signature is good, else None.
+    """
+    try:
+        payload, sig = token.split(SEPARATOR)
+    except (AttributeError, ValueError):
+        return None
+    try:
+        # as bytes: compare_digest() rejects non-ASCII str
+        if not hmac.compare_digest(sig.encode(), _sign(payload).encode()):
+            return None
+    except UnicodeEncodeError:
+        return None
+    try:
+        return json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+
+
+def _is_live(claims: dict, now: float) -> bool:
+    return claims[EXPIRES] > now and claims[TOKEN_ID] not in _revoked
+
+
+def verify(token: str) -> str:
+    """
+    Return the user a token was issued to, or None if it is forged,
+    expired or revoked.
+    """
+    now = time.time()
+    with _lock:
+        claims = _verified.get(token)
+        if claims is not None:
+            if _is_live(claims, now):
+                _verified.move_to_end(token)
+                return claims[USER]
+            del _verified[token]
+            return None
+    claims = _decode(token)
+    if not isinstance(claims, dict) or not all(c in claims for c in CLAIMS):
+        return None
+    with _lock:
+        if not _is_live(claims, now):
+            return None
+        _verified[token] = claims
+        if len(_verified) > MAX_CACHED:
+            _verified.popitem(last=False)
+    return claims[USER]
+
+
+def revoke(token: str) -> bool:
+    """
+    Stop a (validly signed) token from working before it expires.
+    Returns False if the token was not one of ours.
+    """
+    claims = _decode(token)
+    if not isinstance(claims, dict) or TOKEN_ID not in claims:
+        return False
+    now = time.time()
+    with _lock:
+        for token_id, expires in list(_revoked.items()):
+            if expires <= now:
+                del _revoked[token_id]
+        _revoked[claims[TOKEN_ID]] = claims.get(EXPIRES, now)
+        _verified.pop(token, None)
+    return True
+
+
+def clear():
+    with _lock:
+        _verified.clear()
+        _revoked.clear()
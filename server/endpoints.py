@@ -1,8 +1,16 @@
-from flask import Flask
+from flask import Flask, request
 from flask_restx import Resource, Api
 from flask_cors import CORS
 from datetime import datetime, timezone
 import data.roles as rls
+import data.identity_map as idm
+import data.indexes as idx
+import data.manus.ids as ids
+import data.metrics as mt
+import data.query_budget as qb
+import data.query_cache as qc
+import security.decision_log as dl
+import security.passwords as pw
 import sys
 import os
 import subprocess
@@ -25,6 +33,30 @@ api.add_namespace(text_api, path='')
 api.add_namespace(people_api, path='')
 api.add_namespace(manu_api, path='')
 
+
+@app.before_request
+def begin_request():
+    # each request gets its own identity map for single-doc reads
+    idm.begin()
+    # so the slow query log can say who made a slow call
+    mt.set_endpoint(request.endpoint)
+    # count its data calls, to catch repeats and N+1 loops
+    qb.begin()
+
+
+@app.teardown_request
+def end_request(exc):
+    idm.end()
+    mt.set_endpoint(None)
+    qb.end(request.endpoint)
+
+
+# Build or verify our indexes (the unique ones stand in for duplicate
+# checks), in the background so that importing this module waits on no
+# I/O. Deploys also run them up front (see rebuild.sh).
+if os.environ.get('MONGO_ENSURE_INDEXES', '1') == '1':
+    idx.ensure_indexes_in_background()
+
 DATE = datetime.now(timezone.utc).isoformat()  # should get the actual date
 DATE_RESP = 'Date'
 EDITOR = 'ayy9673@nyu.edu'
@@ -112,7 +144,12 @@ class DevInfo(Resource):
             "env": dict(os.environ) if app.debug else "Hidden in production",
             "routes": sorted(
                 rule.rule for rule in api.app.url_map.iter_rules()
-            )
+            ),
+            "query_cache": qc.get_stats(),
+            "db_metrics": mt.get_stats(),
+            "manu_ids": ids.get_stats(),
+            "password_pool": pw.get_stats(),
+            "security_log": dl.get_stats(),
 
         }
 
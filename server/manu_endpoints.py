@@ -5,6 +5,9 @@ import data.manuscripts as manu
 import data.manus.query as query
 import data.db_connect as dbc
 import data.people as ppl
+import data.query_budget as qb
+import server.paging as pgn
+import server.streaming as strm
 import werkzeug.exceptions as wz
 
 # Create a namespace instead of a Flask app
@@ -25,6 +28,8 @@ MANU_ACTION_FLDS = api.model('ManuscriptAction', {
     manu.CURR_STATE: fields.String(required=True,
                                    description='Current state'),
     manu.ACTION: fields.String(required=True, description='Action to perform'),
+    manu.VERSION: fields.Integer(required=False,
+                                 description='Version the client last saw'),
     'referee': fields.String(required=False,
                              description='Referee email for referee stuff'),
     'referee_data': fields.Nested(REFEREE_FIELDS, required=False,
@@ -44,14 +49,24 @@ REFEREE_DATA = 'referee_data'
 class GetManuscripts(Resource):
     """fetch all manuscripts"""
 
+    @api.param(strm.STREAM, 'Stream the manuscripts as they are read')
+    @api.param(pgn.LIMIT, 'Page size: return one page by manu_id')
+    @api.param(pgn.CURSOR, 'The next_cursor from the previous page')
+    @qb.budget(1)
     def get(self):
         """fetch the manuscripts"""
+        if pgn.wants_page():
+            return pgn.get_page(manu.read_page)
+        if strm.wants_stream():
+            return strm.stream_list(
+                manu.iter_manuscripts(batch_size=strm.STREAM_BATCH_SIZE))
         return manu.read()
 
 
 @api.route('/<author>')
 class GetManuscriptsByAuthor(Resource):
     """fetch manuscripts by author"""
+    @qb.budget(1)
     def get(self, author):
         """
         Fetch manuscripts by author.
@@ -70,6 +85,7 @@ class ReceiveAction(Resource):
     """
     @api.response(HTTPStatus.OK, 'Success')
     @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable')
+    @api.response(HTTPStatus.CONFLICT, 'Manuscript changed since read')
     @api.expect(MANU_ACTION_FLDS)
     def put(self):
         """
@@ -80,6 +96,7 @@ class ReceiveAction(Resource):
             manu_id = data.get(manu.MANU_ID)
             curr_state = data.get(manu.CURR_STATE)
             action = data.get(manu.ACTION)
+            version = data.get(manu.VERSION)
 
             # Build kwargs based on the action
             kwargs = {}
@@ -89,11 +106,14 @@ class ReceiveAction(Resource):
                     raise ValueError("Referee email required for referee")
                 kwargs['ref'] = ref
                 kwargs['extra'] = data.get(REFEREE_DATA)
-            ret = manu.handle_action(manu_id, curr_state, action, **kwargs)
+            ret = manu.handle_action(manu_id, curr_state, action,
+                                     version=version, **kwargs)
             return {
                 MESSAGE: 'Action received!',
                 RETURN: ret,
             }
+        except manu.StaleStateError as err:
+            raise wz.Conflict(f'Stale action: {str(err)}')
         except Exception as err:
             raise wz.NotAcceptable(f'Bad action: {str(err)}')
 
@@ -104,6 +124,40 @@ MANU_CREATE_FLDS = api.model('CreateManuscript', {
 })
 
 
+REFEREE_REPORT_FLDS = api.model('RefereeReport', {
+    manu.MANU_ID: fields.String(required=True, description='Manuscript ID'),
+    REFEREE: fields.String(required=True, description='Referee email'),
+    'report': fields.String(required=False, description='Referee report'),
+    'verdict': fields.String(required=False, description='Referee verdict'),
+})
+
+
+@api.route('/referee_report')
+class RefereeReport(Resource):
+    """
+    Record a referee's report and verdict on a manuscript.
+    """
+    @api.response(HTTPStatus.OK, 'Success')
+    @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable')
+    @api.expect(REFEREE_REPORT_FLDS)
+    def put(self):
+        """
+        Record a referee's report and verdict on a manuscript.
+        """
+        try:
+            data = request.json
+            ret = manu.set_referee_report(data.get(manu.MANU_ID),
+                                          data.get(REFEREE),
+                                          report=data.get('report'),
+                                          verdict=data.get('verdict'))
+            return {
+                MESSAGE: 'Report recorded!',
+                RETURN: ret,
+            }
+        except Exception as err:
+            raise wz.NotAcceptable(f'Bad report: {str(err)}')
+
+
 @api.route('/delete/<string:_id>')
 class DeleteManuscript(Resource):
     """
@@ -237,8 +291,12 @@ class ManuscriptValidStates(Resource):
 
 @api.route('/sorted')
 class ManuscriptSorted(Resource):
+    @api.param(pgn.LIMIT, 'Page size: return one page of the sort')
+    @api.param(pgn.CURSOR, 'The next_cursor from the previous page')
     def get(self):
         """Return all manuscripts sorted by their state in the workflow."""
+        if pgn.wants_page():
+            return pgn.get_page(manu.read_sorted_page)
         sorted_manuscripts = manu.sort_manuscripts_by_state()
 
         # Convert MongoDB ObjectIDs to strings for JSON serialization
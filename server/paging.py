@@ -0,0 +1,42 @@
+"""
+Request and response helpers for endpoints that serve keyset pages
+(see data/paging.py). Paging is on when the client passes a `cursor`
+or a `limit`.
+"""
+from flask import request
+import werkzeug.exceptions as wz
+
+CURSOR = 'cursor'
+LIMIT = 'limit'
+ITEMS = 'items'
+NEXT_CURSOR = 'next_cursor'
+
+
+def wants_page() -> bool:
+    return CURSOR in request.args or LIMIT in request.args
+
+
+def page_args() -> tuple:
+    """
+    Returns (cursor, limit) from the query string.
+    """
+    limit = request.args.get(LIMIT)
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise wz.BadRequest(f'Bad page limit: {limit}')
+    return request.args.get(CURSOR) or None, limit
+
+
+def get_page(read_page_fn) -> dict:
+    """
+    Call a data module's read_page-style function with the request's
+    paging arguments and wrap its result for the response.
+    """
+    cursor, limit = page_args()
+    try:
+        items, next_cursor = read_page_fn(cursor=cursor, limit=limit)
+    except ValueError as err:
+        raise wz.BadRequest(str(err))
+    return {ITEMS: items, NEXT_CURSOR: next_cursor}
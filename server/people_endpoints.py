@@ -3,14 +3,23 @@ from flask import request
 from flask_restx import Resource, Namespace, fields
 import data.people as ppl
 import data.masthead as mh
+import data.query_budget as qb
+import server.paging as pgn
+import security.passwords as pw
+import security.tokens as tok
+import server.streaming as strm
 import werkzeug.exceptions as wz
 
+# seconds a client should wait after a 503 from a busy hashing pool
+BUSY_RETRY_AFTER = 1
+
 # Create a namespace instead of a Flask app
 api = Namespace('people', description='People operations')
 MESSAGE = 'Message'
 RETURN = 'Return'
 PEOPLE_EP = '/people'
 REF_EP = '/people/referees'
+TOKEN = 'token'
 
 
 PEOPLE_CREATE_FLDS = api.model('AddNewPeopleEntry', {
@@ -28,10 +37,19 @@ class People(Resource):
     This class handles creating, reading, updating
     and deleting journal people.
     """
+    @api.param(strm.STREAM, 'Stream the people as they are read')
+    @api.param(pgn.LIMIT, 'Page size: return one page of people by email')
+    @api.param(pgn.CURSOR, 'The next_cursor from the previous page')
+    @qb.budget(1)
     def get(self):
         """
         Retrieve the journal people.
         """
+        if pgn.wants_page():
+            return pgn.get_page(ppl.read_page)
+        if strm.wants_stream():
+            return strm.stream_dict(
+                ppl.iter_people(batch_size=strm.STREAM_BATCH_SIZE))
         return ppl.read()
 
 
@@ -42,6 +60,7 @@ class Referees(Resource):
     Returns:
         list: List of referee emails
     """
+    @qb.budget(1)
     def get(self):
         """
         Get a list of referees from the database.
@@ -114,6 +133,7 @@ class PersonCreate(Resource):
     """
     @api.response(HTTPStatus.OK, 'Success.')
     @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable.')
+    @api.response(HTTPStatus.SERVICE_UNAVAILABLE, 'Too busy; retry.')
     @api.expect(PEOPLE_CREATE_FLDS)
     def post(self):
         """
@@ -141,6 +161,9 @@ class PersonCreate(Resource):
                         MESSAGE: 'Person added!',
                         RETURN: ret,
                     }
+        except pw.PoolBusy as err:
+            raise wz.ServiceUnavailable(str(err),
+                                        retry_after=BUSY_RETRY_AFTER)
         except Exception as err:
             raise wz.NotAcceptable(f'Could not add person: '
                                    f'{err=}')
@@ -172,6 +195,7 @@ class PersonLogin(Resource):
     """
     @api.response(HTTPStatus.OK, 'Success.')
     @api.response(HTTPStatus.UNAUTHORIZED, 'Invalid credentials.')
+    @api.response(HTTPStatus.SERVICE_UNAVAILABLE, 'Too busy; retry.')
     @api.expect(AUTH_FLDS)
     def post(self):
         """
@@ -192,18 +216,45 @@ class PersonLogin(Resource):
                     RETURN: {
                         'email': person.get(ppl.EMAIL),
                         'name': person.get(ppl.NAME),
-                        'roles': person.get(ppl.ROLES, [])
+                        'roles': person.get(ppl.ROLES, []),
+                        TOKEN: tok.issue(person.get(ppl.EMAIL)),
                     }
                 }
             else:
                 raise wz.Unauthorized('Invalid email or password')
 
+        except pw.PoolBusy as err:
+            raise wz.ServiceUnavailable(str(err),
+                                        retry_after=BUSY_RETRY_AFTER)
         except Exception as err:
             if isinstance(err, wz.Unauthorized):
                 raise
             raise wz.NotAcceptable(f'Authentication failed: {err=}')
 
 
+LOGOUT_FLDS = api.model('Logout', {
+    TOKEN: fields.String(required=True),
+})
+
+
+@api.route('/logout')
+class PersonLogout(Resource):
+    """
+    This class ends a login session.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not a session token.')
+    @api.expect(LOGOUT_FLDS)
+    def post(self):
+        """
+        Revoke the session token from /people/login.
+        """
+        token = (request.json or {}).get(TOKEN)
+        if not token or not tok.revoke(token):
+            raise wz.NotAcceptable('Not a session token')
+        return {MESSAGE: 'Logged out'}
+
+
 MASTHEAD = 'Masthead'
 
 
@@ -212,6 +263,7 @@ class Masthead(Resource):
     """
     Get a journal's masthead.
     """
+    @qb.budget(1)
     def get(self):
         """
         Get a journal's masthead.
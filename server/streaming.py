@@ -0,0 +1,64 @@
+"""
+Helpers for endpoints that stream big JSON results: documents are
+encoded and sent as they come off the DB cursor, rather than building
+the whole response in memory first.
+"""
+import json
+
+from flask import Response, request, stream_with_context
+
+STREAM = 'stream'
+TRUE_VALS = ('1', 'true', 'yes')
+JSON_MIME = 'application/json'
+
+# docs per cursor batch while streaming
+STREAM_BATCH_SIZE = 200
+
+
+def wants_stream() -> bool:
+    """
+    Did the client ask for a streamed response (`?stream=1`)?
+    """
+    return request.args.get(STREAM, '').lower() in TRUE_VALS
+
+
+def _encode(obj) -> str:
+    return json.dumps(obj, default=str)
+
+
+def _list_chunks(items):
+    yield '['
+    first = True
+    for item in items:
+        if not first:
+            yield ','
+        first = False
+        yield _encode(item)
+    yield ']'
+
+
+def _dict_chunks(pairs):
+    yield '{'
+    first = True
+    for key, val in pairs:
+        if not first:
+            yield ','
+        first = False
+        yield f'{_encode(str(key))}:{_encode(val)}'
+    yield '}'
+
+
+def stream_list(items) -> Response:
+    """
+    Stream an iterable as a JSON array.
+    """
+    return Response(stream_with_context(_list_chunks(items)),
+                    mimetype=JSON_MIME)
+
+
+def stream_dict(pairs) -> Response:
+    """
+    Stream an iterable of (key, value) pairs as a JSON object.
+    """
+    return Response(stream_with_context(_dict_chunks(pairs)),
+                    mimetype=JSON_MIME)
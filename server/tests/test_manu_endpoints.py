@@ -1,8 +1,9 @@
 import os
 import sys
 import pytest
-from unittest.mock import patch
-from http.client import NOT_FOUND, OK
+from unittest.mock import MagicMock, patch
+from http.client import (BAD_REQUEST, CONFLICT, NOT_ACCEPTABLE, NOT_FOUND,
+                         OK)
 
 # Add the parent directory to the path so we can import the modules
 sys.path.insert(
@@ -10,6 +11,8 @@ sys.path.insert(
 )
 
 import endpoints as ep  # noqa: E402
+import data.manuscripts as manu  # noqa: E402
+import data.paging as pg  # noqa: E402
 
 # Constants for endpoints
 MANU_EP = '/manuscripts'
@@ -63,6 +66,43 @@ def test_get_manuscripts():
             assert "curr_state" in manuscript
 
 
+def test_get_manuscripts_streamed():
+    fake_manuscripts = [
+        {"manu_id": "manu123", "title": "Test Manuscript"},
+        {"manu_id": "manu456", "title": "Another Manuscript"},
+    ]
+    with patch('data.manuscripts.iter_manuscripts',
+               return_value=iter(fake_manuscripts)):
+        resp = TEST_CLIENT.get(f'{MANU_EP}/?stream=true')
+        assert resp.status_code == OK
+        assert resp.is_streamed
+        assert resp.get_json() == fake_manuscripts
+
+
+def test_get_manuscripts_sorted_page():
+    page = [{"manu_id": "manu123", "curr_state": "PUB"}]
+    with patch('data.manuscripts.read_sorted_page',
+               return_value=(page, "next")) as mock_page:
+        resp = TEST_CLIENT.get(f'{MANU_EP}/sorted?limit=1&cursor=abc')
+        assert resp.status_code == OK
+        resp_json = resp.get_json()
+        assert resp_json["items"] == page
+        assert resp_json["next_cursor"] == "next"
+        mock_page.assert_called_once_with(cursor="abc", limit=1)
+
+
+def test_get_manuscripts_bad_cursor():
+    resp = TEST_CLIENT.get(f'{MANU_EP}/?cursor=not-a-cursor')
+    assert resp.status_code == BAD_REQUEST
+
+
+@pytest.mark.parametrize("key_vals", [[], [99, "manu123"], ["0", "x"]])
+def test_get_manuscripts_sorted_crafted_cursor(key_vals):
+    cursor = pg.encode_cursor(key_vals)
+    resp = TEST_CLIENT.get(f'{MANU_EP}/sorted?cursor={cursor}')
+    assert resp.status_code == BAD_REQUEST
+
+
 def test_get_manuscripts_by_author():
     author = "testuser@nyu.edu"
     author_manuscripts = {
@@ -135,6 +175,28 @@ def test_create_manuscript(valid_manuscript_data):
         )
 
 
+def test_create_manuscript_reads_author_once(valid_manuscript_data):
+    """
+    exists(), read_one() and update()'s own exists() check on the author
+    should share a single trip to the DB.
+    """
+    person = {
+        "name": "Test User",
+        "email": valid_manuscript_data['author'],
+        "roles": ["ED"],
+        "affiliation": "Test University"
+    }
+    mock_client = MagicMock()
+    people = mock_client['gamesDB']['people']
+    people.find = MagicMock(return_value=[person])
+    with patch('data.manuscripts.create_manuscript', return_value="id"), \
+         patch('data.db_connect.client', mock_client):
+        resp = TEST_CLIENT.put(f'{MANU_EP}/create', json=valid_manuscript_data)
+        assert resp.status_code == OK
+    people.find.assert_called_once()
+    people.update_one.assert_called_once()
+
+
 def test_delete_manuscript(existing_manuscript_id):
     with patch('data.manuscripts.delete_manuscript', return_value=1):
         resp = TEST_CLIENT.delete(f'{MANU_EP}/delete/{existing_manuscript_id}')
@@ -165,6 +227,35 @@ def test_receive_action():
         assert "new_state" in resp_json[RETURN]
 
 
+def test_receive_action_stale():
+    action_data = {
+        "manu_id": "manu123",
+        "curr_state": "SUB",
+        "action": "REJ",
+        "version": 3,
+    }
+    with patch('data.manuscripts.handle_action',
+               side_effect=manu.StaleStateError('moved on')) as handle:
+        resp = TEST_CLIENT.put(f'{MANU_EP}/receive_action', json=action_data)
+    assert resp.status_code == CONFLICT
+    assert handle.call_args.kwargs['version'] == 3
+
+
+def test_referee_report():
+    report = {"manu_id": "manu123", "referee": "r@nyu.edu",
+              "report": "Fine.", "verdict": "ACCEPT"}
+    with patch('data.manuscripts.set_referee_report',
+               return_value=True) as set_report:
+        resp = TEST_CLIENT.put(f'{MANU_EP}/referee_report', json=report)
+    assert resp.status_code == OK
+    set_report.assert_called_once_with("manu123", "r@nyu.edu",
+                                       report="Fine.", verdict="ACCEPT")
+    with patch('data.manuscripts.set_referee_report',
+               side_effect=ValueError('not a referee')):
+        resp = TEST_CLIENT.put(f'{MANU_EP}/referee_report', json=report)
+    assert resp.status_code == NOT_ACCEPTABLE
+
+
 def test_state_transitions():
     fake_transitions = {
         "SUBMITTED": ["SEND_TO_REVIEW", "REJECT"],
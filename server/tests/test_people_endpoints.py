@@ -1,8 +1,8 @@
 import os
 import sys
 import pytest
-from unittest.mock import patch
-from http.client import NOT_ACCEPTABLE, NOT_FOUND, OK
+from unittest.mock import MagicMock, patch
+from http.client import NOT_ACCEPTABLE, NOT_FOUND, OK, SERVICE_UNAVAILABLE
 
 # Add the parent directory to the path so we can import the modules
 sys.path.insert(
@@ -10,6 +10,11 @@ sys.path.insert(
 )
 
 import endpoints as ep  # noqa: E402
+import data.db_connect as dbc  # noqa: E402
+import data.query_budget as qb  # noqa: E402
+import data.query_cache as qc  # noqa: E402
+import security.passwords as pw  # noqa: E402
+import security.security as sec  # noqa: E402
 
 # Constants for endpoints
 PEOPLE_EP = '/people'
@@ -81,6 +86,18 @@ def test_get_people(mock_read):
         assert "email" in person
 
 
+def test_get_people_streamed():
+    fake_people = [
+        ("a@nyu.edu", {"name": "A", "email": "a@nyu.edu"}),
+        ("b@nyu.edu", {"name": "B", "email": "b@nyu.edu"}),
+    ]
+    with patch('data.people.iter_people', return_value=iter(fake_people)):
+        resp = TEST_CLIENT.get(f'{PEOPLE_EP}/?stream=1')
+        assert resp.status_code == OK
+        assert resp.is_streamed
+        assert resp.get_json() == dict(fake_people)
+
+
 def test_create_person(valid_person_data):
     with patch('data.people.create', return_value=valid_person_data):
         resp = TEST_CLIENT.post(f'{PEOPLE_EP}/create',
@@ -153,3 +170,45 @@ def test_get_masthead():
     assert resp.status_code == OK, f"Expected {OK}, got {resp.status_code}"
     assert "Masthead" in resp_json
     assert isinstance(resp_json["Masthead"], list)
+
+
+@patch('data.db_connect.client', new_callable=MagicMock)
+def test_get_masthead_query_count(mock_client):
+    """
+    The masthead is built from a single people query.
+    """
+    dbc.client = mock_client
+    qc.clear()
+    with qb.track() as calls:
+        resp = TEST_CLIENT.get(f'{PEOPLE_EP}/masthead')
+    assert resp.status_code == OK
+    assert calls.total == 1
+
+
+def test_login_busy():
+    with patch('data.people.authenticate',
+               side_effect=pw.PoolBusy('busy')):
+        resp = TEST_CLIENT.post(f'{PEOPLE_EP}/login',
+                                json={'email': 'a@nyu.edu',
+                                      'password': 'pw'})
+    assert resp.status_code == SERVICE_UNAVAILABLE
+    assert resp.headers['Retry-After'] == '1'
+
+
+def test_login_token():
+    person = {'email': 'a@nyu.edu', 'name': 'A', 'roles': ['AU']}
+    with patch('data.people.authenticate', return_value=person):
+        resp = TEST_CLIENT.post(f'{PEOPLE_EP}/login',
+                                json={'email': 'a@nyu.edu',
+                                      'password': 'pw'})
+    assert resp.status_code == OK
+    token = resp.get_json()[RETURN]['token']
+    with patch('data.people.read_one') as read_one:
+        assert sec.check_login('a@nyu.edu', login_key=token)
+        assert not sec.check_login('b@nyu.edu', login_key=token)
+    read_one.assert_not_called()
+    resp = TEST_CLIENT.post(f'{PEOPLE_EP}/logout', json={'token': token})
+    assert resp.status_code == OK
+    assert not sec.check_login('a@nyu.edu', login_key=token)
+    resp = TEST_CLIENT.post(f'{PEOPLE_EP}/logout', json={'token': 'junk'})
+    assert resp.status_code == NOT_ACCEPTABLE
@@ -54,7 +54,7 @@ def test_del_text():
             mock_delete.assert_called_once_with(text_key)
 
     # Second call: text not found
-    with patch('data.text.read_one', return_value=None):
+    with patch('data.text.dbc.delete', return_value=0):
         double_delete_resp = TEST_CLIENT.delete(f'{TEXT_EP}/{text_key}')
         assert double_delete_resp.status_code == NOT_FOUND
 